@@ -100,23 +100,154 @@ WSGI_APPLICATION = "backend.wsgi.application"
 
 
 USE_REDIS = os.getenv("USE_REDIS", "false").lower() == "true"
+# With USE_REDIS, publish each group message to Redis once and let every
+# worker fan it out to its own sockets in memory (see todo/layers.py), so
+# Redis traffic scales with processes instead of sockets.
+TODO_WS_RELAY = env.bool("TODO_WS_RELAY", default=False)
+
+# Redis servers for the channel layer, comma-separated. Groups (todo_<id>)
+# are spread across them by consistent hash, so adding a server moves only
+# about 1/N of the lists. Validated at startup by TodoConfig.ready.
+CHANNEL_REDIS_HOSTS = env.list("CHANNEL_REDIS_HOSTS", default=["redis://127.0.0.1:6379/0"])
+# Connections per server in each worker's pool.
+CHANNEL_REDIS_POOL_SIZE = env.int("CHANNEL_REDIS_POOL_SIZE", default=100)
+# Messages queued per channel before sends to it fail, seconds an undelivered
+# message lives, and seconds a group membership lives without renewal.
+CHANNEL_LAYER_CAPACITY = env.int("CHANNEL_LAYER_CAPACITY", default=100)
+CHANNEL_LAYER_EXPIRY = env.int("CHANNEL_LAYER_EXPIRY", default=60)
+CHANNEL_LAYER_GROUP_EXPIRY = env.int("CHANNEL_LAYER_GROUP_EXPIRY", default=86400)
+
+CHANNEL_LAYER_LIMITS = {
+    "capacity": CHANNEL_LAYER_CAPACITY,
+    "expiry": CHANNEL_LAYER_EXPIRY,
+    "group_expiry": CHANNEL_LAYER_GROUP_EXPIRY,
+}
 
-if USE_REDIS:
+if USE_REDIS and TODO_WS_RELAY:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "todo.layers.RelayChannelLayer",
+            "CONFIG": {
+                "bus": "todo.layers.ShardedRedisBus",
+                "bus_options": {"urls": CHANNEL_REDIS_HOSTS, "max_connections": CHANNEL_REDIS_POOL_SIZE},
+                **CHANNEL_LAYER_LIMITS,
+            },
+        }
+    }
+elif USE_REDIS:
     CHANNEL_LAYERS = {
         "default": {
-            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "BACKEND": "todo.layers.ShardedRedisChannelLayer",
             "CONFIG": {
-                "hosts": [("127.0.0.1", 6379)],
+                "hosts": [
+                    {"address": url, "max_connections": CHANNEL_REDIS_POOL_SIZE} for url in CHANNEL_REDIS_HOSTS
+                ],
+                **CHANNEL_LAYER_LIMITS,
             },
         }
     }
 else:
+    # Single process only: sockets in other workers never see its groups.
     CHANNEL_LAYERS = {
         "default": {
             "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": CHANNEL_LAYER_LIMITS,
         }
     }
 
+# Outbound WebSocket events arriving within this window are coalesced into
+# a single "batch" frame per connection (0 sends every event immediately).
+TODO_WS_BATCH_WINDOW_MS = env.int("TODO_WS_BATCH_WINDOW_MS", default=25)
+TODO_WS_BATCH_MAX_EVENTS = env.int("TODO_WS_BATCH_MAX_EVENTS", default=100)
+# Frames one socket may have sent without the client acknowledging them
+# (see todo.consumers) before its overflow policy applies: "coalesce" holds
+# further events back, collapsed to the latest state per item (beyond
+# TODO_WS_MAX_PENDING items it falls back to "resync"); "resync" drops them
+# and sends a {"type": "resync"} marker; "close" closes the socket with
+# code 4008.
+TODO_WS_OUTBOX_SIZE = env.int("TODO_WS_OUTBOX_SIZE", default=64)
+TODO_WS_OVERFLOW_POLICY = env.str("TODO_WS_OVERFLOW_POLICY", default="coalesce")
+TODO_WS_MAX_PENDING = env.int("TODO_WS_MAX_PENDING", default=1000)
+# Also pre-encode every event as msgpack for sockets that negotiate the
+# "todo.msgpack" subprotocol. Off by default: the bundled frontend speaks JSON,
+# and the second encoding would travel through the channel layer regardless.
+TODO_WS_MSGPACK = env.bool("TODO_WS_MSGPACK", default=False)
+# Recent events kept per list so reconnecting sockets can resume with ?since=<seq>.
+TODO_WS_REPLAY_SIZE = env.int("TODO_WS_REPLAY_SIZE", default=200)
+TODO_WS_REPLAY_TTL = env.int("TODO_WS_REPLAY_TTL", default=3600)
+# Most lists one multiplexed socket (ws/todo/) may subscribe to at once.
+TODO_WS_MAX_SUBSCRIPTIONS = env.int("TODO_WS_MAX_SUBSCRIPTIONS", default=100)
+# Every socket gets a {"type": "ping"} frame this often (in seconds; 0 turns
+# heartbeats off) and is closed with code 4408 once nothing, pong or
+# otherwise, has arrived from it for TODO_WS_IDLE_TIMEOUT seconds.
+TODO_WS_PING_INTERVAL = env.float("TODO_WS_PING_INTERVAL", default=30)
+TODO_WS_IDLE_TIMEOUT = env.float("TODO_WS_IDLE_TIMEOUT", default=75)
+# Most records per second logged for each WebSocket event (connect, reject...).
+TODO_WS_LOG_RATE = env.int("TODO_WS_LOG_RATE", default=10)
+
+# Connection events are logged at INFO; set TODO_LOG_LEVEL=INFO to see them.
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "todo": {"handlers": ["console"], "level": env.str("TODO_LOG_LEVEL", default="WARNING")},
+    },
+}
+
+# Delta sync: how long deletions stay visible to /api/items/?since= clients,
+# and how far (in seconds) each returned cursor overlaps the request.
+TODO_TOMBSTONE_RETENTION_DAYS = env.int("TODO_TOMBSTONE_RETENTION_DAYS", default=30)
+TODO_DELTA_CURSOR_OVERLAP = env.int("TODO_DELTA_CURSOR_OVERLAP", default=2)
+
+# Upper bound on create + update + delete entries in one /api/items/bulk/ call.
+TODO_BULK_MAX_OPERATIONS = env.int("TODO_BULK_MAX_OPERATIONS", default=1000)
+
+# Most items one /api/search/?q= response returns.
+TODO_SEARCH_LIMIT = env.int("TODO_SEARCH_LIMIT", default=50)
+
+# Largest ?preview=N accepted on /api/lists/ (open items nested per list).
+TODO_LIST_PREVIEW_MAX = env.int("TODO_LIST_PREVIEW_MAX", default=20)
+
+# Per-process cache of WebSocket token -> user, so reconnects skip the
+# database. Entries never outlive their token.
+TODO_WS_USER_CACHE_SIZE = env.int("TODO_WS_USER_CACHE_SIZE", default=10000)
+TODO_WS_USER_CACHE_TTL = env.int("TODO_WS_USER_CACHE_TTL", default=300)
+
+# Shared cache for permissions, WebSocket replay buffers and API responses.
+# Per-process memory by default; set CACHE_URL (e.g. redis://127.0.0.1:6379/1)
+# to share it between workers.
+CACHE_URL = env("CACHE_URL", default="")
+
+if CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "todo.cache_backends.CountingLocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": env.int("CACHE_MAX_ENTRIES", default=10000)},
+        }
+    }
+
+# Seconds a resolved (user, list) permission stays cached (0 disables).
+# Share and ownership changes invalidate it in the cache they reach, so it
+# is only on by default when CACHE_URL gives every worker the same cache;
+# with per-process caches a revocation could go unseen by other workers.
+TODO_PERMISSION_CACHE_TTL = env.int("TODO_PERMISSION_CACHE_TTL", default=300 if CACHE_URL else 0)
+
+# Seconds a rendered list/share/permission response stays cached (0 disables).
+# Writes bump per-user and per-list versions, so entries never go stale.
+TODO_RESPONSE_CACHE_TTL = env.int("TODO_RESPONSE_CACHE_TTL", default=300)
+
+# Serve list, list-detail and list-permission GETs from async views (see
+# todo/async_views.py). Only pays off under an ASGI server.
+TODO_ASYNC_VIEWS = env.bool("TODO_ASYNC_VIEWS", default=False)
+
 
 
 # Database
@@ -0,0 +1,159 @@
+"""Single source of truth for what a user may do with a todo list.
+
+``list_permission`` resolves a (user, list) pair to one of OWNER, EDIT, VIEW
+or NONE with a single query, memoizes it on the request and caches it across
+requests. Cached answers are keyed by a per-list version that is bumped
+whenever the list's shares or ownership change (see todo.signals).
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Q, Subquery
+from .models import TodoList, SharedTodoList
+
+OWNER = 'owner'
+EDIT = 'edit'
+VIEW = 'view'
+NONE = 'none'
+
+CAN_EDIT = {OWNER, EDIT}
+CAN_VIEW = {OWNER, EDIT, VIEW}
+
+
+def version_key(list_id):
+    return f"todo:perm:version:{list_id}"
+
+
+def permission_key(list_id, user_id, version):
+    return f"todo:perm:{list_id}:{user_id}:{version}"
+
+
+def invalidate(list_id):
+    """Drop every cached permission for the list."""
+    try:
+        cache.incr(version_key(list_id))
+    except ValueError:
+        # Start from the clock, not 1: if the version key was evicted, a
+        # restart at 1 could land on the version stale answers are under.
+        cache.set(version_key(list_id), time.time_ns(), None)
+
+
+def accessible_lists(user):
+    """Lists the user owns or that have been shared with them."""
+    return TodoList.objects.filter(Q(owner=user) | Q(shared_with__user=user))
+
+
+def with_shared(queryset, user_id):
+    """Annotate lists with ``user_id``'s share permission, if any."""
+    return queryset.annotate(shared=Subquery(
+        SharedTodoList.objects.filter(todo_list=OuterRef('pk'), user_id=user_id).values('permission')[:1]
+    ))
+
+
+def permission_query(user_id, list_id):
+    return with_shared(TodoList.objects.filter(pk=list_id), user_id).values_list('owner_id', 'shared')
+
+
+def permission_from_row(user_id, row):
+    if row is None:
+        return NONE
+    owner_id, shared = row
+    if owner_id == user_id:
+        return OWNER
+    return shared or NONE
+
+
+def fetch_permission(user_id, list_id):
+    return permission_from_row(user_id, permission_query(user_id, list_id).first())
+
+
+async def afetch_permission(user_id, list_id):
+    return permission_from_row(user_id, await permission_query(user_id, list_id).afirst())
+
+
+def resolve(user_id, list_id):
+    if not settings.TODO_PERMISSION_CACHE_TTL:
+        return fetch_permission(user_id, list_id)
+    version = cache.get_or_set(version_key(list_id), time.time_ns, None)
+    key = permission_key(list_id, user_id, version)
+    permission = cache.get(key)
+    if permission is None:
+        permission = fetch_permission(user_id, list_id)
+        cache.set(key, permission, settings.TODO_PERMISSION_CACHE_TTL)
+    return permission
+
+
+async def aresolve(user_id, list_id):
+    if not settings.TODO_PERMISSION_CACHE_TTL:
+        return await afetch_permission(user_id, list_id)
+    version = await cache.aget_or_set(version_key(list_id), time.time_ns, None)
+    key = permission_key(list_id, user_id, version)
+    permission = await cache.aget(key)
+    if permission is None:
+        permission = await afetch_permission(user_id, list_id)
+        await cache.aset(key, permission, settings.TODO_PERMISSION_CACHE_TTL)
+    return permission
+
+
+async def afetch_many(user_id, list_ids):
+    query = with_shared(TodoList.objects.filter(pk__in=list_ids), user_id)
+    rows = {row[0]: row[1:] async for row in query.values_list('pk', 'owner_id', 'shared')}
+    return {list_id: permission_from_row(user_id, rows.get(list_id)) for list_id in list_ids}
+
+
+async def aresolve_many(user_id, list_ids):
+    """``aresolve`` for several lists: a few cache round trips and at most one query."""
+    if not settings.TODO_PERMISSION_CACHE_TTL:
+        return await afetch_many(user_id, list_ids)
+    version_keys = {list_id: version_key(list_id) for list_id in list_ids}
+    versions = await cache.aget_many(version_keys.values())
+    for key in set(version_keys.values()) - versions.keys():
+        await cache.aadd(key, time.time_ns(), None)
+        versions[key] = await cache.aget(key)
+
+    keys = {list_id: permission_key(list_id, user_id, versions[key]) for list_id, key in version_keys.items()}
+    found = await cache.aget_many(keys.values())
+    permissions = {list_id: found[key] for list_id, key in keys.items() if key in found}
+    missing = [list_id for list_id in list_ids if list_id not in permissions]
+    if missing:
+        fetched = await afetch_many(user_id, missing)
+        await cache.aset_many(
+            {keys[list_id]: permission for list_id, permission in fetched.items()},
+            settings.TODO_PERMISSION_CACHE_TTL,
+        )
+        permissions.update(fetched)
+    return permissions
+
+
+def parse_list_id(request, list_id):
+    try:
+        list_id = int(list_id)
+    except (TypeError, ValueError):
+        return None
+    if not request.user.is_authenticated:
+        return None
+    return list_id
+
+
+def list_permission(request, list_id):
+    """The requesting user's permission on ``list_id``, memoized per request."""
+    list_id = parse_list_id(request, list_id)
+    if list_id is None:
+        return NONE
+
+    memo = request.__dict__.setdefault('_todo_permissions', {})
+    if list_id not in memo:
+        memo[list_id] = resolve(request.user.pk, list_id)
+    return memo[list_id]
+
+
+async def alist_permission(request, list_id):
+    """Async ``list_permission``, sharing its cache and per-request memo."""
+    list_id = parse_list_id(request, list_id)
+    if list_id is None:
+        return NONE
+
+    memo = request.__dict__.setdefault('_todo_permissions', {})
+    if list_id not in memo:
+        memo[list_id] = await aresolve(request.user.pk, list_id)
+    return memo[list_id]
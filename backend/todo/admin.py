@@ -11,7 +11,7 @@ class TodoItemInline(admin.TabularInline):
 
 @admin.register(TodoList)
 class TodoListAdmin(admin.ModelAdmin):
-    list_display = ['title', 'owner', 'created', 'updated']
+    list_display = ['title', 'owner', 'item_count', 'completed_count', 'created', 'updated']
     list_filter = ['created', 'updated']
     search_fields = ['title', 'owner__username']
     ordering = ['-created']
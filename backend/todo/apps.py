@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class TodoConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "todo"
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.models.signals import post_migrate
+        from . import checks, signals  # noqa: F401
+        from .layers import check_channel_layers
+        from .search import restore_triggers
+
+        check_channel_layers(settings.CHANNEL_LAYERS)
+        post_migrate.connect(restore_triggers, sender=self)
@@ -0,0 +1,152 @@
+"""Async implementations of the hot read endpoints.
+
+Enabled with ``TODO_ASYNC_VIEWS``; ``todo.urls`` then routes the list,
+list-detail and list-permission URLs here ahead of the DRF router. GETs by
+an authenticated user run on the event loop with the async ORM and async
+cache calls, sharing the sync views' ETags and response cache entries.
+Everything else (writes, pagination, errors, bad credentials) is handed to
+the sync view unchanged, so the URL contract and error bodies stay the same.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.urls import path, re_path
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from . import access, respcache
+from .conditional import arespond, make_etag
+from .middleware import jwt_auth, load_user
+from .models import TodoList
+from .views import TodoListViewSet, TodoListPermissionView, list_state
+
+# Query parameters only the sync views implement.
+SYNC_ONLY_PARAMS = {"page_size", "cursor", "format"}
+
+
+async def authenticate(request):
+    """The JWT bearer's user, or None to let the sync view answer."""
+    header = jwt_auth.get_header(request)
+    raw_token = jwt_auth.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        validated_token = jwt_auth.get_validated_token(raw_token)
+    except (InvalidToken, TokenError):
+        return None
+    # Looked up on every request, as DRF's JWTAuthentication does: the socket
+    # user cache only hears of deactivations saved through User.save() in
+    # this process, not bulk updates or other workers.
+    return await load_user(validated_token.get(api_settings.USER_ID_CLAIM))
+
+
+def render_json(data):
+    # Same bytes as DRF's JSON renderer, so cached entries are interchangeable.
+    response = HttpResponse(JSONRenderer().render(data), content_type="application/json")
+    response.data = data
+    return response
+
+
+def hybrid(sync_view, async_get, name):
+    """Serve authenticated GETs with ``async_get`` and the rest with ``sync_view``.
+
+    ``async_get`` may return None to fall back to the sync view.
+    """
+    sync_view = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        if request.method == "GET" and not SYNC_ONLY_PARAMS & set(request.GET):
+            user = await authenticate(request)
+            if user is not None:
+                request.user = user
+                response = await async_get(request, *args, **kwargs)
+                if response is not None:
+                    return response
+        return await sync_view(request, *args, **kwargs)
+
+    # Like every DRF view: authentication is by token, not cookie.
+    view.csrf_exempt = True
+    view.__name__ = name
+    return view
+
+
+def viewset(request, action, **kwargs):
+    """A TodoListViewSet bound to the request, for its planning helpers."""
+    return TodoListViewSet(request=Request(request), action=action, kwargs=kwargs, format_kwarg=None)
+
+
+async def list_lists(request):
+    view = viewset(request, "list")
+    try:
+        queryset = view.plan(TodoList.objects.filter(owner=request.user))
+    except ValidationError:
+        return None
+
+    async def render():
+        state = await TodoList.objects.filter(owner=request.user).aaggregate(**list_state())
+        etag = make_etag(request.user.pk, request.get_full_path(), *state.values())
+
+        async def serialize():
+            lists = [todo_list async for todo_list in queryset]
+            return render_json(view.get_serializer(lists, many=True).data)
+
+        return await arespond(request, etag, None, serialize)
+
+    return await respcache.acached(request, [(respcache.USER, request.user.pk)], render, render_json)
+
+
+async def retrieve_list(request, pk):
+    permission = await access.alist_permission(request, pk)
+    if permission not in access.CAN_VIEW:
+        return None
+    view = viewset(request, "retrieve", pk=pk)
+    try:
+        queryset = view.plan(TodoList.objects.filter(pk=pk))
+    except ValidationError:
+        return None
+
+    async def render():
+        row = await TodoList.objects.filter(pk=pk).values_list("updated", "sequence").afirst()
+        if row is None:
+            return HttpResponse(status=404)
+        etag = make_etag(request.user.pk, request.get_full_path(), permission, *row)
+
+        async def serialize():
+            return render_json(view.get_serializer(await queryset.aget()).data)
+
+        return await arespond(request, etag, int(row[0].timestamp()), serialize)
+
+    response = await respcache.acached(request, [(respcache.LIST, pk)], render, render_json)
+    return None if response.status_code == 404 else response
+
+
+async def list_permission(request, pk):
+    async def render():
+        permission = await access.alist_permission(request, pk)
+        if permission == access.OWNER:
+            return render_json({'permission': 'edit', 'is_owner': True})
+        if permission != access.NONE:
+            return render_json({'permission': permission, 'is_owner': False})
+        # The sync view tells 404 from 403.
+        return HttpResponse(status=404)
+
+    response = await respcache.acached(request, [(respcache.LIST, pk)], render, render_json)
+    return None if response.status_code == 404 else response
+
+
+urlpatterns = [
+    path("lists/", hybrid(
+        TodoListViewSet.as_view({"get": "list", "post": "create"}), list_lists, "lists_list",
+    ), name="lists-list"),
+    re_path(r"^lists/(?P<pk>[^/.]+)/$", hybrid(
+        TodoListViewSet.as_view({
+            "get": "retrieve", "put": "update", "patch": "partial_update", "delete": "destroy",
+        }),
+        retrieve_list,
+        "lists_detail",
+    ), name="lists-detail"),
+    path("lists/<int:pk>/permission/", hybrid(
+        TodoListPermissionView.as_view(), list_permission, "list_permission",
+    ), name="list-permission"),
+]
@@ -0,0 +1,157 @@
+import json
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .cache_backends import redis_client
+from .models import TodoList
+
+# Clients that offer this subprotocol get msgpack binary frames instead of JSON.
+JSON_SUBPROTOCOL = "todo.json"
+MSGPACK_SUBPROTOCOL = "todo.msgpack"
+
+
+def group_name(list_id):
+    return f"todo_{list_id}"
+
+
+def replay_key(list_id):
+    return f"todo:replay:{list_id}"
+
+
+def encode(payload):
+    """Encode an outbound event once, in every wire format a socket may use."""
+    encoded = {"text": json.dumps(payload, separators=(",", ":"))}
+    if settings.TODO_WS_MSGPACK:
+        encoded["bytes"] = msgpack.packb(payload)
+    return encoded
+
+
+def batch_text(texts, list_id=None):
+    """Wrap already JSON-encoded events in a batch frame without decoding them.
+
+    ``list_id`` tags the batch for multiplexed sockets.
+    """
+    tag = "" if list_id is None else f'"list_id":{json.dumps(list_id)},'
+    return '{"type":"batch",' + tag + '"events":[' + ",".join(texts) + "]}"
+
+
+def batch_bytes(chunks, list_id=None):
+    """Wrap already msgpack-encoded events in a batch frame without decoding them."""
+    packer = msgpack.Packer()
+    tag = [] if list_id is None else [packer.pack("list_id"), packer.pack(list_id)]
+    return b"".join([
+        packer.pack_map_header(2 + bool(tag)),
+        packer.pack("type"),
+        packer.pack("batch"),
+        *tag,
+        packer.pack("events"),
+        packer.pack_array_header(len(chunks)),
+        *chunks,
+    ])
+
+
+def send_to_list(list_id, message):
+    """Send a message to every socket watching the given list."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    # Multiplexed sockets are in many groups and route by list id.
+    async_to_sync(channel_layer.group_send)(group_name(list_id), {**message, "list_id": list_id})
+
+
+def remember(list_id, event):
+    """Append an event to the list's bounded replay buffer.
+
+    Only the JSON text is kept; the rare binary replay re-encodes it.
+    """
+    entry = {"todo_id": event["todo_id"], "seq": event["seq"], "text": event["text"]}
+    size, ttl = settings.TODO_WS_REPLAY_SIZE, settings.TODO_WS_REPLAY_TTL
+    client = redis_client()
+    if client is not None:
+        # Append and trim in place rather than rewriting the whole buffer.
+        key = cache.make_and_validate_key(replay_key(list_id))
+        client.pipeline().rpush(key, json.dumps(entry)).ltrim(key, -size, -1).expire(key, ttl).execute()
+        return
+    entries = cache.get(replay_key(list_id), [])
+    entries.append(entry)
+    cache.set(replay_key(list_id), entries[-size:], ttl)
+
+
+def replay_entries(list_id):
+    client = redis_client()
+    if client is not None:
+        key = cache.make_and_validate_key(replay_key(list_id))
+        return [json.loads(raw) for raw in client.lrange(key, 0, -1)]
+    return cache.get(replay_key(list_id), [])
+
+
+def replay(list_id, since, binary=False):
+    """The buffered events after ``since``, or None if the buffer has a gap."""
+    missed = missed_events(replay_entries(list_id), since)
+    if missed and binary:
+        for event in missed:
+            event["bytes"] = msgpack.packb(json.loads(event["text"]))
+    return missed
+
+
+def missed_events(entries, since):
+    """Return the buffered events after ``since``, or None if any are missing.
+
+    Concurrent writers can drop an entry from the buffer, so the result must
+    run unbroken from ``since + 1``; otherwise the client needs a snapshot.
+    """
+    if not entries or entries[0]["seq"] > since + 1:
+        return None
+    missed = [event for event in entries if event["seq"] > since]
+    for expected, event in enumerate(missed, start=since + 1):
+        if event["seq"] != expected:
+            return None
+    return missed
+
+
+def event_message(todo_id, seq, payload):
+    """Build the group message for a todo event, encoded exactly once."""
+    return {
+        "todo_id": todo_id,
+        "seq": seq,
+        **encode({**payload, "seq": seq}),
+    }
+
+
+def publish(list_id, todo_id, seq, payload):
+    """Encode a todo event once and fan it out to the list's group.
+
+    Consumers forward the pre-encoded frame verbatim, so the cost of encoding
+    does not grow with the number of sockets watching the list.
+    """
+    event = event_message(todo_id, seq, payload)
+    # Buffer before sending so a socket joining in between can still replay it.
+    remember(list_id, event)
+    send_to_list(list_id, {"type": "todo.event", **event})
+
+
+def publish_on_commit(list_id, todo_id, payload):
+    """Allocate the next list sequence now and publish once the write commits.
+
+    ``todo_id`` is None for events that cover several items (bulk changes).
+    """
+    # A single UPDATE ... SET sequence = sequence + 1, so concurrent writers
+    # always get distinct, increasing values.
+    seq = TodoList.next_sequence(list_id)
+    if seq is None:
+        # The list itself is being deleted.
+        return
+    # Only publish once the write is visible to everyone else.
+    transaction.on_commit(lambda: publish(list_id, todo_id, seq, payload))
+
+
+def access_changed_on_commit(list_id, user_id=None):
+    """After commit, make sockets on the list re-check their permission.
+
+    Only ``user_id``'s sockets re-check, or all of them when it is None
+    (the list was deleted).
+    """
+    transaction.on_commit(lambda: send_to_list(list_id, {"type": "todo.access", "user_id": user_id}))
@@ -0,0 +1,126 @@
+"""Set-based item changes that cost a fixed number of queries.
+
+Each operation works on a single list, touches the database with one
+statement per kind of change and publishes one coalesced ``batch`` event
+for the whole change instead of one event per item. Callers must check
+the user's permission on the list and wrap the call in a transaction.
+"""
+from django.db import connection
+from django.utils import timezone
+from .models import TodoList, TodoItem, TodoItemTombstone
+from .serializers import TodoItemSerializer
+from . import broadcast, respcache
+
+
+def apply(todo_list, create=(), update=(), delete=()):
+    """Create, update and delete items of ``todo_list`` in bulk.
+
+    ``create`` holds dicts of item fields, ``update`` dicts with an ``id``
+    plus the fields to change, and ``delete`` item ids. Ids that do not
+    belong to the list are ignored. Returns the created and updated items
+    and the deleted ids.
+    """
+    now = timezone.now()
+
+    created = TodoItem.objects.bulk_create(
+        TodoItem(todo_list=todo_list, **fields) for fields in create
+    )
+
+    changes = {row['id']: row for row in update}
+    updated = list(TodoItem.objects.filter(todo_list=todo_list, pk__in=changes))
+    completed = sum(item.completed for item in created) - sum(item.completed for item in updated)
+    fields = {'updated'}
+    for item in updated:
+        for name, value in changes[item.pk].items():
+            if name != 'id':
+                setattr(item, name, value)
+                fields.add(name)
+        item.updated = now
+    if updated:
+        TodoItem.objects.bulk_update(updated, sorted(fields))
+    completed += sum(item.completed for item in updated)
+
+    deleted, deleted_completed = delete_items(todo_list, delete)
+
+    TodoList.adjust_counts(
+        todo_list.pk, items=len(created) - len(deleted), completed=completed - deleted_completed
+    )
+    publish(todo_list.pk, created, updated, deleted)
+    return created, updated, deleted
+
+
+def complete_all(todo_list):
+    """Mark every open item of the list as completed."""
+    updated = list(TodoItem.objects.filter(todo_list=todo_list, completed=False))
+    if updated:
+        now = timezone.now()
+        TodoItem.objects.filter(pk__in=[item.pk for item in updated]).update(completed=True, updated=now)
+        for item in updated:
+            item.completed = True
+            item.updated = now
+    TodoList.adjust_counts(todo_list.pk, completed=len(updated))
+    publish(todo_list.pk, [], updated, [])
+    return updated
+
+
+def clear_completed(todo_list):
+    """Delete every completed item of the list."""
+    deleted, _ = delete_items(todo_list)
+    TodoList.adjust_counts(todo_list.pk, items=-len(deleted), completed=-len(deleted))
+    publish(todo_list.pk, [], [], deleted)
+    return deleted
+
+
+def delete_items(todo_list, ids=None):
+    """Delete the list's items among ``ids``, or its completed items if None.
+
+    Returns the deleted ids and how many of them were completed.
+    """
+    if ids is None:
+        lookup, condition, values = {'completed': True}, "{completed} = %s", [True]
+    else:
+        ids = list(ids)
+        lookup, condition, values = {'pk__in': ids}, "{pk} IN ({marks})", ids
+    # Locked so the DELETE below, which applies the same predicate, removes
+    # exactly the rows that get tombstones.
+    rows = list(
+        TodoItem.objects.filter(todo_list=todo_list, **lookup)
+        .select_for_update().values_list('pk', 'completed')
+    )
+    if not rows:
+        return [], 0
+    deleted = [pk for pk, _ in rows]
+    TodoItemTombstone.objects.bulk_create(
+        TodoItemTombstone(todo_list=todo_list, item_id=pk) for pk in deleted
+    )
+    # A single DELETE whose size does not depend on how many rows match;
+    # QuerySet.delete() would load every row to send per-item signals, which
+    # would then broadcast one by one.
+    quote, fields = connection.ops.quote_name, TodoItem._meta
+    condition = condition.format(
+        completed=quote(fields.get_field('completed').column),
+        pk=quote(fields.pk.column),
+        marks=', '.join(['%s'] * len(values)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(fields.db_table)}"
+            f" WHERE {quote(fields.get_field('todo_list').column)} = %s AND {condition}",
+            [todo_list.pk, *values],
+        )
+    return deleted, sum(completed for _, completed in rows)
+
+
+def publish(list_id, created, updated, deleted):
+    events = [
+        {"type": "todo_created", "todo": dict(data)}
+        for data in TodoItemSerializer(created, many=True).data
+    ] + [
+        {"type": "todo_updated", "todo": dict(data)}
+        for data in TodoItemSerializer(updated, many=True).data
+    ] + [
+        {"type": "todo_deleted", "todo_id": pk} for pk in deleted
+    ]
+    if events:
+        broadcast.publish_on_commit(list_id, None, {"type": "batch", "events": events})
+        respcache.invalidate_list(list_id)
@@ -0,0 +1,19 @@
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class CountingLocMemCache(LocMemCache):
+    """The stock per-process cache, counting entries culled to make room."""
+
+    evictions = 0
+
+    def _cull(self):
+        before = len(self._cache)
+        super()._cull()
+        type(self).evictions += before - len(self._cache)
+
+
+def redis_client():
+    """The raw client behind django's Redis cache backend, or None for others."""
+    client = getattr(cache, "_cache", None)
+    return client.get_client(write=True) if hasattr(client, "get_client") else None
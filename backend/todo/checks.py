@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+OVERFLOW_POLICIES = {"coalesce", "resync", "close"}
+
+
+@register(Tags.compatibility, deploy=True)
+def check_channel_layer_spans_processes(app_configs, **kwargs):
+    backend = settings.CHANNEL_LAYERS.get("default", {}).get("BACKEND", "")
+    if backend.endswith("InMemoryChannelLayer"):
+        return [Warning(
+            "The channel layer is in-memory, so WebSocket events only reach sockets in the same process.",
+            hint="Set USE_REDIS=true and CHANNEL_REDIS_HOSTS when running more than one worker.",
+            id="todo.W001",
+        )]
+    return []
+
+
+@register(Tags.caches, deploy=True)
+def check_cache_spans_processes(app_configs, **kwargs):
+    if settings.USE_REDIS and not settings.CACHE_URL:
+        return [Warning(
+            "Workers share a Redis channel layer but each has its own cache, so permission and "
+            "response-cache invalidations only reach the worker that made the change.",
+            hint="Set CACHE_URL to a shared cache such as redis://127.0.0.1:6379/1.",
+            id="todo.W002",
+        )]
+    return []
+
+
+@register()
+def check_overflow_policy(app_configs, **kwargs):
+    if settings.TODO_WS_OVERFLOW_POLICY not in OVERFLOW_POLICIES:
+        return [Error(
+            f"TODO_WS_OVERFLOW_POLICY is {settings.TODO_WS_OVERFLOW_POLICY!r}.",
+            hint=f"Use one of: {', '.join(sorted(OVERFLOW_POLICIES))}.",
+            id="todo.E001",
+        )]
+    return []
+
+
+@register()
+def check_heartbeat(app_configs, **kwargs):
+    interval, timeout = settings.TODO_WS_PING_INTERVAL, settings.TODO_WS_IDLE_TIMEOUT
+    if interval and timeout <= interval:
+        return [Error(
+            "TODO_WS_IDLE_TIMEOUT must be longer than TODO_WS_PING_INTERVAL.",
+            hint="Otherwise sockets are closed before they can answer a ping.",
+            id="todo.E002",
+        )]
+    return []
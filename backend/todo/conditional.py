@@ -0,0 +1,74 @@
+"""ETag / Last-Modified support for polling clients.
+
+Viewsets mixing in ``ConditionalGetMixin`` describe the state behind a GET
+with ``conditional_state``, usually one aggregate query (counts, sums of
+change sequences, latest ``updated``). Matching ``If-None-Match`` or
+``If-Modified-Since`` headers are answered with 304 before anything is
+loaded or serialized; other responses carry the validators.
+"""
+import hashlib
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+
+class ConditionalGetMixin:
+    def conditional_state(self, many):
+        """Return ``(etag parts, last-modified datetime or None)``.
+
+        Return None to serve the request unconditionally, e.g. when the
+        object does not exist or the user may not see it, so the regular
+        code path produces the error.
+        """
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(request, True, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(request, False, super().retrieve, *args, **kwargs)
+
+    def conditional(self, request, many, handler, *args, **kwargs):
+        state = self.conditional_state(many)
+        if state is None:
+            return handler(request, *args, **kwargs)
+
+        parts, modified = state
+        # The same URL renders differently per user and per query string.
+        etag = make_etag(request.user.pk, request.get_full_path(), *parts)
+        last_modified = int(modified.timestamp()) if modified else None
+        return respond(request, etag, last_modified, lambda: handler(request, *args, **kwargs))
+
+
+def respond(request, etag, last_modified, render):
+    """304 if the request's validators match, else ``render()`` with them attached."""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render()
+        if response.status_code != 200:
+            return response
+    return add_validators(response, etag, last_modified)
+
+
+async def arespond(request, etag, last_modified, render):
+    """``respond`` for async views; ``render`` is a coroutine function."""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = await render()
+        if response.status_code != 200:
+            return response
+    return add_validators(response, etag, last_modified)
+
+
+def add_validators(response, etag, last_modified):
+    # Lets the response cache store the validators with the data.
+    response.validators = (etag, last_modified)
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    # Browsers must revalidate rather than guess a freshness lifetime.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
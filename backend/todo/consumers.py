@@ -1,81 +1,556 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
+from django.conf import settings
+from urllib.parse import parse_qs
+from collections import Counter, deque
+import asyncio
 import json
+import logging
+import time
+import weakref
+import msgpack
+from . import access, broadcast
+from .models import TodoList, TodoItem
+from .serializers import TodoItemSerializer
+
+logger = logging.getLogger(__name__)
+
+# Close code for sockets whose access to the list was revoked.
+CLOSE_FORBIDDEN = 4403
+# Close code for sockets that fell too far behind under the "close" policy.
+CLOSE_SLOW_CONSUMER = 4008
+# Close code for sockets that answered no ping within TODO_WS_IDLE_TIMEOUT.
+CLOSE_IDLE = 4408
+
+# Open sockets of this process and their overflows, for outbox_stats() and
+# the heartbeat.
+connections = weakref.WeakSet()
+overflows = Counter()
+heartbeat = None
+
+
+class LogThrottle:
+    """Let ``rate`` records per second through for each event; count the rest."""
+
+    def __init__(self):
+        # event -> [window start, records let through, records suppressed]
+        self.windows = {}
+
+    def allow(self, event, rate):
+        """Return (allowed, records suppressed in the previous window)."""
+        now = time.monotonic()
+        window = self.windows.get(event)
+        if window is None or now - window[0] >= 1:
+            self.windows[event] = [now, 1, 0]
+            return True, window[2] if window else 0
+        if window[1] < rate:
+            window[1] += 1
+            return True, 0
+        window[2] += 1
+        return False, 0
+
+
+log_throttle = LogThrottle()
+
+
+def log_event(level, event, **fields):
+    """Log ``event`` as ``key=value`` pairs, also attached as ``record.ws``.
+
+    Connection churn can reach thousands of sockets a second, so each event
+    is capped at TODO_WS_LOG_RATE records a second.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    allowed, suppressed = log_throttle.allow(event, settings.TODO_WS_LOG_RATE)
+    if not allowed:
+        return
+    if suppressed:
+        fields["suppressed"] = suppressed
+    pairs = " ".join(f"{key}={value}" for key, value in fields.items())
+    logger.log(level, "%s %s", event, pairs, extra={"ws": {"event": event, **fields}})
+
+
+def start_heartbeat():
+    global heartbeat
+    loop = asyncio.get_running_loop()
+    if settings.TODO_WS_PING_INTERVAL and (heartbeat is None or heartbeat.done() or heartbeat.get_loop() is not loop):
+        heartbeat = loop.create_task(beat())
+
+
+async def beat():
+    """Ping every open socket each interval and reap the ones gone silent.
+
+    One task per process rather than one timer per socket, which matters
+    for memory when most sockets sit idle.
+    """
+    ping = broadcast.encode({"type": "ping"})
+    while connections:
+        await asyncio.sleep(settings.TODO_WS_PING_INTERVAL)
+        silent_since = time.monotonic() - settings.TODO_WS_IDLE_TIMEOUT
+        for consumer in list(connections):
+            if consumer.last_seen < silent_since:
+                await consumer.reap()
+            elif consumer.depth() < settings.TODO_WS_OUTBOX_SIZE:
+                consumer.push(ping["bytes"] if consumer.binary else ping["text"])
+
+
+def outbox_stats(top=10):
+    """Unacknowledged frames of this process's sockets, deepest first."""
+    sockets = sorted(connections, key=lambda consumer: consumer.depth(), reverse=True)
+    return {
+        "connections": len(sockets),
+        "queued_frames": sum(consumer.depth() for consumer in sockets),
+        "max_depth": sockets[0].depth() if sockets else 0,
+        "overflows": dict(overflows),
+        "deepest": [
+            {
+                "channel": consumer.channel_name,
+                "user_id": consumer.user_id,
+                "depth": consumer.depth(),
+                "high_water": consumer.high_water,
+                "overflows": consumer.overflows,
+            }
+            for consumer in sockets[:top]
+        ],
+    }
+
+
+class ListStream:
+    """Delivery state for one list a socket receives events for."""
+
+    __slots__ = ("list_id", "permission", "pending", "flush_task", "replayed_through", "stale")
+
+    def __init__(self, list_id, permission):
+        self.list_id = list_id
+        self.permission = permission
+        # Outbound events waiting for the next flush, keyed by todo id so
+        # repeated changes to the same item collapse to its latest state.
+        self.pending = {}
+        self.flush_task = None
+        # Highest sequence already covered by a replay or snapshot; live events
+        # at or below it are duplicates.
+        self.replayed_through = 0
+        # Set when events were dropped for a "resync" marker; nothing more is
+        # delivered until the client resumes.
+        self.stale = False
+
+
+class ListEventsConsumer(AsyncWebsocketConsumer):
+    """Batching, replay and access checks shared by the list sockets.
+
+    Subclasses open one ``ListStream`` per list with ``open_stream``; set
+    ``tagged`` to stamp every outbound frame with its list id.
+
+    Frames go through an outbox written by a separate task, so a client
+    that reads slowly never holds up the channel layer. Servers such as
+    Daphne accept every send at once and buffer it themselves, so the bound
+    is on frames the client has not yet acknowledged: clients send
+    ``{"type": "ack", "seq": <last applied>}`` (plus ``list_id`` on the
+    multiplexed socket) and once TODO_WS_OUTBOX_SIZE sequenced frames are
+    unacknowledged, TODO_WS_OVERFLOW_POLICY decides what happens to further
+    events.
+
+    Per-socket state is kept small for idle sockets: the user id, one
+    stream per list, and no outbox or writer task until there is a frame.
+    """
+    tagged = False
+    binary = False
+    outbox = ()
+    # (list id, seq) of every frame carrying a sequence, until acknowledged.
+    inflight = ()
+    writer = None
+    high_water = 0
+    overflows = 0
+
+    def setup(self):
+        # Only the id is kept; the User instance is not needed after connect.
+        user = self.scope.pop("user", None)
+        self.user_id = user.pk if user is not None and user.is_authenticated else None
+        self.streams = {}
+        # Streams holding events back until the outbox has room, in order.
+        self.deferred = {}
+
+    async def accept_encoding(self):
+        # Negotiate the frame encoding once; events arrive pre-encoded in both.
+        subprotocols = self.scope.get("subprotocols", [])
+        self.binary = settings.TODO_WS_MSGPACK and broadcast.MSGPACK_SUBPROTOCOL in subprotocols
+        if self.binary:
+            await self.accept(subprotocol=broadcast.MSGPACK_SUBPROTOCOL)
+        elif broadcast.JSON_SUBPROTOCOL in subprotocols:
+            await self.accept(subprotocol=broadcast.JSON_SUBPROTOCOL)
+        else:
+            await self.accept()
+        self.last_seen = time.monotonic()
+        connections.add(self)
+        start_heartbeat()
+
+    async def websocket_receive(self, message):
+        # Any frame, a pong or otherwise, shows the client is still there.
+        self.last_seen = time.monotonic()
+        await super().websocket_receive(message)
+
+    async def reap(self):
+        connections.discard(self)
+        log_event(logging.INFO, "ws.reap", user_id=self.user_id, idle=round(time.monotonic() - self.last_seen))
+        for list_id in list(self.streams):
+            await self.close_stream(list_id)
+        await self.close(code=CLOSE_IDLE)
+
+    async def open_stream(self, list_id, permission):
+        stream = self.streams[list_id] = ListStream(list_id, permission)
+        await self.channel_layer.group_add(broadcast.group_name(list_id), self.channel_name)
+        return stream
+
+    async def close_stream(self, list_id):
+        stream = self.streams.pop(list_id, None)
+        if stream is None:
+            return
+        if stream.flush_task:
+            stream.flush_task.cancel()
+        self.deferred.pop(list_id, None)
+        await self.channel_layer.group_discard(broadcast.group_name(list_id), self.channel_name)
+
+    async def disconnect(self, close_code):
+        for list_id in list(getattr(self, "streams", ())):
+            await self.close_stream(list_id)
+        if self.writer:
+            self.writer.cancel()
+        connections.discard(self)
+
+    def stream_for(self, event):
+        return self.streams.get(event["list_id"])
+
+    async def resume(self, stream, since):
+        """Replay what a reconnecting client missed after ``since``.
+
+        Small gaps are served from the replay buffer; if the buffer no longer
+        covers the gap, the client gets a full snapshot of the list instead.
+        """
+        current = await TodoList.objects.filter(pk=stream.list_id).values_list("sequence", flat=True).afirst()
+        if current is None or since == current:
+            return
+
+        missed = None
+        if since < current:
+            missed = await sync_to_async(broadcast.replay)(stream.list_id, since, self.binary)
+
+        if missed is None:
+            await self.send_snapshot(stream)
+            return
+
+        for event in missed:
+            stream.pending[self.event_key(event)] = event
+        stream.replayed_through = missed[-1]["seq"]
+        await self.flush(stream)
+
+    async def send_snapshot(self, stream):
+        seq, todos = await self.load_snapshot(stream.list_id)
+        stream.replayed_through = seq
+        stream.pending = {}
+        self.push(self.encode_frame({"type": "snapshot", "seq": seq, "todos": todos}, stream.list_id), stream.list_id, seq)
+
+    async def send_frame(self, payload, list_id=None):
+        self.push(self.encode_frame(payload, list_id))
+
+    def encode_frame(self, payload, list_id=None):
+        if self.tagged and list_id is not None:
+            payload = {**payload, "list_id": list_id}
+        encoded = broadcast.encode(payload)
+        return encoded["bytes"] if self.binary else encoded["text"]
+
+    def depth(self):
+        return max(len(self.outbox), len(self.inflight))
+
+    def push(self, frame, list_id=None, seq=None):
+        """Queue ``frame``; one carrying ``seq`` counts until it is acknowledged."""
+        if self.writer is None:
+            self.outbox = deque()
+            self.writer = asyncio.create_task(self.write())
+        self.outbox.append(frame)
+        if seq is not None:
+            if not self.inflight:
+                self.inflight = deque()
+            self.inflight.append((list_id, seq))
+        self.high_water = max(self.high_water, self.depth())
+
+    async def write(self):
+        # Runs while there are frames to send, then hands the queue back.
+        try:
+            while self.outbox:
+                frame = self.outbox.popleft()
+                if isinstance(frame, bytes):
+                    await self.send(bytes_data=frame)
+                else:
+                    await self.send(text_data=frame)
+                await self.drain()
+        finally:
+            self.writer = None
+            self.outbox = ()
+
+    async def acknowledge(self, list_id, seq):
+        """The client applied ``list_id``'s frames up to ``seq``."""
+        # Frames are applied in order, so this also covers every frame
+        # before the last one it matches, whatever its list.
+        last = None
+        for index, (frame_list, frame_seq) in enumerate(self.inflight):
+            if frame_list == list_id:
+                if frame_seq > seq:
+                    break
+                last = index
+        if last is None:
+            return
+        for _ in range(last + 1):
+            self.inflight.popleft()
+        if not self.inflight:
+            self.inflight = ()
+        await self.drain()
+
+    async def drain(self):
+        # Flush streams held back by a full window once there is room again.
+        if self.deferred and self.depth() < settings.TODO_WS_OUTBOX_SIZE:
+            for stream in list(self.deferred.values()):
+                await self.flush(stream)
+
+    @database_sync_to_async
+    def load_snapshot(self, list_id):
+        seq = TodoList.objects.filter(pk=list_id).values_list("sequence", flat=True).first() or 0
+        items = TodoItemSerializer(TodoItem.objects.filter(todo_list_id=list_id), many=True).data
+        return seq, [dict(item) for item in items]
+
+    async def queue_event(self, stream, key, event):
+        previous = stream.pending.get(key)
+        if previous and previous["seq"] > event["seq"]:
+            # Live delivery can overtake a replayed event; keep the newer state.
+            return
+        # Re-insert rather than overwrite, so the event flushes after
+        # anything queued since the item's previous one.
+        stream.pending.pop(key, None)
+        stream.pending[key] = event
+
+        if stream.list_id in self.deferred:
+            # Held back for a full outbox; the writer flushes it.
+            if len(stream.pending) > settings.TODO_WS_MAX_PENDING:
+                await self.overflow(stream, "resync")
+        elif not settings.TODO_WS_BATCH_WINDOW_MS or len(stream.pending) >= settings.TODO_WS_BATCH_MAX_EVENTS:
+            if stream.flush_task:
+                stream.flush_task.cancel()
+                stream.flush_task = None
+            await self.flush(stream)
+        elif stream.flush_task is None:
+            stream.flush_task = asyncio.create_task(self.flush_later(stream))
+
+    async def flush_later(self, stream):
+        await asyncio.sleep(settings.TODO_WS_BATCH_WINDOW_MS / 1000)
+        stream.flush_task = None
+        await self.flush(stream)
+
+    async def flush(self, stream):
+        if not stream.pending:
+            self.deferred.pop(stream.list_id, None)
+            return
+        if self.depth() >= settings.TODO_WS_OUTBOX_SIZE:
+            await self.overflow(stream, settings.TODO_WS_OVERFLOW_POLICY)
+            return
+        self.deferred.pop(stream.list_id, None)
+        events = list(stream.pending.values())
+        stream.pending = {}
+        seq = max(event["seq"] for event in events)
+        # Tagged sockets always get a batch frame, which carries the list id.
+        list_id = stream.list_id if self.tagged else None
+        if self.binary:
+            if len(events) == 1 and list_id is None:
+                frame = events[0]["bytes"]
+            else:
+                frame = broadcast.batch_bytes([e["bytes"] for e in events], list_id)
+        else:
+            if len(events) == 1 and list_id is None:
+                frame = events[0]["text"]
+            else:
+                frame = broadcast.batch_text([e["text"] for e in events], list_id)
+        self.push(frame, stream.list_id, seq)
+
+    async def overflow(self, stream, policy):
+        """Apply an overflow policy to ``stream`` while the outbox is full."""
+        if policy == "coalesce":
+            # Keep the events pending, collapsed per item, until there is room.
+            if stream.list_id not in self.deferred:
+                self.deferred[stream.list_id] = stream
+                self.count_overflow(policy)
+                log_event(logging.WARNING, "ws.overflow", user_id=self.user_id, list_id=stream.list_id, policy=policy)
+            return
+        self.count_overflow(policy)
+        log_event(logging.WARNING, "ws.overflow", user_id=self.user_id, list_id=stream.list_id, policy=policy)
+        if policy == "resync":
+            self.deferred.pop(stream.list_id, None)
+            stream.pending = {}
+            stream.stale = True
+            # One small frame past the bound; the client resumes from its
+            # last sequence (a replay or snapshot) when it gets it.
+            self.push(self.encode_frame({"type": "resync"}, stream.list_id))
+            return
+        if self.outbox:
+            self.outbox.clear()
+        self.inflight = ()
+        for list_id in list(self.streams):
+            await self.close_stream(list_id)
+        await self.close(code=CLOSE_SLOW_CONSUMER)
+
+    def count_overflow(self, policy):
+        self.overflows += 1
+        overflows[policy] += 1
+
+    async def todo_event(self, event):
+        stream = self.stream_for(event)
+        if stream is None or stream.stale or event["seq"] <= stream.replayed_through:
+            return
+        await self.queue_event(stream, self.event_key(event), event)
+
+    async def todo_access(self, event):
+        """Re-check a permission after a share change; drop the list if it is gone."""
+        stream = self.stream_for(event)
+        if stream is None or event["user_id"] not in (None, self.user_id):
+            return
+        # Straight from the database: the change may have been made in
+        # another process, whose cache invalidation this one never sees.
+        permission = await access.afetch_permission(self.user_id, stream.list_id)
+        if permission not in access.CAN_VIEW:
+            stream.permission = access.NONE
+            await self.revoked(stream)
+        elif permission != stream.permission:
+            stream.permission = permission
+            await self.send_frame({"type": "permission", "permission": permission}, stream.list_id)
+
+    async def revoked(self, stream):
+        """The user lost access to ``stream``'s list; by default the socket goes."""
+        await self.close(code=CLOSE_FORBIDDEN)
+
+    @staticmethod
+    def event_key(event):
+        # Bulk changes cover many items and are never collapsed.
+        if event["todo_id"] is None:
+            return f"seq:{event['seq']}"
+        return event["todo_id"]
+
+
+class TodoConsumer(ListEventsConsumer):
+    """One socket per list: ``ws/todo/<list_id>/``."""
 
-class TodoConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.list_id = self.scope['url_route']['kwargs']['list_id']
-        self.room_group_name = f'todo_{self.list_id}'
+        self.setup()
+        list_id = self.scope['url_route']['kwargs']['list_id']
+        if self.user_id is None:
+            log_event(logging.INFO, "ws.reject", reason="anonymous", list_id=list_id)
+            await self.close()
+            return
 
-        self.user = self.scope['user']
-        print("Connect: user =", self.scope["user"])
-        if self.scope["user"].is_anonymous:
-            print("Anonymous user, closing connection.")
+        # Resolved once here (one query at most, shared with the HTTP
+        # permission cache) and re-checked only when todo.signals says the
+        # user's share changed.
+        permission = access.NONE
+        if list_id.isdigit():
+            list_id = int(list_id)
+            permission = await access.aresolve(self.user_id, list_id)
+        if permission not in access.CAN_VIEW:
+            log_event(logging.INFO, "ws.reject", reason="forbidden", user_id=self.user_id, list_id=list_id)
             await self.close()
             return
 
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        self.stream = await self.open_stream(list_id, permission)
+        await self.accept_encoding()
+        log_event(logging.INFO, "ws.connect", user_id=self.user_id, list_id=list_id, permission=permission)
 
-        await self.accept()
+        since = parse_qs(self.scope.get("query_string", b"").decode()).get("since")
+        if since and since[0].isdigit():
+            await self.resume(self.stream, int(since[0]))
 
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+    def stream_for(self, event):
+        # The socket is in one group only.
+        return self.streams.get(self.stream.list_id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Items are written through the REST API; the only frames that need
+        # handling are acks. Pongs and anything else just count as activity.
+        try:
+            message = json.loads(text_data) if text_data is not None else msgpack.unpackb(bytes_data)
+            if message["type"] != "ack":
+                return
+            seq = int(message["seq"])
+        except (ValueError, TypeError, KeyError, AttributeError, msgpack.UnpackException):
+            return
+        await self.acknowledge(self.stream.list_id, seq)
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        event_type = data.get("type")
 
-        if self.user.is_anonymous:
-            print("Anonymous user, closing connection.")
+class MultiplexTodoConsumer(ListEventsConsumer):
+    """One socket for many lists: ``ws/todo/``.
+
+    Clients send ``{"type": "subscribe", "lists": [ids], "since": {id: seq}}``,
+    ``{"type": "unsubscribe", "lists": [ids]}`` and
+    ``{"type": "ack", "list_id": id, "seq": seq}``; every outbound frame
+    about a list carries its ``list_id``. Losing access to a list ends that
+    subscription only.
+    """
+    tagged = True
+
+    async def connect(self):
+        self.setup()
+        if self.user_id is None:
+            log_event(logging.INFO, "ws.reject", reason="anonymous")
             await self.close()
-            return 
-
-        if event_type == "todo_created":
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "todo.created",
-                    "todo": data["todo"],
-                }
-            )
-        elif event_type == "todo_updated":
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "todo.updated",
-                    "todo": data["todo"],
-                }
-            )
-        elif event_type == "todo_deleted":
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "todo.deleted",
-                    "todo_id": data["todo_id"],
-                }
-            )
-
-
-    async def todo_created(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "todo_created",
-            "todo": event["todo"],
-        }))
-
-    async def todo_updated(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "todo_updated",
-            "todo": event["todo"],
-        }))
-
-    async def todo_deleted(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "todo_deleted",
-            "todo_id": event["todo_id"],
-        }))
+            return
+        await self.accept_encoding()
+        log_event(logging.INFO, "ws.connect", user_id=self.user_id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data) if text_data is not None else msgpack.unpackb(bytes_data)
+            kind = message["type"]
+            list_ids = list(dict.fromkeys(int(list_id) for list_id in message.get("lists", [])))
+            if kind == "ack":
+                ack = int(message["list_id"]), int(message["seq"])
+        except (ValueError, TypeError, KeyError, AttributeError, msgpack.UnpackException):
+            await self.send_frame({"type": "error", "detail": "Malformed message."})
+            return
+
+        if kind == "subscribe":
+            since = message.get("since")
+            await self.subscribe(list_ids, since if isinstance(since, dict) else {})
+        elif kind == "unsubscribe":
+            for list_id in list_ids:
+                await self.close_stream(list_id)
+            await self.send_frame({"type": "unsubscribed", "lists": list_ids})
+        elif kind == "ack":
+            await self.acknowledge(*ack)
+        # Anything else (pongs, item writes echoed by clients) is ignored,
+        # as on the single-list socket.
+
+    async def subscribe(self, list_ids, since):
+        for list_id in list_ids:
+            stream = self.streams.get(list_id)
+            if stream is not None and stream.stale:
+                # Resubscribing after a "resync" marker starts the list afresh.
+                await self.close_stream(list_id)
+        new = [list_id for list_id in list_ids if list_id not in self.streams]
+        room = max(settings.TODO_WS_MAX_SUBSCRIPTIONS - len(self.streams), 0)
+        new, over_limit = new[:room], new[room:]
+        # One permission lookup for the whole request, not one per list.
+        permissions = await access.aresolve_many(self.user_id, new) if new else {}
+
+        granted, rejected = [], [{"list_id": list_id, "reason": "limit"} for list_id in over_limit]
+        for list_id in new:
+            if permissions[list_id] not in access.CAN_VIEW:
+                rejected.append({"list_id": list_id, "reason": "forbidden"})
+                continue
+            await self.open_stream(list_id, permissions[list_id])
+            granted.append({"list_id": list_id, "permission": permissions[list_id]})
+        await self.send_frame({"type": "subscribed", "lists": granted, "rejected": rejected})
+
+        for entry in granted:
+            # JSON object keys are strings; msgpack clients may send ints.
+            seq = since.get(str(entry["list_id"]), since.get(entry["list_id"]))
+            if isinstance(seq, int):
+                await self.resume(self.streams[entry["list_id"]], seq)
+
+    async def revoked(self, stream):
+        await self.close_stream(stream.list_id)
+        await self.send_frame({"type": "unsubscribed", "lists": [stream.list_id], "reason": "forbidden"})
@@ -0,0 +1,71 @@
+"""Check that every query the API issues is served by an index.
+
+Each endpoint in ``todo.perf.ENDPOINTS`` is requested once against seeded
+data with caches cleared, and every SELECT, UPDATE and DELETE it ran is fed
+back through the database's EXPLAIN. PostgreSQL plans with ``enable_seqscan``
+off, so a sequential scan only survives where no index can serve the query;
+SQLite reports those as a bare ``SCAN <table>``.
+"""
+import json
+import re
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from . import perf
+
+EXPLAINED = ("SELECT", "UPDATE", "DELETE")
+SQLITE_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def statements(context):
+    """Map each endpoint to the distinct statements it executed."""
+    client = APIClient()
+    client.force_authenticate(user=context["user"])
+    found = {}
+    for name, method, path, data, budget in perf.ENDPOINTS:
+        cache.clear()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                perf.request(client, method, perf.fill(path, context), perf.fill(data, context))
+            transaction.set_rollback(True)
+        sql = [query["sql"] for query in captured.captured_queries]
+        found[perf.endpoint_key(method, path, data)] = list(dict.fromkeys(
+            statement for statement in sql if statement.lstrip().upper().startswith(EXPLAINED)
+        ))
+    return found
+
+
+def sequential_scans(sql):
+    """Tables the statement reads in full."""
+    tables = set(connection.introspection.table_names())
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            details = [row[-1] for row in cursor.fetchall()]
+        return sorted({match[1] for match in map(SQLITE_SCAN.match, details) if match and match[1] in tables})
+    if connection.vendor == "postgresql":
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return sorted({node["Relation Name"] for node in walk(plan[0]["Plan"]) if node["Node Type"] == "Seq Scan"})
+    raise NotImplementedError(f"EXPLAIN checks are not implemented for {connection.vendor}.")
+
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+def run(context):
+    """Return ``{endpoint: [(sql, [tables scanned]), ...]}`` for offending queries."""
+    report = {}
+    for key, sql in statements(context).items():
+        scans = [(statement, tables) for statement in sql if (tables := sequential_scans(statement))]
+        if scans:
+            report[key] = scans
+    return report
@@ -0,0 +1,314 @@
+"""Channel layer that relays group messages between processes once per group.
+
+Channels, groups and delivery stay in process memory, as in
+``InMemoryChannelLayer``. A ``group_send`` is published once on a bus topic
+for the group; every process with local members of the group subscribes to
+that topic once, decodes each message once and hands it to its own sockets
+in memory. Bus traffic therefore grows with the number of processes, not
+with the number of sockets. Sends to a channel owned by another process go
+over that process's own topic.
+
+The bus is pluggable: ``RedisBus`` uses Redis pub/sub (``ShardedRedisBus``
+across several servers); ``MemoryBus`` stands in for it in tests and
+single-process development.
+
+With several Redis servers, both this layer and ``ShardedRedisChannelLayer``
+pick a server per group with a jump consistent hash, so adding a server
+moves only about 1/N of the groups.
+"""
+import asyncio
+import hashlib
+import random
+import string
+import time
+from urllib.parse import urlparse
+import msgpack
+import redis.asyncio as redis
+from redis import Redis
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+from channels_redis.core import RedisChannelLayer
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+REDIS_SCHEMES = {"redis", "rediss", "unix"}
+
+
+def shard_for(name, shards):
+    """Jump consistent hash (Lamping & Veach) of ``name`` onto ``shards`` buckets."""
+    if shards == 1:
+        return 0
+    key = int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "big")
+    bucket, jump = -1, 0
+    while jump < shards:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    """``channels_redis`` layer that shards by consistent hash.
+
+    The stock layer splits a CRC range evenly between hosts, so adding a
+    host moves about half of the groups and channels to another server.
+    """
+
+    def consistent_hash(self, value):
+        return shard_for(value, self.ring_size)
+
+
+class MemoryBus:
+    """In-process bus; instances with the same ``name`` share one set of topics."""
+
+    hubs = {}
+
+    def __init__(self, name="default"):
+        self.topics = self.hubs.setdefault(name, {})
+        self.published = 0
+
+    async def publish(self, topic, data):
+        self.published += 1
+        for callback in list(self.topics.get(topic, ())):
+            await callback(data)
+
+    async def subscribe(self, topic, callback):
+        self.topics.setdefault(topic, set()).add(callback)
+
+    async def unsubscribe(self, topic, callback):
+        callbacks = self.topics.get(topic, set())
+        callbacks.discard(callback)
+        if not callbacks:
+            self.topics.pop(topic, None)
+
+    async def close(self):
+        pass
+
+
+class RedisBus:
+    """Redis pub/sub bus: one connection and one subscription per topic per process."""
+
+    def __init__(self, url="redis://127.0.0.1:6379/0", max_connections=None):
+        self.url = url
+        self.options = {} if max_connections is None else {"max_connections": max_connections}
+        self.callbacks = {}
+        self.client = None
+        self.sync_client = None
+        self.pubsub = None
+        self.reader = None
+        self.loop = None
+
+    def connect(self):
+        if self.client is None:
+            self.loop = asyncio.get_running_loop()
+            self.client = redis.from_url(self.url, **self.options)
+            self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+
+    async def publish(self, topic, data):
+        if self.client is not None and asyncio.get_running_loop() is self.loop:
+            await self.client.publish(topic, data)
+            return
+        # Sync code (async_to_sync in a worker or management command) runs
+        # on a throwaway loop the shared connection cannot be used from; a
+        # thread-safe sync pool spares it a new connection per publish.
+        if self.sync_client is None:
+            self.sync_client = Redis.from_url(self.url, **self.options)
+        self.sync_client.publish(topic, data)
+
+    async def subscribe(self, topic, callback):
+        self.connect()
+        self.callbacks[topic] = callback
+        await self.pubsub.subscribe(topic)
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.create_task(self.read())
+
+    async def unsubscribe(self, topic, callback):
+        if self.callbacks.pop(topic, None) is not None:
+            await self.pubsub.unsubscribe(topic)
+
+    async def read(self):
+        while self.callbacks:
+            message = await self.pubsub.get_message(timeout=1.0)
+            if message is None:
+                continue
+            callback = self.callbacks.get(message["channel"].decode())
+            if callback is not None:
+                await callback(message["data"])
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+        if self.client is not None:
+            await self.pubsub.aclose()
+            await self.client.aclose()
+        if self.sync_client is not None:
+            self.sync_client.close()
+        self.client = self.sync_client = self.pubsub = self.reader = None
+
+
+class ShardedRedisBus:
+    """Spread topics over several Redis servers by consistent hash."""
+
+    def __init__(self, urls, max_connections=None):
+        self.shards = [RedisBus(url, max_connections) for url in urls]
+
+    def shard(self, topic):
+        return self.shards[shard_for(topic, len(self.shards))]
+
+    async def publish(self, topic, data):
+        await self.shard(topic).publish(topic, data)
+
+    async def subscribe(self, topic, callback):
+        await self.shard(topic).subscribe(topic, callback)
+
+    async def unsubscribe(self, topic, callback):
+        await self.shard(topic).unsubscribe(topic, callback)
+
+    async def close(self):
+        for shard in self.shards:
+            await shard.close()
+
+
+class RelayChannelLayer(InMemoryChannelLayer):
+    """In-memory channel layer whose groups span processes through a bus.
+
+    CONFIG takes ``bus`` (an import path, default ``RedisBus``),
+    ``bus_options`` for its constructor and ``prefix`` for topic names, plus
+    the usual ``InMemoryChannelLayer`` options.
+    """
+
+    def __init__(self, bus="todo.layers.RedisBus", bus_options=None, prefix="todo-relay", **kwargs):
+        super().__init__(**kwargs)
+        self.bus = import_string(bus)(**(bus_options or {})) if isinstance(bus, str) else bus
+        self.prefix = prefix
+        self.process = "".join(random.choice(string.ascii_lowercase) for _ in range(12))
+        self.relayed = {}
+
+    def group_topic(self, group):
+        return f"{self.prefix}:group:{group}"
+
+    def process_topic(self, process):
+        return f"{self.prefix}:process:{process}"
+
+    def owner(self, channel):
+        # Channel names look like "specific.<process>!<random>".
+        return channel.partition("!")[0].rpartition(".")[2]
+
+    async def new_channel(self, prefix="specific."):
+        prefix = prefix.rstrip(".")
+        topic = self.process_topic(self.process)
+        if topic not in self.relayed:
+            self.relayed[topic] = self.receive_direct
+            await self.bus.subscribe(topic, self.receive_direct)
+        return "%s.%s!%s" % (
+            prefix,
+            self.process,
+            "".join(random.choice(string.ascii_letters) for _ in range(12)),
+        )
+
+    async def send(self, channel, message):
+        if "!" in channel and self.owner(channel) != self.process:
+            self.require_valid_channel_name(channel)
+            payload = msgpack.packb({"channel": channel, "message": message}, use_bin_type=True)
+            await self.bus.publish(self.process_topic(self.owner(channel)), payload)
+            return
+        await super().send(channel, message)
+
+    async def receive_direct(self, data):
+        payload = msgpack.unpackb(data, raw=False)
+        try:
+            await super().send(payload["channel"], payload["message"])
+        except ChannelFull:
+            pass
+
+    async def group_add(self, group, channel):
+        await super().group_add(group, channel)
+        topic = self.group_topic(group)
+        if topic not in self.relayed:
+            # The first local member subscribes the process; later ones are free.
+            self.relayed[topic] = callback = self.group_receiver(group)
+            await self.bus.subscribe(topic, callback)
+
+    async def group_discard(self, group, channel):
+        await super().group_discard(group, channel)
+        topic = self.group_topic(group)
+        if group not in self.groups and topic in self.relayed:
+            await self.bus.unsubscribe(topic, self.relayed.pop(topic))
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        await self.bus.publish(self.group_topic(group), msgpack.packb(message, use_bin_type=True))
+
+    def group_receiver(self, group):
+        async def receive(data):
+            self._clean_expired()
+            # Decoded once per process and shared by every local socket, which
+            # only read it; InMemoryChannelLayer would deep-copy it per socket.
+            message = msgpack.unpackb(data, raw=False)
+            expires = time.time() + self.expiry
+            for channel in list(self.groups.get(group, ())):
+                queue = self.channels.setdefault(channel, asyncio.Queue(maxsize=self.get_capacity(channel)))
+                try:
+                    queue.put_nowait((expires, message))
+                except asyncio.QueueFull:
+                    pass
+
+        return receive
+
+    async def flush(self):
+        for topic, callback in list(self.relayed.items()):
+            await self.bus.unsubscribe(topic, callback)
+        self.relayed = {}
+        await super().flush()
+
+    async def close(self):
+        await self.bus.close()
+
+
+def layer_hosts(config):
+    """Redis URLs a CHANNEL_LAYERS entry connects to."""
+    options = config.get("CONFIG", {})
+    if "bus_options" in options:
+        bus_options = options["bus_options"]
+        return list(bus_options.get("urls", [bus_options["url"]] if "url" in bus_options else []))
+    hosts = []
+    for host in options.get("hosts", []):
+        if isinstance(host, dict):
+            hosts.append(host.get("address", f"redis://{host.get('host')}:{host.get('port', 6379)}"))
+        elif isinstance(host, (list, tuple)):
+            hosts.append(f"redis://{host[0]}:{host[1]}")
+        else:
+            hosts.append(host)
+    return hosts
+
+
+def check_channel_layers(layers):
+    """Raise ImproperlyConfigured for channel layer settings that cannot work.
+
+    Run once at startup (see TodoConfig.ready) so a bad CHANNEL_REDIS_HOSTS or
+    limit fails the deploy instead of the first WebSocket.
+    """
+    for alias, config in layers.items():
+        options = config.get("CONFIG", {})
+        for name in ("capacity", "expiry", "group_expiry"):
+            if name in options and (not isinstance(options[name], int) or options[name] <= 0):
+                raise ImproperlyConfigured(f"CHANNEL_LAYERS[{alias!r}]: {name} must be a positive integer.")
+        if options.get("group_expiry", 86400) < options.get("expiry", 60):
+            raise ImproperlyConfigured(f"CHANNEL_LAYERS[{alias!r}]: group_expiry must not be shorter than expiry.")
+        if "InMemory" in config["BACKEND"]:
+            continue
+
+        hosts = layer_hosts(config)
+        if not hosts:
+            raise ImproperlyConfigured(f"CHANNEL_LAYERS[{alias!r}]: no Redis hosts configured.")
+        for host in hosts:
+            if urlparse(host).scheme not in REDIS_SCHEMES:
+                raise ImproperlyConfigured(f"CHANNEL_LAYERS[{alias!r}]: {host!r} is not a redis:// URL.")
+        if len(set(hosts)) != len(hosts):
+            # Two shards on one server would hash groups to the same place twice.
+            raise ImproperlyConfigured(f"CHANNEL_LAYERS[{alias!r}]: Redis hosts are listed more than once.")
+        pools = [host.get("max_connections") for host in options.get("hosts", []) if isinstance(host, dict)]
+        pools.append(options.get("bus_options", {}).get("max_connections"))
+        if any(pool is not None and (not isinstance(pool, int) or pool <= 0) for pool in pools):
+            raise ImproperlyConfigured(f"CHANNEL_LAYERS[{alias!r}]: pool size must be a positive integer.")
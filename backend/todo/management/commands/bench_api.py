@@ -0,0 +1,47 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from todo import perf
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed realistic data, hit every API route and check per-endpoint query "
+        "ceilings. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lists", type=int, default=200, help="Lists owned by the benchmark user.")
+        parser.add_argument("--items", type=int, default=2000, help="Items in the hot list.")
+        parser.add_argument("--shares", type=int, default=200, help="Users the hot list is shared with.")
+        parser.add_argument("--repeat", type=int, default=20, help="Requests per endpoint.")
+        parser.add_argument(
+            "--response-cache", action="store_true", help="Serve repeated reads from the response cache."
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+        parser.add_argument("--baseline", help="Previous JSON report to compare against.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            context = perf.seed(lists=options["lists"], items=options["items"], shares=options["shares"])
+            report = perf.run(context, repeat=options["repeat"], response_cache=options["response_cache"])
+            transaction.set_rollback(True)
+
+        baseline = {}
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+
+        for key, row in report.items():
+            line = f"{key:<60} {row['queries']:>3}/{row['budget']:<3} q  p50 {row['p50_ms']:>8.2f} ms  p95 {row['p95_ms']:>8.2f} ms"
+            if key in baseline:
+                line += f"  (p95 {row['p95_ms'] - baseline[key]['p95_ms']:+.2f} ms, {row['queries'] - baseline[key]['queries']:+d} q)"
+            self.stdout.write(line)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+        failures = perf.over_budget(report)
+        if failures:
+            raise CommandError(f"Query budget exceeded: {', '.join(failures)}")
@@ -0,0 +1,45 @@
+import json
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.contrib.auth import get_user_model
+from todo import wsload
+from todo.models import TodoList
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many idle in-process WebSockets and report resident memory per "
+        "connection, to size how many idle sockets one worker can hold. "
+        "Seeded data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=5000)
+        parser.add_argument("--lists", type=int, default=100)
+        parser.add_argument("--trace", action="store_true", help="Add a tracemalloc breakdown by file.")
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        memory_layer = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+        with transaction.atomic(), override_settings(CHANNEL_LAYERS=memory_layer):
+            user = User.objects.create(email="idle@example.com", first_name="Idle", last_name="Load", is_active=True)
+            lists = TodoList.objects.bulk_create(
+                TodoList(owner=user, title=f"Idle {n}") for n in range(options["lists"])
+            )
+            report = async_to_sync(wsload.idle)(
+                user,
+                [todo_list.pk for todo_list in lists],
+                clients=options["clients"],
+                trace=options["trace"],
+            )
+            transaction.set_rollback(True)
+
+        report["projected_rss_for_50k"] = report["rss_per_connection"] * 50_000
+        self.stdout.write(json.dumps(report, indent=2))
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
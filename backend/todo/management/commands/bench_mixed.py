@@ -0,0 +1,65 @@
+import asyncio
+import json
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from todo import mixedload, perf
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run HTTP readers against the list endpoints alongside WebSocket fan-out, "
+        "once with the sync views and once with the async views, and report "
+        "throughput and latency for both. Requests run in their own threads as "
+        "under a real ASGI server, so seeded data is committed and deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--http-clients", type=int, default=10)
+        parser.add_argument("--ws-clients", type=int, default=100)
+        parser.add_argument("--lists", type=int, default=10)
+        parser.add_argument("--rate", type=float, default=100, help="WebSocket events per second.")
+        parser.add_argument("--duration", type=float, default=5)
+        parser.add_argument("--views", choices=["sync", "async", "both"], default="both")
+        parser.add_argument(
+            "--response-cache",
+            action="store_true",
+            help="Keep the response cache on; by default it is off so every request renders.",
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        modes = {"sync": [False], "async": [True], "both": [False, True]}[options["views"]]
+        overrides = {"CHANNEL_LAYERS": {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}}
+        if not options["response_cache"]:
+            overrides["TODO_RESPONSE_CACHE_TTL"] = 0
+
+        with override_settings(**overrides):
+            with transaction.atomic():
+                context = perf.seed(lists=options["lists"], items=200, shares=20)
+            user = context["user"]
+            list_ids = list(user.owned_lists.order_by("pk").values_list("pk", flat=True)[: options["lists"]])
+            try:
+                reports = [
+                    asyncio.run(mixedload.run(
+                        user,
+                        list_ids,
+                        use_async,
+                        http_clients=options["http_clients"],
+                        ws_clients=options["ws_clients"],
+                        rate=options["rate"],
+                        duration=options["duration"],
+                    ))
+                    for use_async in modes
+                ]
+            finally:
+                # perf.seed's users, and with them every list, item and share.
+                User.objects.filter(email__regex=r"^bench\d*@example\.com$").delete()
+
+        self.stdout.write(json.dumps(reports, indent=2))
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(reports, f, indent=2, sort_keys=True)
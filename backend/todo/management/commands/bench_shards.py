@@ -0,0 +1,99 @@
+import json
+from collections import Counter
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from todo import broadcast, wsload
+from todo.layers import check_channel_layers, shard_for
+from todo.models import TodoList
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the same WebSocket load against one Redis shard and against N shards "
+        "and report throughput, fan-out latency and how the list groups spread "
+        "across the shards. Seeded data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hosts",
+            default=",".join(settings.CHANNEL_REDIS_HOSTS),
+            help="Comma-separated Redis URLs; the first one alone is the single-shard run.",
+        )
+        parser.add_argument("--clients", type=int, default=500)
+        parser.add_argument("--lists", type=int, default=50)
+        parser.add_argument("--rate", type=float, default=500, help="Events per second across all lists.")
+        parser.add_argument("--duration", type=float, default=10)
+        parser.add_argument("--relay", action="store_true", help="Use todo.layers.RelayChannelLayer.")
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+
+    def layers(self, hosts, relay):
+        limits = {
+            "capacity": settings.CHANNEL_LAYER_CAPACITY,
+            "expiry": settings.CHANNEL_LAYER_EXPIRY,
+            "group_expiry": settings.CHANNEL_LAYER_GROUP_EXPIRY,
+        }
+        if relay:
+            config = {
+                "BACKEND": "todo.layers.RelayChannelLayer",
+                "CONFIG": {
+                    "bus": "todo.layers.ShardedRedisBus",
+                    "bus_options": {"urls": hosts, "max_connections": settings.CHANNEL_REDIS_POOL_SIZE},
+                    **limits,
+                },
+            }
+        else:
+            config = {
+                "BACKEND": "todo.layers.ShardedRedisChannelLayer",
+                "CONFIG": {
+                    "hosts": [{"address": url, "max_connections": settings.CHANNEL_REDIS_POOL_SIZE} for url in hosts],
+                    **limits,
+                },
+            }
+        layers = {"default": config}
+        check_channel_layers(layers)
+        return layers
+
+    def handle(self, *args, **options):
+        hosts = [host.strip() for host in options["hosts"].split(",") if host.strip()]
+        if len(hosts) < 2:
+            raise CommandError("Pass at least two Redis URLs with --hosts to compare against one shard.")
+
+        reports = []
+        with transaction.atomic():
+            user = User.objects.create(email="shards@example.com", first_name="Shard", last_name="Load", is_active=True)
+            lists = TodoList.objects.bulk_create(
+                TodoList(owner=user, title=f"Shard {n}") for n in range(options["lists"])
+            )
+            list_ids = [todo_list.pk for todo_list in lists]
+            for shard_hosts in [hosts[:1], hosts]:
+                with override_settings(CHANNEL_LAYERS=self.layers(shard_hosts, options["relay"])):
+                    report = async_to_sync(wsload.run)(
+                        user,
+                        list_ids,
+                        clients=options["clients"],
+                        rate=options["rate"],
+                        duration=options["duration"],
+                    )
+                    # The relay shards its pub/sub topic, the plain layer the group name.
+                    layer = get_channel_layer()
+                    keys = [broadcast.group_name(list_id) for list_id in list_ids]
+                    if options["relay"]:
+                        keys = [layer.group_topic(key) for key in keys]
+                spread = Counter(shard_for(key, len(shard_hosts)) for key in keys)
+                report["shards"] = len(shard_hosts)
+                report["groups_per_shard"] = [spread[n] for n in range(len(shard_hosts))]
+                reports.append(report)
+            transaction.set_rollback(True)
+
+        self.stdout.write(json.dumps(reports, indent=2))
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(reports, f, indent=2, sort_keys=True)
@@ -0,0 +1,75 @@
+import json
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.contrib.auth import get_user_model
+from todo import wsload
+from todo.models import TodoList
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many in-process WebSockets across several lists, publish events at "
+        "a fixed rate and report connect time, fan-out latency, throughput and "
+        "memory per connection. Seeded data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=500)
+        parser.add_argument("--lists", type=int, default=10)
+        parser.add_argument("--rate", type=float, default=200, help="Events per second across all lists.")
+        parser.add_argument("--duration", type=float, default=10)
+        parser.add_argument("--batch-window", type=int, help="Override TODO_WS_BATCH_WINDOW_MS.")
+        parser.add_argument(
+            "--layer",
+            choices=["memory", "redis", "relay", "settings"],
+            default="memory",
+            help=(
+                "Channel layer to test; 'relay' is todo.layers.RelayChannelLayer over Redis "
+                "pub/sub, 'settings' uses CHANNEL_LAYERS as configured."
+            ),
+        )
+        parser.add_argument("--redis-url", default="redis://127.0.0.1:6379")
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+
+    def layer_settings(self, options):
+        overrides = {}
+        if options["layer"] == "memory":
+            overrides["CHANNEL_LAYERS"] = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+        elif options["layer"] == "redis":
+            overrides["CHANNEL_LAYERS"] = {"default": {
+                "BACKEND": "channels_redis.core.RedisChannelLayer",
+                "CONFIG": {"hosts": [options["redis_url"]]},
+            }}
+        elif options["layer"] == "relay":
+            overrides["CHANNEL_LAYERS"] = {"default": {
+                "BACKEND": "todo.layers.RelayChannelLayer",
+                "CONFIG": {"bus_options": {"url": options["redis_url"]}},
+            }}
+        if options["batch_window"] is not None:
+            overrides["TODO_WS_BATCH_WINDOW_MS"] = options["batch_window"]
+        return overrides
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), override_settings(**self.layer_settings(options)):
+            user = User.objects.create(email="wsload@example.com", first_name="Load", last_name="Test", is_active=True)
+            lists = TodoList.objects.bulk_create(
+                TodoList(owner=user, title=f"Load {n}") for n in range(options["lists"])
+            )
+            report = async_to_sync(wsload.run)(
+                user,
+                [todo_list.pk for todo_list in lists],
+                clients=options["clients"],
+                rate=options["rate"],
+                duration=options["duration"],
+            )
+            transaction.set_rollback(True)
+
+        report["layer"] = options["layer"]
+        self.stdout.write(json.dumps(report, indent=2))
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
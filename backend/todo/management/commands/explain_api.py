@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from todo import explain, perf
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed realistic data, EXPLAIN every query the API routes issue and fail "
+        "if any of them scans a whole table. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lists", type=int, default=200, help="Lists owned by the benchmark user.")
+        parser.add_argument("--items", type=int, default=2000, help="Items in the hot list.")
+        parser.add_argument("--shares", type=int, default=200, help="Users the hot list is shared with.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            context = perf.seed(lists=options["lists"], items=options["items"], shares=options["shares"])
+            report = explain.run(context)
+            transaction.set_rollback(True)
+
+        for key, scans in report.items():
+            for sql, tables in scans:
+                self.stdout.write(f"{key}: scans {', '.join(tables)}\n    {sql}")
+
+        if report:
+            raise CommandError(f"Sequential scans in: {', '.join(report)}")
+        self.stdout.write("No sequential scans.")
@@ -0,0 +1,22 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from todo.models import TodoItemTombstone
+
+
+class Command(BaseCommand):
+    help = "Delete item tombstones older than the delta-sync retention window."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.TODO_TOMBSTONE_RETENTION_DAYS,
+            help="Keep tombstones newer than this many days.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        deleted, _ = TodoItemTombstone.objects.filter(deleted__lt=cutoff).delete()
+        self.stdout.write(f"Deleted {deleted} tombstones older than {cutoff:%Y-%m-%d %H:%M}.")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from todo.models import TodoList
+
+
+class Command(BaseCommand):
+    help = "Recompute every list's item_count and completed_count from its items."
+
+    def add_arguments(self, parser):
+        parser.add_argument("lists", nargs="*", type=int, help="Only recount these list ids.")
+
+    def handle(self, *args, **options):
+        queryset = TodoList.objects.all()
+        if options["lists"]:
+            queryset = queryset.filter(pk__in=options["lists"])
+        updated = TodoList.recount(queryset)
+        self.stdout.write(f"Recounted {updated} lists.")
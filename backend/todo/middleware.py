@@ -1,21 +1,93 @@
+import time
+from collections import OrderedDict
 from urllib.parse import parse_qs
 from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
-from rest_framework_simplejwt.tokens import UntypedToken
+from django.conf import settings
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth.models import AnonymousUser
 
+jwt_auth = JWTAuthentication()
+
+# Only what the WebSocket consumers read; anything else stays deferred.
+USER_FIELDS = ("id", "is_active")
+
+
+class UserCache:
+    """Bounded LRU of token id -> user, each entry expiring with its token."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.by_user = {}
+
+    def get(self, jti):
+        entry = self.entries.get(jti)
+        if entry is None:
+            return None
+        user, expires = entry
+        if expires <= time.time():
+            self.discard(jti)
+            return None
+        self.entries.move_to_end(jti)
+        return user
+
+    def set(self, jti, user, token_exp):
+        self.discard(jti)
+        self.entries[jti] = (user, min(time.time() + self.ttl, token_exp))
+        self.by_user.setdefault(user.pk, set()).add(jti)
+        while len(self.entries) > self.max_size:
+            self.discard(next(iter(self.entries)))
+
+    def discard(self, jti):
+        entry = self.entries.pop(jti, None)
+        if entry is not None:
+            tokens = self.by_user.get(entry[0].pk)
+            if tokens is not None:
+                tokens.discard(jti)
+                if not tokens:
+                    del self.by_user[entry[0].pk]
+
+    def evict_user(self, user_id):
+        for jti in list(self.by_user.get(user_id, ())):
+            self.discard(jti)
+
+    def clear(self):
+        self.entries.clear()
+        self.by_user.clear()
+
+
+user_cache = UserCache(settings.TODO_WS_USER_CACHE_SIZE, settings.TODO_WS_USER_CACHE_TTL)
+
+
 @database_sync_to_async
-def get_user(validated_token):
+def load_user(user_id):
     from django.contrib.auth import get_user_model
     User = get_user_model()
 
     try:
-        jwt_auth = JWTAuthentication()
-        user = jwt_auth.get_user(validated_token)
+        user = User.objects.only(*USER_FIELDS).get(**{api_settings.USER_ID_FIELD: user_id})
+    except User.DoesNotExist:
+        return None
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        return None
+    return user
+
+
+async def get_user(validated_token):
+    jti = validated_token.get(api_settings.JTI_CLAIM)
+    user = user_cache.get(jti) if jti else None
+    if user is not None:
         return user
-    except Exception:
+
+    user = await load_user(validated_token.get(api_settings.USER_ID_CLAIM))
+    if user is None:
         return AnonymousUser()
+    if jti:
+        user_cache.set(jti, user, validated_token["exp"])
+    return user
 
 class JWTAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
@@ -24,7 +96,7 @@ class JWTAuthMiddleware(BaseMiddleware):
 
         if token:
             try:
-                validated_token = JWTAuthentication().get_validated_token(token[0])
+                validated_token = jwt_auth.get_validated_token(token[0])
                 scope["user"] = await get_user(validated_token)
             except Exception:
                 scope["user"] = AnonymousUser()
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("todo", "0004_todolist_updated"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="todolist",
+            name="sequence",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-17 20:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("todo", "0005_todolist_sequence"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TodoItemTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("item_id", models.BigIntegerField()),
+                ("deleted", models.DateTimeField(auto_now_add=True)),
+                (
+                    "todo_list",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tombstones",
+                        to="todo.todolist",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-17 20:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("todo", "0006_todoitemtombstone"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="sharedtodolist",
+            index=models.Index(
+                fields=["user", "todo_list"], name="todo_share_user_list"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="todoitem",
+            index=models.Index(
+                fields=["todo_list", "updated", "id"], name="todo_item_list_updated"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="todoitem",
+            index=models.Index(
+                fields=["todo_list", "completed"], name="todo_item_list_completed"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="todoitem",
+            index=models.Index(
+                condition=models.Q(("completed", False)),
+                fields=["todo_list", "updated"],
+                name="todo_item_list_open",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="todoitemtombstone",
+            index=models.Index(
+                fields=["todo_list", "deleted"], name="todo_tombstone_list_deleted"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="todolist",
+            index=models.Index(
+                fields=["owner", "updated", "id"], name="todo_list_owner_updated"
+            ),
+        ),
+    ]
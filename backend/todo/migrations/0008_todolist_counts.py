@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-17 21:01
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_counts(apps, schema_editor):
+    TodoList = apps.get_model("todo", "TodoList")
+    TodoItem = apps.get_model("todo", "TodoItem")
+    items = TodoItem.objects.filter(todo_list=models.OuterRef("pk")).order_by().values("todo_list")
+    TodoList.objects.update(
+        item_count=Coalesce(models.Subquery(items.annotate(n=models.Count("pk")).values("n")), 0),
+        completed_count=Coalesce(
+            models.Subquery(items.filter(completed=True).annotate(n=models.Count("pk")).values("n")), 0
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("todo", "0007_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="todolist",
+            name="completed_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="todolist",
+            name="item_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
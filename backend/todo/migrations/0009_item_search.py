@@ -0,0 +1,70 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+SEARCH_INDEX = GinIndex(SearchVector("body", config="simple"), name="todo_item_body_search")
+
+# Contentless FTS5 index over each item's body and a token for its list
+# ("l<list id>"), so a search can be narrowed to the user's lists inside
+# FTS5 rather than after it. The triggers keep it current on every write;
+# an edit that changes neither body nor list does not touch it. SQLite
+# drops the triggers if a later migration rebuilds todo_todoitem;
+# todo.search.restore_triggers puts them back after migrate.
+SQLITE_CREATE = [
+    """CREATE VIRTUAL TABLE todo_item_fts USING fts5(
+        body, list, content='', columnsize=0, detail=column, prefix='2 3'
+    )""",
+    """CREATE TRIGGER todo_item_fts_insert AFTER INSERT ON todo_todoitem BEGIN
+        INSERT INTO todo_item_fts(rowid, body, list) VALUES (new.id, new.body, 'l' || new.todo_list_id);
+    END""",
+    """CREATE TRIGGER todo_item_fts_delete AFTER DELETE ON todo_todoitem BEGIN
+        INSERT INTO todo_item_fts(todo_item_fts, rowid, body, list)
+        VALUES ('delete', old.id, old.body, 'l' || old.todo_list_id);
+    END""",
+    """CREATE TRIGGER todo_item_fts_update AFTER UPDATE OF body, todo_list_id ON todo_todoitem BEGIN
+        INSERT INTO todo_item_fts(todo_item_fts, rowid, body, list)
+        VALUES ('delete', old.id, old.body, 'l' || old.todo_list_id);
+        INSERT INTO todo_item_fts(rowid, body, list) VALUES (new.id, new.body, 'l' || new.todo_list_id);
+    END""",
+    "INSERT INTO todo_item_fts(rowid, body, list) SELECT id, body, 'l' || todo_list_id FROM todo_todoitem",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS todo_item_fts_insert",
+    "DROP TRIGGER IF EXISTS todo_item_fts_delete",
+    "DROP TRIGGER IF EXISTS todo_item_fts_update",
+    "DROP TABLE IF EXISTS todo_item_fts",
+]
+
+
+def has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any(row[0] == "ENABLE_FTS5" for row in cursor.fetchall())
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.add_index(apps.get_model("todo", "TodoItem"), SEARCH_INDEX)
+    elif vendor == "sqlite" and has_fts5(schema_editor.connection):
+        for statement in SQLITE_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.remove_index(apps.get_model("todo", "TodoItem"), SEARCH_INDEX)
+    elif vendor == "sqlite":
+        for statement in SQLITE_DROP:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("todo", "0008_todolist_counts"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
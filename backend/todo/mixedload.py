@@ -0,0 +1,75 @@
+"""Mixed HTTP + WebSocket load against the sync or async read views.
+
+HTTP workers loop over the list, list-detail and list-permission GETs
+through Django's ASGI handler while ``wsload`` drives socket fan-out on the
+same event loop, so both kinds of traffic compete for the loop and the
+sync-to-async threads the way they do under a real ASGI server. Each
+request gets its own thread-sensitive context, as in production, so the
+data must be committed before the run.
+"""
+import asyncio
+import time
+from channels.testing import HttpCommunicator
+from django.core.handlers.asgi import ASGIHandler
+from django.test.utils import override_settings
+from django.urls import include, path
+from rest_framework_simplejwt.tokens import AccessToken
+from . import async_views, urls, wsload
+
+
+def urlconf(use_async):
+    """A root URLconf serving ``/api/`` with or without the async views."""
+    patterns = [pattern for pattern in urls.urlpatterns if pattern not in async_views.urlpatterns]
+    if use_async:
+        patterns = async_views.urlpatterns + patterns
+
+    class URLConf:
+        urlpatterns = [path("api/", include(patterns))]
+
+    return URLConf
+
+
+async def http_worker(application, headers, paths, latencies, errors, stop):
+    n = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        communicator = HttpCommunicator(application, "GET", paths[n % len(paths)], headers=headers)
+        response = await communicator.get_response()
+        await communicator.wait()
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response["status"] != 200:
+            errors.append(response["status"])
+        n += 1
+
+
+async def run(user, list_ids, use_async, http_clients=10, ws_clients=100, rate=100, duration=5.0):
+    """Run HTTP workers for as long as one ``wsload`` scenario; return both reports."""
+    application = ASGIHandler()
+    headers = [(b"authorization", f"Bearer {AccessToken.for_user(user)}".encode())]
+    paths = ["/api/lists/"]
+    for list_id in list_ids:
+        paths += [f"/api/lists/{list_id}/", f"/api/lists/{list_id}/permission/"]
+
+    with override_settings(ROOT_URLCONF=urlconf(use_async)):
+        latencies, errors, stop = [], [], asyncio.Event()
+        workers = [
+            asyncio.create_task(http_worker(application, headers, paths, latencies, errors, stop))
+            for _ in range(http_clients)
+        ]
+        started = time.perf_counter()
+        ws_report = await wsload.run(user, list_ids, clients=ws_clients, rate=rate, duration=duration)
+        stop.set()
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "views": "async" if use_async else "sync",
+        "http": {
+            "clients": http_clients,
+            "requests": len(latencies),
+            "errors": len(errors),
+            "requests_per_sec": round(len(latencies) / elapsed, 1),
+            "latency_ms": wsload.summarize(latencies),
+        },
+        "ws": ws_report,
+    }
@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models.functions import Coalesce, Greatest
 from django.conf import settings
+from django.utils import timezone
 
 class TodoList(models.Model):
     owner = models.ForeignKey(
@@ -10,10 +12,54 @@ class TodoList(models.Model):
     title = models.CharField(max_length=100)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True) 
+    # Bumped on every item change so real-time clients can resume a stream.
+    sequence = models.PositiveBigIntegerField(default=0)
+    # Denormalized item totals, kept current by todo.signals and todo.bulk.
+    item_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Owner's lists in keyset-pagination order.
+            models.Index(fields=["owner", "updated", "id"], name="todo_list_owner_updated"),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def next_sequence(cls, list_id):
+        """Atomically bump and return the list's change sequence.
+
+        Also touches ``updated``, so the list counts as modified whenever
+        one of its items changes.
+        """
+        cls.objects.filter(pk=list_id).update(sequence=models.F("sequence") + 1, updated=timezone.now())
+        return cls.objects.filter(pk=list_id).values_list("sequence", flat=True).first()
+
+    @classmethod
+    def adjust_counts(cls, list_id, items=0, completed=0):
+        """Shift the list's item counters in one atomic UPDATE."""
+        if items or completed:
+            # Clamped so a drifted counter can't fail the write; run the
+            # recount_items command to repair it.
+            cls.objects.filter(pk=list_id).update(
+                item_count=Greatest(models.F("item_count") + items, 0),
+                completed_count=Greatest(models.F("completed_count") + completed, 0),
+            )
+
+    @classmethod
+    def recount(cls, queryset=None):
+        """Recompute the item counters from scratch; returns the rows updated."""
+        items = TodoItem.objects.filter(todo_list=models.OuterRef("pk")).order_by().values("todo_list")
+        total = items.annotate(n=models.Count("pk")).values("n")
+        done = items.filter(completed=True).annotate(n=models.Count("pk")).values("n")
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.update(
+            item_count=Coalesce(models.Subquery(total), 0),
+            completed_count=Coalesce(models.Subquery(done), 0),
+        )
+
 
 class SharedTodoList(models.Model):
     VIEW = 'view'
@@ -30,6 +76,10 @@ class SharedTodoList(models.Model):
 
     class Meta:
         unique_together = ('todo_list', 'user')
+        indexes = [
+            # "Shared with me" and permission lookups start from the user.
+            models.Index(fields=["user", "todo_list"], name="todo_share_user_list"),
+        ]
 
 
 class TodoItem(models.Model):
@@ -39,5 +89,42 @@ class TodoItem(models.Model):
     updated = models.DateTimeField(auto_now=True)
     created = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "todo_list_id" in field_names and "completed" in field_names:
+            instance.remember_counted()
+        return instance
+
+    def remember_counted(self):
+        # What the list counters currently include for this item, so a save
+        # can tell which counters to move.
+        self._counted = (self.todo_list_id, self.completed)
+
+    class Meta:
+        indexes = [
+            # Item listing, cursor pagination and delta sync.
+            models.Index(fields=["todo_list", "updated", "id"], name="todo_item_list_updated"),
+            models.Index(fields=["todo_list", "completed"], name="todo_item_list_completed"),
+            # Open items only; ignored by backends without partial indexes.
+            models.Index(
+                fields=["todo_list", "updated"],
+                condition=models.Q(completed=False),
+                name="todo_item_list_open",
+            ),
+        ]
+
     def __str__(self):
         return self.body
+
+
+class TodoItemTombstone(models.Model):
+    """Records a deleted item so delta-sync clients can drop it."""
+    todo_list = models.ForeignKey(TodoList, on_delete=models.CASCADE, related_name="tombstones")
+    item_id = models.BigIntegerField()
+    deleted = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["todo_list", "deleted"], name="todo_tombstone_list_deleted"),
+        ]
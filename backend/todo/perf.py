@@ -0,0 +1,183 @@
+"""Seeded query-count and latency budgets for every route in todo/urls.py.
+
+Used by the ``bench_api`` management command against realistic volumes and by
+the test suite at a small scale. Query ceilings are absolute, so an N+1
+regression shows up as soon as the seeded data is bigger than the budget.
+"""
+import statistics
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from .models import TodoList, TodoItem, SharedTodoList
+from .views import make_cursor
+
+User = get_user_model()
+
+# (route name, method, path, payload or query params, max queries)
+ENDPOINTS = [
+    ("api-root", "get", "/api/", None, 0),
+    ("lists-list", "get", "/api/lists/", None, 3),
+    ("lists-list", "get", "/api/lists/", {"page_size": 50}, 3),
+    ("lists-list", "get", "/api/lists/", {"preview": 3}, 3),
+    ("lists-list", "get", "/api/lists/", {"fields": "id,title,item_count,completed_count"}, 2),
+    ("lists-list", "post", "/api/lists/", {"title": "Bench"}, 3),
+    ("lists-detail", "get", "/api/lists/{list}/", None, 3),
+    ("lists-detail", "patch", "/api/lists/{list}/", {"title": "Renamed"}, 4),
+    ("lists-detail", "delete", "/api/lists/{spare_list}/", None, 7),
+    ("lists-complete-all", "post", "/api/lists/{list}/complete-all/", None, 8),
+    ("lists-clear-completed", "post", "/api/lists/{list}/clear-completed/", None, 3),
+    ("cache-stats", "get", "/api/cache-stats/", None, 0),
+    ("ws-stats", "get", "/api/ws-stats/", None, 0),
+    ("list-permission", "get", "/api/lists/{list}/permission/", None, 0),
+    ("items-list", "get", "/api/items/", {"todo_list": "{list}"}, 2),
+    ("items-list", "get", "/api/items/", {"todo_list": "{list}", "page_size": 100}, 2),
+    ("items-list", "get", "/api/items/", {"todo_list": "{list}", "since": "{cursor}"}, 3),
+    ("items-list", "post", "/api/items/", {"todo_list": "{list}", "body": "Bench"}, 6),
+    ("items-changes", "get", "/api/items/changes/", {"since": "{cursor}"}, 2),
+    ("items-bulk", "post", "/api/items/bulk/",
+     {"todo_list": "{list}", "create": [{"body": "Bench"}] * 50,
+      "update": [{"id": "{item}", "completed": True}], "delete": ["{spare_item}"]}, 13),
+    ("item-search", "get", "/api/search/", {"q": "item 42"}, 1),
+    ("items-detail", "get", "/api/items/{item}/", None, 2),
+    ("items-detail", "patch", "/api/items/{item}/", {"completed": True}, 6),
+    ("items-detail", "delete", "/api/items/{item}/", None, 7),
+    ("shared-todolists-list", "get", "/api/shared-todolists/", None, 2),
+    ("shared-todolists-list", "get", "/api/shared-todolists/", {"shared_with_me": "true"}, 2),
+    ("shared-todolists-list", "get", "/api/shared-todolists/", {"list_id": "{list}"}, 2),
+    ("shared-todolists-list", "post", "/api/shared-todolists/",
+     {"todo_list": "{list}", "shared_with_email": "{unshared_email}", "permission": "view"}, 8),
+    ("shared-todolists-detail", "get", "/api/shared-todolists/{share}/", None, 2),
+    ("shared-todolists-detail", "patch", "/api/shared-todolists/{share}/", {"permission": "edit"}, 5),
+    ("shared-todolists-detail", "delete", "/api/shared-todolists/{share}/", None, 4),
+]
+
+
+def seed(lists=200, items=2000, shares=200, items_per_list=5):
+    """Create a benchmark user with realistic data volumes.
+
+    The user owns ``lists`` lists; the first ("hot") list holds ``items``
+    items and is shared with ``shares`` users, each of whom also shares one
+    of their own lists back. Returns the objects the endpoints refer to.
+    """
+    user = User.objects.create(
+        email="bench@example.com", first_name="Bench", last_name="User", is_active=True, is_staff=True
+    )
+    others = User.objects.bulk_create(
+        User(email=f"bench{n}@example.com", first_name="Bench", last_name=str(n), password="!")
+        for n in range(shares + 1)
+    )
+    spare_user = others.pop()
+
+    owned = TodoList.objects.bulk_create(TodoList(owner=user, title=f"List {n}") for n in range(lists + 1))
+    hot, spare = owned[0], owned[-1]
+    theirs = TodoList.objects.bulk_create(TodoList(owner=other, title="Theirs") for other in others)
+
+    TodoItem.objects.bulk_create(TodoItem(todo_list=hot, body=f"Item {n}") for n in range(items))
+    TodoItem.objects.bulk_create(
+        TodoItem(todo_list=todo_list, body=f"Item {n}")
+        for todo_list in owned[1:] + theirs
+        for n in range(items_per_list)
+    )
+    SharedTodoList.objects.bulk_create(
+        SharedTodoList(todo_list=hot, user=other, permission=SharedTodoList.EDIT) for other in others
+    )
+    SharedTodoList.objects.bulk_create(
+        SharedTodoList(todo_list=todo_list, user=user, permission=SharedTodoList.VIEW) for todo_list in theirs
+    )
+    TodoList.recount()
+
+    hot_items = list(TodoItem.objects.filter(todo_list=hot).order_by("pk").values_list("pk", flat=True)[:2])
+    return {
+        "user": user,
+        "list": hot.pk,
+        "spare_list": spare.pk,
+        "item": hot_items[0],
+        "spare_item": hot_items[-1],
+        "share": SharedTodoList.objects.filter(todo_list=hot).values_list("pk", flat=True).first(),
+        "unshared_email": spare_user.email,
+        "cursor": make_cursor(hot.created),
+    }
+
+
+def fill(value, context):
+    if isinstance(value, str):
+        return value.format(**context)
+    if isinstance(value, dict):
+        return {key: fill(item, context) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill(item, context) for item in value]
+    return value
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def endpoint_key(method, path, data):
+    key = f"{method.upper()} {path}"
+    if data and method == "get":
+        key += "?" + "&".join(sorted(data))
+    return key
+
+
+def request(client, method, path, data):
+    return getattr(client, method)(path, data, format=None if method == "get" else "json")
+
+
+def run(context, repeat=5, response_cache=False):
+    """Exercise every endpoint and return a report keyed by endpoint.
+
+    Each request runs in a rolled-back savepoint, so writes and deletes can
+    be repeated against the same seeded state. One unmeasured request warms
+    caches first, so the numbers describe steady-state traffic. The response
+    cache is off unless asked for, since its hits would hide the queries the
+    budgets are meant to guard. Permissions are cached as they are with a
+    shared CACHE_URL.
+    """
+    overrides = {"TODO_PERMISSION_CACHE_TTL": settings.TODO_PERMISSION_CACHE_TTL or 300}
+    if not response_cache:
+        overrides["TODO_RESPONSE_CACHE_TTL"] = 0
+    with override_settings(**overrides):
+        return measure(context, repeat)
+
+
+def measure(context, repeat):
+    client = APIClient()
+    client.force_authenticate(user=context["user"])
+    report = {}
+
+    for name, method, path, data, budget in ENDPOINTS:
+        key = endpoint_key(method, path, data)
+        path, data = fill(path, context), fill(data, context)
+        timings, queries, status = [], 0, None
+
+        for attempt in range(repeat + 1):
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = request(client, method, path, data)
+                    timings.append((time.perf_counter() - started) * 1000)
+                transaction.set_rollback(True)
+            if attempt == 0:
+                timings.pop()
+                continue
+            queries = max(queries, len(captured))
+            status = response.status_code
+
+        report[key] = {
+            "route": name,
+            "status": status,
+            "queries": queries,
+            "budget": budget,
+            "p50_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+        }
+    return report
+
+
+def over_budget(report):
+    return {key: row for key, row in report.items() if row["queries"] > row["budget"]}
@@ -0,0 +1,82 @@
+from functools import lru_cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def walk_fields(serializer, model, prefix, many, select, prefetch, only=None):
+    for name, field in serializer.fields.items():
+        if field.write_only or field.source == '*':
+            continue
+        if only is not None and name not in only:
+            continue
+
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        nested = nested if isinstance(nested, serializers.BaseSerializer) else None
+
+        attrs = field.source_attrs
+        if isinstance(field, serializers.RelatedField) and field.use_pk_only_optimization():
+            # Primary keys are read from the local ``<name>_id`` column.
+            attrs = attrs[:-1]
+
+        current, path, through_many = model, prefix, many
+        for attr in attrs:
+            try:
+                model_field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                # A property or method; nothing more we can plan through it.
+                current = None
+                break
+            if not model_field.is_relation:
+                current = None
+                break
+            path = f"{path}__{attr}" if path else attr
+            through_many = through_many or model_field.one_to_many or model_field.many_to_many
+            (prefetch if through_many else select).add(path)
+            current = model_field.related_model
+
+        if nested is not None and current is not None and path != prefix:
+            walk_fields(nested, current, path, through_many, select, prefetch)
+
+
+@lru_cache(maxsize=None)
+def field_names(serializer_class):
+    return frozenset(serializer_class().fields)
+
+
+@lru_cache(maxsize=None)
+def plan_for(serializer_class, model, only=None):
+    """Work out the relations a serializer reads, split into joins and prefetches.
+
+    ``only`` limits the plan to those top-level fields (see ``?fields=``).
+    """
+    select, prefetch = set(), set()
+    walk_fields(serializer_class(), model, "", False, select, prefetch, only)
+    return sorted(select), sorted(prefetch)
+
+
+def plan_queryset(queryset, serializer_class, only=None, prefetch_querysets=None):
+    """Apply the select_related/prefetch_related plan for ``serializer_class``.
+
+    Relations reached through a forward foreign key are joined; anything
+    behind a reverse or many-to-many relation is prefetched, so rendering
+    the queryset costs a fixed number of queries however many rows it has.
+    ``prefetch_querysets`` maps a prefetch path to the queryset to load it
+    with, for callers that need to filter or annotate the related rows.
+    """
+    if only is not None:
+        # ``only`` comes from the query string; dropping unknown names keeps
+        # the plan cache bounded by the serializer's own fields.
+        only = only & field_names(serializer_class)
+        if only == field_names(serializer_class):
+            only = None
+    select, prefetch = plan_for(serializer_class, queryset.model, only)
+    prefetch_querysets = prefetch_querysets or {}
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*(
+            Prefetch(path, queryset=prefetch_querysets[path]) if path in prefetch_querysets else path
+            for path in prefetch
+        ))
+    return queryset
@@ -0,0 +1,209 @@
+"""Versioned cache of rendered API responses.
+
+Entries are keyed by user, full path and the current version of every scope
+the response depends on: ``user`` for per-user collections and ``list`` for
+one list. Writes never delete entries; they bump the versions of the scopes
+they touch (see ``invalidate_list``), so later reads miss and re-render while the
+old entries age out on their own.
+"""
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+from .cache_backends import redis_client
+from .conditional import respond
+from .models import TodoList, SharedTodoList
+
+USER = "user"
+LIST = "list"
+
+STATS = ("hits", "misses", "invalidations")
+
+
+def version_key(scope, pk):
+    return f"todo:resp:version:{scope}:{pk}"
+
+
+def stats_key(name):
+    return f"todo:resp:stats:{name}"
+
+
+def count(name, amount=1):
+    try:
+        cache.incr(stats_key(name), amount)
+    except ValueError:
+        cache.add(stats_key(name), 0, None)
+        cache.incr(stats_key(name), amount)
+
+
+def versions(scopes):
+    keys = [version_key(scope, pk) for scope, pk in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Start from the clock, not 1: if a version key is evicted, a
+            # restart at 1 would revive entries cached under the old 1.
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+async def acount(name, amount=1):
+    try:
+        await cache.aincr(stats_key(name), amount)
+    except ValueError:
+        await cache.aadd(stats_key(name), 0, None)
+        await cache.aincr(stats_key(name), amount)
+
+
+async def aversions(scopes):
+    keys = [version_key(scope, pk) for scope, pk in scopes]
+    found = await cache.aget_many(keys)
+    for key in keys:
+        if key not in found:
+            await cache.aadd(key, time.time_ns(), None)
+            found[key] = await cache.aget(key)
+    return [found[key] for key in keys]
+
+
+def bump(*scopes):
+    # One read and one write however large the audience. A new version only
+    # has to differ from every earlier one, which the clock already ensures.
+    keys = [version_key(scope, pk) for scope, pk in scopes]
+    now = time.time_ns()
+    current = cache.get_many(keys)
+    cache.set_many({key: max(now, current.get(key, 0) + 1) for key in keys}, None)
+    count("invalidations", len(scopes))
+
+
+def response_key(request, versions):
+    path = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+    return f"todo:resp:{request.user.pk}:{path}:" + ":".join(map(str, versions))
+
+
+def from_entry(request, entry, render):
+    if entry["etag"] is None:
+        return render(entry["data"])
+    return respond(request, entry["etag"], entry["last_modified"], lambda: render(entry["data"]))
+
+
+def to_entry(response):
+    if response.status_code != 200 or not hasattr(response, "data"):
+        return None
+    etag, last_modified = getattr(response, "validators", (None, None))
+    return {"data": response.data, "etag": etag, "last_modified": last_modified}
+
+
+def cached(request, scopes, handler, render=Response):
+    """Serve ``handler()``'s 200 response from the cache when possible.
+
+    ETag and Last-Modified are stored with the data, so conditional requests
+    are answered from the cache too. ``render`` rebuilds a response from
+    cached data.
+    """
+    if not settings.TODO_RESPONSE_CACHE_TTL:
+        return handler()
+    key = response_key(request, versions(scopes))
+    entry = cache.get(key)
+    if entry is not None:
+        count("hits")
+        return from_entry(request, entry, render)
+
+    count("misses")
+    response = handler()
+    entry = to_entry(response)
+    if entry is not None:
+        cache.set(key, entry, settings.TODO_RESPONSE_CACHE_TTL)
+    return response
+
+
+async def acached(request, scopes, handler, render):
+    """``cached`` for async views; ``handler`` is a coroutine function.
+
+    Shares entries with the sync views, so either can serve the other's.
+    """
+    if not settings.TODO_RESPONSE_CACHE_TTL:
+        return await handler()
+    key = response_key(request, await aversions(scopes))
+    entry = await cache.aget(key)
+    if entry is not None:
+        await acount("hits")
+        return from_entry(request, entry, render)
+
+    await acount("misses")
+    response = await handler()
+    entry = to_entry(response)
+    if entry is not None:
+        await cache.aset(key, entry, settings.TODO_RESPONSE_CACHE_TTL)
+    return response
+
+
+def audience(list_id):
+    """The owner and every user the list is shared with."""
+    rows = TodoList.objects.filter(pk=list_id).values_list("owner_id", "shared_with__user_id")
+    return {user_id for row in rows for user_id in row if user_id is not None}
+
+
+def invalidate_list(list_id, users=()):
+    """Invalidate responses showing the list: its own and its audience's.
+
+    ``users`` adds people who just left the audience. Versions are bumped
+    now and again after commit, in case a concurrent read cached the old
+    state under the new versions in between.
+    """
+    scopes = [(LIST, list_id)] + [(USER, user_id) for user_id in audience(list_id) | set(users)]
+    bump(*scopes)
+    transaction.on_commit(lambda: bump(*scopes))
+
+
+def invalidate_user(user_id):
+    """Invalidate responses naming the user: theirs and those of everyone
+    they share lists with, in either direction."""
+    owners = TodoList.objects.filter(shared_with__user_id=user_id).values_list("owner_id", flat=True)
+    recipients = SharedTodoList.objects.filter(todo_list__owner_id=user_id).values_list("user_id", flat=True)
+    scopes = [(USER, pk) for pk in {user_id, *owners, *recipients}]
+    bump(*scopes)
+    transaction.on_commit(lambda: bump(*scopes))
+
+
+def stats():
+    """Counters for sizing the cache; evictions come from the backend."""
+    values = cache.get_many([stats_key(name) for name in STATS])
+    report = {name: values.get(stats_key(name), 0) for name in STATS}
+    lookups = report["hits"] + report["misses"]
+    report["hit_rate"] = round(report["hits"] / lookups, 4) if lookups else None
+    report["evictions"] = backend_evictions()
+    return report
+
+
+def backend_evictions():
+    evictions = getattr(cache, "evictions", None)
+    if evictions is not None:
+        return evictions
+    client = redis_client()
+    if client is not None:
+        # Evictions are server-wide.
+        return client.info("stats").get("evicted_keys")
+    return None
+
+
+class CachedResponseMixin:
+    """Cache a viewset's ``list``/``retrieve`` responses under ``cache_scopes``."""
+
+    def cache_scopes(self, many):
+        """Scopes the response depends on, or None to bypass the cache."""
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(request, True, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(request, False, super().retrieve, *args, **kwargs)
+
+    def cached(self, request, many, handler, *args, **kwargs):
+        scopes = self.cache_scopes(many)
+        if scopes is None:
+            return handler(request, *args, **kwargs)
+        return cached(request, scopes, lambda: handler(request, *args, **kwargs))
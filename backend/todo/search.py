@@ -0,0 +1,113 @@
+"""Full-text search over item bodies.
+
+PostgreSQL matches ``to_tsvector('simple', body)`` against a GIN index on
+that expression, and the planner combines it with the list index. SQLite
+matches an FTS5 index that also holds each item's list, so the visible
+lists are intersected inside FTS5 and a common word costs no more than the
+user's own items. Both indexes are maintained by the database on every
+write, bulk ones included (see migration 0009); SQLite's triggers are
+re-created after ``migrate`` if a table rebuild dropped them. Backends
+without either fall back to ``icontains``.
+
+Every word of the query must match, as a prefix, so results follow what
+the user is typing.
+"""
+import re
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+from .models import TodoItem
+
+FTS_TABLE = "todo_item_fts"
+# Letters and digits only, as both tokenizers split words; this also keeps
+# query syntax out of the search expression.
+WORD = re.compile(r"[^\W_]+")
+MAX_WORDS = 8
+
+
+def words(query):
+    return WORD.findall(query.lower())[:MAX_WORDS]
+
+
+# Database name -> whether migration 0009 could create the FTS5 table.
+fts_tables = {}
+
+
+def has_fts_table():
+    name = connection.settings_dict["NAME"]
+    if name not in fts_tables:
+        fts_tables[name] = FTS_TABLE in connection.introspection.table_names()
+    return fts_tables[name]
+
+
+# Current definitions of the triggers migration 0009 created.
+TRIGGERS = {
+    "todo_item_fts_insert": """AFTER INSERT ON todo_todoitem BEGIN
+        INSERT INTO todo_item_fts(rowid, body, list) VALUES (new.id, new.body, 'l' || new.todo_list_id);
+    END""",
+    "todo_item_fts_delete": """AFTER DELETE ON todo_todoitem BEGIN
+        INSERT INTO todo_item_fts(todo_item_fts, rowid, body, list)
+        VALUES ('delete', old.id, old.body, 'l' || old.todo_list_id);
+    END""",
+    "todo_item_fts_update": """AFTER UPDATE OF body, todo_list_id ON todo_todoitem BEGIN
+        INSERT INTO todo_item_fts(todo_item_fts, rowid, body, list)
+        VALUES ('delete', old.id, old.body, 'l' || old.todo_list_id);
+        INSERT INTO todo_item_fts(rowid, body, list) VALUES (new.id, new.body, 'l' || new.todo_list_id);
+    END""",
+}
+
+
+def missing_triggers(using="default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'todo_todoitem'")
+        present = {row[0] for row in cursor.fetchall()}
+    return [name for name in TRIGGERS if name not in present]
+
+
+def restore_triggers(sender=None, using="default", **kwargs):
+    """Re-create FTS triggers dropped by a SQLite rebuild of todo_todoitem.
+
+    Connected to ``post_migrate``. Writes made while a trigger was missing
+    never reached the index, so it is rebuilt from the table as well.
+    """
+    db = connections[using]
+    if db.vendor != "sqlite" or FTS_TABLE not in db.introspection.table_names():
+        return
+    missing = missing_triggers(using)
+    if not missing:
+        return
+    with db.cursor() as cursor:
+        for name in missing:
+            cursor.execute(f"CREATE TRIGGER {name} {TRIGGERS[name]}")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, body, list) SELECT id, body, 'l' || todo_list_id FROM todo_todoitem"
+        )
+
+
+def filter_items(lists, query):
+    """Items in ``lists`` (a TodoList queryset) whose body matches every word of ``query``."""
+    items = TodoItem.objects.filter(todo_list__in=lists)
+    terms = words(query)
+    if not terms:
+        return items.none()
+    if connection.vendor == "postgresql":
+        # Must match the indexed expression exactly for the GIN index to apply.
+        return items.alias(document=SearchVector("body", config="simple")).filter(
+            document=SearchQuery(" & ".join(f"{term}:*" for term in terms), config="simple", search_type="raw")
+        )
+    if connection.vendor == "sqlite" and has_fts_table():
+        # The MATCH expression is built in SQL from the same visible lists,
+        # e.g. body: ("buy"* "mil"*) AND list: (l1 OR l7); "l0" matches nothing.
+        visible, params = lists.values("id").query.sql_with_params()
+        match = (
+            "SELECT 'body: (' || %s || ') AND list: (' || COALESCE(group_concat('l' || visible.id, ' OR '), 'l0') || ')'"
+            f" FROM ({visible}) visible"
+        )
+        return items.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ({match})",
+            [" ".join(f'"{term}"*' for term in terms), *params],
+        ))
+    for term in terms:
+        items = items.filter(body__icontains=term)
+    return items
@@ -1,27 +1,59 @@
 from rest_framework import serializers
 from .models import TodoList, TodoItem, SharedTodoList
 from django.contrib.auth import get_user_model
+from django.conf import settings
 
 User = get_user_model()
 
-class TodoItemSerializer(serializers.ModelSerializer):
+
+def requested_fields(request):
+    """The ``?fields=`` names asked for on a GET, or None for every field."""
+    if request is None or request.method != 'GET':
+        return None
+    requested = request.query_params.get('fields')
+    if not requested:
+        return None
+    return frozenset(requested.split(','))
+
+
+class SparseFieldsMixin:
+    """Lets GET requests trim the response with ``?fields=id,title``."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = requested_fields(self.context.get('request'))
+        if keep is None:
+            return
+        for name in set(self.fields) - keep:
+            self.fields.pop(name)
+
+
+class TodoItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TodoItem
         fields = '__all__'
         read_only_fields = ['list']
 
-class TodoListSerializer(serializers.ModelSerializer):
-    todos = TodoItemSerializer(many=True, read_only=True)
+class TodoListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    todos = TodoItemSerializer(source='items', many=True, read_only=True)
+
+    class Meta:
+        model = TodoList
+        fields = ['id', 'title', 'created', 'updated', 'owner', 'sequence', 'item_count', 'completed_count', 'todos']
+        read_only_fields = ['owner', 'sequence', 'item_count', 'completed_count']
+
+class TodoListSummarySerializer(serializers.ModelSerializer):
+    """A list without its items; the counters are enough for share cards."""
 
     class Meta:
         model = TodoList
-        fields = ['id', 'title', 'created', 'updated', 'owner', 'todos']
-        read_only_fields = ['owner']
+        fields = ['id', 'title', 'created', 'updated', 'owner', 'sequence', 'item_count', 'completed_count']
+        read_only_fields = fields
 
 class SharedTodoListSerializer(serializers.ModelSerializer):
     shared_by = serializers.SlugRelatedField(source='todo_list.owner', read_only=True, slug_field='first_name')
     shared_to = serializers.SlugRelatedField(source='user', read_only=True, slug_field='email')
-    list = TodoListSerializer(source='todo_list', read_only=True)
+    list = TodoListSummarySerializer(source='todo_list', read_only=True)
 
     shared_with_first_name = serializers.CharField(source='user.first_name', read_only=True)
     shared_with_last_name = serializers.CharField(source='user.last_name', read_only=True)
@@ -30,3 +62,31 @@ class SharedTodoListSerializer(serializers.ModelSerializer):
         model = SharedTodoList
         fields = ['id', 'list', 'shared_by', 'shared_to', 'shared_with_first_name', 'shared_with_last_name', 'permission']
 
+
+
+class BulkItemCreateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TodoItem
+        fields = ['body', 'completed']
+
+
+class BulkItemUpdateSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    body = serializers.CharField(max_length=300, required=False)
+    completed = serializers.BooleanField(required=False)
+
+
+class BulkItemSerializer(serializers.Serializer):
+    """Create, update and delete many items of one list in a single request."""
+    todo_list = serializers.PrimaryKeyRelatedField(queryset=TodoList.objects.all())
+    create = BulkItemCreateSerializer(many=True, required=False)
+    update = BulkItemUpdateSerializer(many=True, required=False)
+    delete = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate(self, attrs):
+        count = sum(len(attrs.get(name, [])) for name in ('create', 'update', 'delete'))
+        if count > settings.TODO_BULK_MAX_OPERATIONS:
+            raise serializers.ValidationError(
+                f"At most {settings.TODO_BULK_MAX_OPERATIONS} operations per request."
+            )
+        return attrs
@@ -0,0 +1,122 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.conf import settings
+from .models import TodoList, TodoItem, TodoItemTombstone, SharedTodoList
+from .serializers import TodoItemSerializer
+from . import access, broadcast, respcache
+from .middleware import user_cache
+
+
+@receiver(post_save, sender=TodoItem)
+def broadcast_item_saved(sender, instance, created, **kwargs):
+    payload = {
+        "type": "todo_created" if created else "todo_updated",
+        "todo": dict(TodoItemSerializer(instance).data),
+    }
+    broadcast.publish_on_commit(instance.todo_list_id, instance.pk, payload)
+    counted = getattr(instance, "_counted", None)
+    if not created and counted and counted[0] != instance.todo_list_id:
+        # A move reads as a delete to the old list's deltas and sockets, and
+        # bumps its sequence so cached copies of it go stale too.
+        TodoItemTombstone.objects.filter(todo_list_id=instance.todo_list_id, item_id=instance.pk).delete()
+        TodoItemTombstone.objects.create(todo_list_id=counted[0], item_id=instance.pk)
+        broadcast.publish_on_commit(counted[0], instance.pk, {"type": "todo_deleted", "todo_id": instance.pk})
+
+
+# Registered before count_item_saved, which forgets the item's previous list.
+@receiver(post_save, sender=TodoItem)
+def invalidate_item_responses(sender, instance, **kwargs):
+    respcache.invalidate_list(instance.todo_list_id)
+    counted = getattr(instance, "_counted", None)
+    if counted and counted[0] != instance.todo_list_id:
+        respcache.invalidate_list(counted[0])
+
+
+@receiver(post_save, sender=TodoItem)
+def count_item_saved(sender, instance, created, **kwargs):
+    counted = getattr(instance, "_counted", None)
+    if created:
+        TodoList.adjust_counts(instance.todo_list_id, items=1, completed=int(instance.completed))
+    elif counted is None:
+        # Saved without being loaded first, so the previous state is unknown.
+        TodoList.recount(TodoList.objects.filter(pk=instance.todo_list_id))
+    else:
+        list_id, completed = counted
+        if list_id != instance.todo_list_id:
+            TodoList.adjust_counts(list_id, items=-1, completed=-int(completed))
+            TodoList.adjust_counts(instance.todo_list_id, items=1, completed=int(instance.completed))
+        else:
+            TodoList.adjust_counts(list_id, completed=int(instance.completed) - int(completed))
+    instance.remember_counted()
+
+
+def deleted_with_list(origin):
+    # Items only cascade from their list, whether it was deleted directly or
+    # with its owner; anything but an item delete takes the list along.
+    if isinstance(origin, QuerySet):
+        return origin.model is not TodoItem
+    return origin is not None and not isinstance(origin, TodoItem)
+
+
+@receiver(post_delete, sender=TodoItem)
+def broadcast_item_deleted(sender, instance, origin=None, **kwargs):
+    if deleted_with_list(origin):
+        # Nobody is left to tell, and the list's tombstones go with it.
+        return
+    TodoItemTombstone.objects.create(todo_list_id=instance.todo_list_id, item_id=instance.pk)
+    TodoList.adjust_counts(instance.todo_list_id, items=-1, completed=-int(instance.completed))
+    respcache.invalidate_list(instance.todo_list_id)
+    payload = {
+        "type": "todo_deleted",
+        "todo_id": instance.pk,
+    }
+    broadcast.publish_on_commit(instance.todo_list_id, instance.pk, payload)
+
+
+def invalidate_permissions(list_id):
+    # Once now, for reads later in this transaction, and again after commit
+    # in case a concurrent request cached the old answer in between.
+    access.invalidate(list_id)
+    transaction.on_commit(lambda: access.invalidate(list_id))
+
+
+@receiver(post_save, sender=TodoList)
+@receiver(post_delete, sender=TodoList)
+def invalidate_list_permissions(sender, instance, **kwargs):
+    invalidate_permissions(instance.pk)
+    respcache.invalidate_list(instance.pk, users=[instance.owner_id])
+
+
+@receiver(post_delete, sender=TodoList)
+def close_list_sockets(sender, instance, **kwargs):
+    broadcast.access_changed_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=SharedTodoList)
+@receiver(post_delete, sender=SharedTodoList)
+def invalidate_share_permissions(sender, instance, created=False, **kwargs):
+    invalidate_permissions(instance.todo_list_id)
+    respcache.invalidate_list(instance.todo_list_id, users=[instance.user_id])
+    if not created:
+        # A downgrade or revocation; open sockets must not keep the old rights.
+        broadcast.access_changed_on_commit(instance.todo_list_id, instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_responses(sender, instance, created, update_fields=None, **kwargs):
+    # Logins only touch last_login, which no response shows.
+    if not created and update_fields != frozenset(["last_login"]):
+        respcache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def evict_inactive_user(sender, instance, **kwargs):
+    if not instance.is_active:
+        user_cache.evict_user(instance.pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def evict_deleted_user(sender, instance, **kwargs):
+    user_cache.evict_user(instance.pk)
@@ -2,8 +2,38 @@
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from .models import TodoList, TodoItem, SharedTodoList
+from django.contrib.auth.models import AnonymousUser
+from .models import TodoList, TodoItem, SharedTodoList, TodoItemTombstone
+from django.utils import timezone
+from datetime import timedelta
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.response import Response
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
+from django.conf import settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from io import StringIO
+from unittest import mock
+from .queryplan import plan_for
+from .serializers import SharedTodoListSerializer
+from .routing import websocket_urlpatterns
+from .consumers import outbox_stats
+from . import access, broadcast, checks, consumers, explain, mixedload, perf, respcache, search, wsload
+from . import urls as todo_urls
+from .layers import MemoryBus, RedisBus, RelayChannelLayer, ShardedRedisChannelLayer, check_channel_layers, shard_for
+from .middleware import JWTAuthMiddleware, UserCache, user_cache
+from rest_framework_simplejwt.tokens import AccessToken
+import asyncio
+import time
+import json
+import msgpack
 
 
 User = get_user_model()
@@ -188,3 +218,1719 @@ class TodoAPITests(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data["permission"], "view")
         self.assertFalse(response.data["is_owner"])
+
+
+class TodoBroadcastTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User"
+        )
+        self.client.force_authenticate(user=self.owner)
+        self.todo_list = TodoList.objects.create(title="Live", owner=self.owner)
+        self.channel_layer = get_channel_layer()
+        self.channel_name = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(f"todo_{self.todo_list.id}", self.channel_name)
+
+    def tearDown(self):
+        async_to_sync(self.channel_layer.flush)()
+
+    def receive(self):
+        message = async_to_sync(self.channel_layer.receive)(self.channel_name)
+        self.assertEqual(message["type"], "todo.event")
+        if settings.TODO_WS_MSGPACK:
+            self.assertEqual(msgpack.unpackb(message["bytes"]), json.loads(message["text"]))
+        else:
+            self.assertNotIn("bytes", message)
+        return json.loads(message["text"])
+
+    @override_settings(TODO_WS_MSGPACK=True)
+    def test_msgpack_is_encoded_once_when_enabled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/items/", {"todo_list": self.todo_list.id, "body": "Packed"})
+        self.assertEqual(self.receive()["todo"]["body"], "Packed")
+
+    def test_create_broadcasts_serialized_item(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/items/", {"todo_list": self.todo_list.id, "body": "Ship it"})
+        message = self.receive()
+        self.assertEqual(message["type"], "todo_created")
+        self.assertEqual(message["todo"]["id"], response.data["id"])
+        self.assertEqual(message["todo"]["body"], "Ship it")
+
+    def test_update_broadcasts_serialized_item(self):
+        item = TodoItem.objects.create(todo_list=self.todo_list, body="Draft")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/items/{item.id}/", {"completed": True})
+        message = self.receive()
+        self.assertEqual(message["type"], "todo_updated")
+        self.assertTrue(message["todo"]["completed"])
+
+    def test_delete_broadcasts_item_id(self):
+        item = TodoItem.objects.create(todo_list=self.todo_list, body="Old")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/items/{item.id}/")
+        message = self.receive()
+        self.assertEqual(message, {"type": "todo_deleted", "todo_id": item.id, "seq": 2})
+
+    def test_each_change_bumps_list_sequence(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = TodoItem.objects.create(todo_list=self.todo_list, body="One")
+            item.completed = True
+            item.save()
+        self.assertEqual([self.receive()["seq"], self.receive()["seq"]], [1, 2])
+        self.todo_list.refresh_from_db()
+        self.assertEqual(self.todo_list.sequence, 2)
+
+    def test_nothing_is_broadcast_before_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            TodoItem.objects.create(todo_list=self.todo_list, body="Pending")
+        self.assertFalse(self.channel_layer.channels.get(self.channel_name))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.receive()["type"], "todo_created")
+
+
+class TodoConsumerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="watcher@example.com", password="password", first_name="Watch", last_name="Er"
+        )
+        self.todo_list = TodoList.objects.create(title="Watched", owner=self.user)
+        self.group = f"todo_{self.todo_list.id}"
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/todo/{self.todo_list.id}/")
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def connect_binary(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/todo/{self.todo_list.id}/", subprotocols=["todo.msgpack"]
+        )
+        communicator.scope["user"] = self.user
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, "todo.msgpack")
+        return communicator
+
+    async def group_send(self, payload, seq=1):
+        todo_id = payload["todo"]["id"] if "todo" in payload else payload["todo_id"]
+        await get_channel_layer().group_send(self.group, {
+            "type": "todo.event",
+            "todo_id": todo_id,
+            "seq": seq,
+            **broadcast.encode(payload),
+        })
+
+    def create_items(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(count):
+                TodoItem.objects.create(todo_list=self.todo_list, body=f"Item {n}")
+
+    @override_settings(TODO_WS_BATCH_WINDOW_MS=0)
+    async def test_events_sent_immediately_without_window(self):
+        communicator = await self.connect()
+        await self.group_send({"type": "todo_created", "todo": {"id": 1, "body": "a"}})
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {"type": "todo_created", "todo": {"id": 1, "body": "a"}},
+        )
+        await communicator.disconnect()
+
+    @override_settings(TODO_WS_BATCH_WINDOW_MS=20)
+    async def test_burst_is_coalesced_into_one_batch(self):
+        communicator = await self.connect()
+        await self.group_send({"type": "todo_created", "todo": {"id": 1, "body": "a"}}, seq=1)
+        await self.group_send({"type": "todo_updated", "todo": {"id": 1, "body": "b"}}, seq=2)
+        await self.group_send({"type": "todo_updated", "todo": {"id": 2, "body": "c"}}, seq=3)
+        await self.group_send({"type": "todo_updated", "todo": {"id": 2, "body": "d"}}, seq=4)
+        await self.group_send({"type": "todo_deleted", "todo_id": 3}, seq=5)
+
+        frame = await communicator.receive_json_from(timeout=1)
+        self.assertEqual(frame["type"], "batch")
+        self.assertEqual(frame["events"], [
+            {"type": "todo_updated", "todo": {"id": 1, "body": "b"}},
+            {"type": "todo_updated", "todo": {"id": 2, "body": "d"}},
+            {"type": "todo_deleted", "todo_id": 3},
+        ])
+        self.assertTrue(await communicator.receive_nothing(timeout=0.05))
+        await communicator.disconnect()
+
+    @override_settings(TODO_WS_BATCH_WINDOW_MS=20)
+    async def test_coalesced_events_keep_their_latest_position(self):
+        communicator = await self.connect()
+        await self.group_send({"type": "todo_updated", "todo": {"id": 5, "completed": False}}, seq=1)
+        bulk = {"type": "batch", "events": [{"type": "todo_updated", "todo": {"id": 5, "completed": True}}]}
+        await get_channel_layer().group_send(self.group, {
+            "type": "todo.event", "todo_id": None, "seq": 2, **broadcast.encode(bulk),
+        })
+        await self.group_send({"type": "todo_updated", "todo": {"id": 5, "completed": False}}, seq=3)
+
+        frame = await communicator.receive_json_from(timeout=1)
+        # The bulk completion must not be applied after the item was reopened.
+        self.assertEqual(frame["events"], [bulk, {"type": "todo_updated", "todo": {"id": 5, "completed": False}}])
+        await communicator.disconnect()
+
+    @override_settings(TODO_WS_BATCH_WINDOW_MS=10000, TODO_WS_BATCH_MAX_EVENTS=2)
+    async def test_full_buffer_flushes_before_window(self):
+        communicator = await self.connect()
+        await self.group_send({"type": "todo_deleted", "todo_id": 1})
+        await self.group_send({"type": "todo_deleted", "todo_id": 2})
+        frame = await communicator.receive_json_from(timeout=1)
+        self.assertEqual(len(frame["events"]), 2)
+        await communicator.disconnect()
+
+    async def test_anonymous_user_is_rejected(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/todo/{self.todo_list.id}/")
+        communicator.scope["user"] = AnonymousUser()
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_msgpack_is_only_offered_when_enabled(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/todo/{self.todo_list.id}/", subprotocols=["todo.msgpack"]
+        )
+        communicator.scope["user"] = self.user
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertIsNone(subprotocol)
+        await communicator.disconnect()
+
+    @override_settings(TODO_WS_BATCH_WINDOW_MS=20, TODO_WS_MSGPACK=True)
+    async def test_msgpack_subprotocol_receives_binary_batch(self):
+        communicator = await self.connect_binary()
+        await self.group_send({"type": "todo_updated", "todo": {"id": 1, "body": "a"}})
+        await self.group_send({"type": "todo_deleted", "todo_id": 2})
+        frame = msgpack.unpackb(await communicator.receive_from(timeout=1))
+        self.assertEqual(frame, {"type": "batch", "events": [
+            {"type": "todo_updated", "todo": {"id": 1, "body": "a"}},
+            {"type": "todo_deleted", "todo_id": 2},
+        ]})
+        await communicator.disconnect()
+
+    @override_settings(TODO_WS_BATCH_WINDOW_MS=0)
+    async def test_pre_encoded_text_is_sent_verbatim(self):
+        communicator = await self.connect()
+        payload = {"type": "todo_deleted", "todo_id": 7}
+        await self.group_send(payload)
+        self.assertEqual(await communicator.receive_from(), broadcast.encode(payload)["text"])
+        await communicator.disconnect()
+
+    async def connect_since(self, since):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/todo/{self.todo_list.id}/?since={since}"
+        )
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    @override_settings(TODO_WS_BATCH_WINDOW_MS=0)
+    async def test_resume_replays_missed_events(self):
+        await sync_to_async(self.create_items)(3)
+        communicator = await self.connect_since(1)
+        frame = await communicator.receive_json_from()
+        self.assertEqual(frame["type"], "batch")
+        self.assertEqual([event["seq"] for event in frame["events"]], [2, 3])
+        self.assertTrue(await communicator.receive_nothing(timeout=0.05))
+        await communicator.disconnect()
+
+    @override_settings(TODO_WS_BATCH_WINDOW_MS=0)
+    async def test_resume_up_to_date_sends_nothing(self):
+        await sync_to_async(self.create_items)(2)
+        communicator = await self.connect_since(2)
+        self.assertTrue(await communicator.receive_nothing(timeout=0.05))
+        await communicator.disconnect()
+
+    @override_settings(TODO_WS_BATCH_WINDOW_MS=0, TODO_WS_REPLAY_SIZE=2)
+    async def test_resume_beyond_buffer_sends_snapshot(self):
+        await sync_to_async(self.create_items)(5)
+        communicator = await self.connect_since(1)
+        frame = await communicator.receive_json_from()
+        self.assertEqual(frame["type"], "snapshot")
+        self.assertEqual(frame["seq"], 5)
+        self.assertEqual(len(frame["todos"]), 5)
+        await communicator.disconnect()
+
+    @override_settings(TODO_WS_BATCH_WINDOW_MS=0)
+    async def test_live_events_already_replayed_are_skipped(self):
+        await sync_to_async(self.create_items)(2)
+        communicator = await self.connect_since(0)
+        frame = await communicator.receive_json_from()
+        self.assertEqual(len(frame["events"]), 2)
+        await self.group_send({"type": "todo_deleted", "todo_id": 1}, seq=2)
+        self.assertTrue(await communicator.receive_nothing(timeout=0.05))
+        await communicator.disconnect()
+
+
+class ReplayBufferTests(TestCase):
+    def test_missed_events_requires_unbroken_run(self):
+        entries = [{"seq": 3}, {"seq": 4}, {"seq": 6}]
+        self.assertIsNone(broadcast.missed_events(entries, 3))
+        self.assertEqual(broadcast.missed_events(entries[:2], 2), [{"seq": 3}, {"seq": 4}])
+        self.assertIsNone(broadcast.missed_events(entries, 1))
+        self.assertIsNone(broadcast.missed_events([], 1))
+
+    @override_settings(TODO_WS_REPLAY_SIZE=2)
+    def test_buffer_keeps_one_encoding_and_trims(self):
+        cache.clear()
+        payloads = [{"type": "todo_deleted", "todo_id": n} for n in range(3)]
+        for seq, payload in enumerate(payloads, start=1):
+            broadcast.remember(7, broadcast.event_message(payload["todo_id"], seq, payload))
+
+        entries = broadcast.replay_entries(7)
+        self.assertEqual([entry["seq"] for entry in entries], [2, 3])
+        self.assertTrue(all(set(entry) == {"todo_id", "seq", "text"} for entry in entries))
+
+        events = broadcast.replay(7, 1, binary=True)
+        self.assertEqual(msgpack.unpackb(events[0]["bytes"]), {**payloads[1], "seq": 2})
+        self.assertIsNone(broadcast.replay(7, 0))
+
+
+class DeltaSyncTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", password="password", first_name="Other", last_name="User"
+        )
+        self.client.force_authenticate(user=self.owner)
+        self.todo_list = TodoList.objects.create(title="Sync", owner=self.owner)
+
+    def test_since_returns_only_changes_and_tombstones(self):
+        old = TodoItem.objects.create(todo_list=self.todo_list, body="Old")
+        gone = TodoItem.objects.create(todo_list=self.todo_list, body="Gone")
+        TodoItem.objects.filter(pk__in=[old.pk, gone.pk]).update(updated=timezone.now() - timedelta(hours=1))
+        since = (timezone.now() - timedelta(minutes=1)).isoformat()
+
+        fresh = TodoItem.objects.create(todo_list=self.todo_list, body="Fresh")
+        gone_id = gone.id
+        gone.delete()
+
+        response = self.client.get("/api/items/", {"todo_list": self.todo_list.id, "since": since})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data["reset"])
+        self.assertEqual([item["id"] for item in response.data["items"]], [fresh.id])
+        self.assertEqual(response.data["deleted"], [gone_id])
+
+        response = self.client.get("/api/items/", {"todo_list": self.todo_list.id, "since": response.data["cursor"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(fresh.id, [item["id"] for item in response.data["items"]])
+
+    def test_since_requires_access_to_list(self):
+        foreign = TodoList.objects.create(title="Foreign", owner=self.other)
+        response = self.client.get("/api/items/", {"todo_list": foreign.id, "since": "0"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_items_of_foreign_lists_are_hidden(self):
+        foreign = TodoList.objects.create(title="Foreign", owner=self.other)
+        item = TodoItem.objects.create(todo_list=foreign, body="Secret")
+        for params in [{}, {"page_size": 10}, {"fields": "id,body"}]:
+            response = self.client.get("/api/items/", {"todo_list": foreign.id, **params})
+            self.assertEqual(response.status_code, 200, params)
+            data = response.data["results"] if "page_size" in params else response.data
+            self.assertEqual(data, [], params)
+        self.assertEqual(self.client.get(f"/api/items/{item.id}/").status_code, 404)
+        self.assertEqual(self.client.get("/api/items/").data, [])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get("/api/items/", {"todo_list": self.todo_list.id, "since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_changes_covers_owned_and_shared_lists(self):
+        shared = TodoList.objects.create(title="Theirs", owner=self.other)
+        SharedTodoList.objects.create(todo_list=shared, user=self.owner, permission="view")
+        hidden = TodoList.objects.create(title="Hidden", owner=self.other)
+        mine = TodoItem.objects.create(todo_list=self.todo_list, body="Mine")
+        theirs = TodoItem.objects.create(todo_list=shared, body="Theirs")
+        TodoItem.objects.create(todo_list=hidden, body="Hidden")
+
+        response = self.client.get("/api/items/changes/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["reset"])
+        self.assertCountEqual([item["id"] for item in response.data["items"]], [mine.id, theirs.id])
+
+    def test_deleting_list_leaves_no_tombstones(self):
+        TodoItem.objects.create(todo_list=self.todo_list, body="Item")
+        self.todo_list.delete()
+        self.assertFalse(TodoItemTombstone.objects.exists())
+
+    def test_deleting_owner_removes_lists_without_tombstones(self):
+        second = TodoList.objects.create(title="Second", owner=self.owner)
+        for todo_list in [self.todo_list, second]:
+            TodoItem.objects.create(todo_list=todo_list, body="Item")
+        TodoItem.objects.create(todo_list=second, body="Gone").delete()
+        self.owner.delete()
+        self.assertFalse(TodoList.objects.exists())
+        self.assertFalse(TodoItemTombstone.objects.exists())
+
+    def test_moved_item_is_deleted_from_old_list(self):
+        other = TodoList.objects.create(title="Other", owner=self.owner)
+        item = TodoItem.objects.create(todo_list=self.todo_list, body="Moving")
+        since = (timezone.now() - timedelta(minutes=1)).isoformat()
+        sequence = TodoList.objects.get(pk=self.todo_list.pk).sequence
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f"/api/items/{item.id}/", {"todo_list": other.id}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(TodoList.objects.get(pk=self.todo_list.pk).sequence, sequence)
+
+        response = self.client.get("/api/items/", {"todo_list": self.todo_list.id, "since": since})
+        self.assertEqual(response.data["items"], [])
+        self.assertEqual(response.data["deleted"], [item.id])
+
+        # Moving it back clears the stale tombstone in its original list.
+        self.client.patch(f"/api/items/{item.id}/", {"todo_list": self.todo_list.id}, format="json")
+        response = self.client.get("/api/items/", {"todo_list": self.todo_list.id, "since": since})
+        self.assertEqual([todo["id"] for todo in response.data["items"]], [item.id])
+        self.assertEqual(response.data["deleted"], [])
+
+
+class PaginationAndFieldsTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User"
+        )
+        self.client.force_authenticate(user=self.owner)
+        self.todo_list = TodoList.objects.create(title="Long", owner=self.owner)
+        TodoItem.objects.bulk_create(
+            TodoItem(todo_list=self.todo_list, body=f"Item {n}") for n in range(7)
+        )
+        # Force ties on updated so the id tie-breaker is exercised.
+        TodoItem.objects.update(updated=timezone.now())
+
+    def test_unpaginated_by_default(self):
+        response = self.client.get("/api/items/", {"todo_list": self.todo_list.id})
+        self.assertEqual(len(response.data), 7)
+
+    def test_cursor_pages_cover_every_item_once(self):
+        seen = []
+        response = self.client.get("/api/items/", {"todo_list": self.todo_list.id, "page_size": 3})
+        while True:
+            self.assertLessEqual(len(response.data["results"]), 3)
+            seen += [item["id"] for item in response.data["results"]]
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+        self.assertEqual(seen, sorted(TodoItem.objects.values_list("id", flat=True)))
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get("/api/items/", {"cursor": "bogus"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_fields_limits_serialized_fields(self):
+        response = self.client.get("/api/items/", {"todo_list": self.todo_list.id, "fields": "id,completed"})
+        self.assertEqual(set(response.data[0]), {"id", "completed"})
+        response = self.client.get("/api/lists/", {"fields": "id,title", "page_size": 10})
+        self.assertEqual(response.data["results"], [{"id": self.todo_list.id, "title": "Long"}])
+
+    def test_unknown_fields_do_not_grow_the_plan_cache(self):
+        self.client.get("/api/lists/", {"fields": "id,todos"})
+        size = plan_for.cache_info().currsize
+        for n in range(5):
+            response = self.client.get("/api/lists/", {"fields": f"id,todos,bogus{n}"})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(plan_for.cache_info().currsize, size)
+
+    def test_lists_nest_their_items(self):
+        response = self.client.get(f"/api/lists/{self.todo_list.id}/")
+        self.assertEqual(len(response.data["todos"]), 7)
+
+    def test_preview_nests_first_open_items_in_one_query(self):
+        other = TodoList.objects.create(title="Short", owner=self.owner)
+        first = TodoItem.objects.create(todo_list=other, body="Done", completed=True)
+        second = TodoItem.objects.create(todo_list=other, body="Open")
+        TodoItem.objects.filter(pk=first.pk).update(completed=True)
+        opened = list(TodoItem.objects.filter(todo_list=self.todo_list).order_by("created", "id")[:3])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/lists/", {"preview": 3})
+        # ETag aggregate, lists, items.
+        self.assertEqual(len(queries), 3)
+        todos = {row["id"]: [todo["id"] for todo in row["todos"]] for row in response.data}
+        self.assertEqual(todos[self.todo_list.id], [item.pk for item in opened])
+        self.assertEqual(todos[other.id], [second.pk])
+
+    @override_settings(TODO_LIST_PREVIEW_MAX=2)
+    def test_preview_is_capped_and_validated(self):
+        response = self.client.get(f"/api/lists/{self.todo_list.id}/", {"preview": 50})
+        self.assertEqual(len(response.data["todos"]), 2)
+        response = self.client.get("/api/lists/", {"preview": "all"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sparse_fields_skip_the_items_prefetch(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/lists/", {"fields": "id,item_count"})
+        self.assertEqual(len(queries), 2)
+
+
+class SharedListQueryTests(APITestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(
+            email="me@example.com", password="password", first_name="Me", last_name="User"
+        )
+        self.client.force_authenticate(user=self.me)
+
+    def share_lists(self, count):
+        start = SharedTodoList.objects.count()
+        for n in range(start, start + count):
+            owner = User.objects.create_user(
+                email=f"owner{n}@example.com", password="password", first_name="Owner", last_name=str(n)
+            )
+            todo_list = TodoList.objects.create(title=f"List {n}", owner=owner)
+            SharedTodoList.objects.create(todo_list=todo_list, user=self.me, permission="view")
+
+    def count_queries(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/shared-todolists/", params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_shares(self):
+        self.share_lists(1)
+        baseline = [self.count_queries({"shared_with_me": "true"}), self.count_queries({})]
+        self.share_lists(5)
+        self.assertEqual([self.count_queries({"shared_with_me": "true"}), self.count_queries({})], baseline)
+
+    def test_plan_joins_every_serialized_relation(self):
+        select, prefetch = plan_for(SharedTodoListSerializer, SharedTodoList)
+        self.assertEqual(select, ["todo_list", "todo_list__owner", "user"])
+        self.assertEqual(prefetch, [])
+
+    def test_shared_lists_carry_counters_not_items(self):
+        self.share_lists(1)
+        todo_list = SharedTodoList.objects.get().todo_list
+        TodoItem.objects.bulk_create(TodoItem(todo_list=todo_list, body=f"Item {n}") for n in range(3))
+        TodoList.recount()
+        response = self.client.get("/api/shared-todolists/", {"shared_with_me": "true"})
+        embedded = response.data[0]["list"]
+        self.assertNotIn("todos", embedded)
+        self.assertEqual(embedded["item_count"], 3)
+
+
+class ApiBudgetTests(APITestCase):
+    def test_every_route_has_a_budget(self):
+        routes = {pattern.name for pattern in todo_urls.urlpatterns if pattern.name}
+        self.assertEqual(routes - {name for name, *_ in perf.ENDPOINTS}, set())
+
+    def test_endpoints_stay_within_query_budgets(self):
+        context = perf.seed(lists=20, items=50, shares=10)
+        report = perf.run(context, repeat=1)
+        self.assertEqual(perf.over_budget(report), {})
+        for key, row in report.items():
+            self.assertLess(row["status"], 400, key)
+
+
+class IndexPlanTests(TestCase):
+    def test_detects_unindexed_filters(self):
+        scan = "SELECT id FROM todo_todoitem WHERE body = 'x'"
+        self.assertEqual(explain.sequential_scans(scan), ["todo_todoitem"])
+        seek = "SELECT id FROM todo_todoitem WHERE todo_list_id = 1 AND completed = 0"
+        self.assertEqual(explain.sequential_scans(seek), [])
+
+    def test_api_queries_use_indexes(self):
+        context = perf.seed(lists=20, items=50, shares=10)
+        self.assertEqual(explain.run(context), {})
+
+
+class WebSocketLoadHarnessTests(TestCase):
+    @override_settings(TODO_WS_BATCH_WINDOW_MS=5)
+    async def test_every_event_reaches_every_socket(self):
+        user = await User.objects.acreate(email="load@example.com", first_name="Load", last_name="Test")
+        lists = [await TodoList.objects.acreate(owner=user, title=f"Load {n}") for n in range(2)]
+        report = await wsload.run(user, [todo_list.pk for todo_list in lists], clients=6, rate=100, duration=0.2)
+        self.assertGreater(report["events_sent"], 0)
+        self.assertEqual(report["events_received"], report["events_expected"])
+        self.assertEqual(report["connect_ms"]["count"], 6)
+
+    async def test_idle_report_covers_every_socket(self):
+        user = await User.objects.acreate(email="idle@example.com", first_name="Idle", last_name="Test")
+        todo_list = await TodoList.objects.acreate(owner=user, title="Idle")
+        report = await wsload.idle(user, [todo_list.pk], clients=4, trace=True)
+        self.assertEqual(report["connect_ms"]["count"], 4)
+        self.assertIn("rss_per_connection", report)
+        self.assertTrue(report["traced_per_connection"])
+
+
+class ItemSearchTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", password="password", first_name="Other", last_name="User"
+        )
+        mine = TodoList.objects.create(title="Groceries", owner=self.owner)
+        shared = TodoList.objects.create(title="Party", owner=self.other)
+        private = TodoList.objects.create(title="Private", owner=self.other)
+        SharedTodoList.objects.create(todo_list=shared, user=self.owner, permission="view")
+        self.milk = TodoItem.objects.create(todo_list=mine, body="Buy milk")
+        TodoItem.objects.create(todo_list=mine, body="Buy bread")
+        TodoItem.objects.create(todo_list=shared, body="Buy balloons")
+        TodoItem.objects.create(todo_list=private, body="Buy a surprise")
+        self.client.force_authenticate(user=self.owner)
+
+    def search(self, q):
+        response = self.client.get("/api/search/", {"q": q})
+        self.assertEqual(response.status_code, 200)
+        return sorted(item["body"] for item in response.data)
+
+    def test_covers_owned_and_shared_lists_only(self):
+        self.assertEqual(self.search("buy"), ["Buy balloons", "Buy bread", "Buy milk"])
+
+    def test_every_word_matches_as_a_prefix(self):
+        self.assertEqual(self.search("bu mil"), ["Buy milk"])
+        self.assertEqual(self.search("BALL!"), ["Buy balloons"])
+        self.assertEqual(self.search("milk bread"), [])
+
+    def test_index_follows_writes(self):
+        self.milk.body = "Buy oat milk"
+        self.milk.save()
+        self.assertEqual(self.search("oat"), ["Buy oat milk"])
+        self.milk.delete()
+        self.assertEqual(self.search("milk"), [])
+        TodoItem.objects.bulk_create([TodoItem(todo_list=self.milk.todo_list, body="Oat bars")])
+        TodoItem.objects.filter(body="Buy bread").update(body="Rye bread")
+        self.assertEqual(self.search("oat"), ["Oat bars"])
+        self.assertEqual(self.search("rye"), ["Rye bread"])
+        TodoItem.objects.filter(body="Rye bread").update(todo_list=TodoList.objects.get(title="Private"))
+        self.assertEqual(self.search("rye"), [])
+
+    def test_dropped_triggers_are_restored_after_migrate(self):
+        self.assertEqual(search.missing_triggers(), [])
+        with connection.cursor() as cursor:
+            # What SQLite does to triggers when a migration rebuilds the table.
+            cursor.execute("DROP TRIGGER todo_item_fts_update")
+        self.milk.body = "Buy oat milk"
+        self.milk.save()
+        self.assertEqual(self.search("oat"), [])
+
+        search.restore_triggers(sender=None, using="default")
+        self.assertEqual(search.missing_triggers(), [])
+        self.assertEqual(self.search("oat"), ["Buy oat milk"])
+        self.milk.body = "Buy rice milk"
+        self.milk.save()
+        self.assertEqual(self.search("oat"), [])
+
+    def test_match_and_visibility_are_one_query(self):
+        self.search("buy")
+        with self.assertNumQueries(1):
+            self.search("buy")
+
+    def test_query_needs_a_word(self):
+        for q in ["", "  ", '"*:&']:
+            self.assertEqual(self.client.get("/api/search/", {"q": q}).status_code, 400)
+
+    @override_settings(TODO_SEARCH_LIMIT=2)
+    def test_results_are_capped_newest_first(self):
+        response = self.client.get("/api/search/", {"q": "buy"})
+        self.assertEqual([item["body"] for item in response.data], ["Buy balloons", "Buy bread"])
+
+
+class ListPermissionTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User"
+        )
+        self.guest = User.objects.create_user(
+            email="guest@example.com", password="password", first_name="Guest", last_name="User"
+        )
+        self.todo_list = TodoList.objects.create(title="Guarded", owner=self.owner)
+        self.share = SharedTodoList.objects.create(todo_list=self.todo_list, user=self.guest, permission="view")
+
+    def test_resolves_every_role_in_one_query(self):
+        stranger = User.objects.create_user(
+            email="stranger@example.com", password="password", first_name="Stranger", last_name="User"
+        )
+        cache.clear()
+        for user, expected in [(self.owner, access.OWNER), (self.guest, access.VIEW), (stranger, access.NONE)]:
+            with self.assertNumQueries(1):
+                self.assertEqual(access.resolve(user.pk, self.todo_list.pk), expected)
+        self.assertEqual(access.resolve(self.owner.pk, 999999), access.NONE)
+
+    @override_settings(TODO_PERMISSION_CACHE_TTL=300)
+    def test_cached_across_requests(self):
+        access.resolve(self.guest.pk, self.todo_list.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(access.resolve(self.guest.pk, self.todo_list.pk), access.VIEW)
+
+    @override_settings(TODO_PERMISSION_CACHE_TTL=0)
+    def test_uncached_without_a_shared_cache(self):
+        access.resolve(self.guest.pk, self.todo_list.pk)
+        # A share change made in another process, whose invalidation is unseen here.
+        SharedTodoList.objects.filter(pk=self.share.pk).update(permission="edit")
+        with self.assertNumQueries(1):
+            self.assertEqual(access.resolve(self.guest.pk, self.todo_list.pk), access.EDIT)
+
+    def test_share_changes_invalidate_cache(self):
+        self.assertEqual(access.resolve(self.guest.pk, self.todo_list.pk), access.VIEW)
+        self.share.permission = "edit"
+        self.share.save()
+        self.assertEqual(access.resolve(self.guest.pk, self.todo_list.pk), access.EDIT)
+        self.share.delete()
+        self.assertEqual(access.resolve(self.guest.pk, self.todo_list.pk), access.NONE)
+
+    def test_revocation_after_version_eviction_is_not_served_stale(self):
+        self.share.permission = "edit"
+        self.share.save()
+        self.assertEqual(access.resolve(self.guest.pk, self.todo_list.pk), access.EDIT)
+        cache.delete(access.version_key(self.todo_list.pk))
+        self.share.delete()
+        self.assertEqual(access.resolve(self.guest.pk, self.todo_list.pk), access.NONE)
+        self.assertEqual(
+            async_to_sync(access.aresolve_many)(self.guest.pk, [self.todo_list.pk]), {self.todo_list.pk: access.NONE}
+        )
+
+    def test_ownership_change_invalidates_cache(self):
+        self.assertEqual(access.resolve(self.owner.pk, self.todo_list.pk), access.OWNER)
+        self.todo_list.owner = self.guest
+        self.todo_list.save()
+        self.assertEqual(access.resolve(self.owner.pk, self.todo_list.pk), access.NONE)
+
+    def test_only_owner_can_share(self):
+        self.share.permission = "edit"
+        self.share.save()
+        self.client.force_authenticate(user=self.guest)
+        User.objects.create_user(
+            email="friend@example.com", password="password", first_name="Friend", last_name="User"
+        )
+        response = self.client.post("/api/shared-todolists/", {
+            "todo_list": self.todo_list.id,
+            "shared_with_email": "friend@example.com",
+            "permission": "edit"
+        })
+        self.assertEqual(response.status_code, 403)
+
+    def test_cannot_move_item_into_foreign_list(self):
+        mine = TodoList.objects.create(title="Mine", owner=self.guest)
+        item = TodoItem.objects.create(todo_list=mine, body="Escape")
+        self.client.force_authenticate(user=self.guest)
+        response = self.client.patch(f"/api/items/{item.id}/", {"todo_list": self.todo_list.id})
+        self.assertEqual(response.status_code, 403)
+
+
+class JWTAuthMiddlewareTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(
+            email="socket@example.com", password="password", first_name="Sock", last_name="Et", is_active=True
+        )
+        self.token = str(AccessToken.for_user(self.user))
+
+    async def authenticate(self, token):
+        seen = {}
+
+        async def app(scope, receive, send):
+            seen["user"] = scope["user"]
+
+        await JWTAuthMiddleware(app)({"type": "websocket", "query_string": f"token={token}".encode()}, None, None)
+        return seen["user"]
+
+    def test_repeat_connects_are_served_from_cache(self):
+        user = async_to_sync(self.authenticate)(self.token)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.get_deferred_fields(), {
+            "password", "last_login", "is_superuser", "is_staff", "date_joined", "updated",
+            "email", "first_name", "last_name",
+        })
+
+        with self.assertNumQueries(0):
+            cached = async_to_sync(self.authenticate)(self.token)
+        self.assertIs(cached, user)
+
+    async def test_invalid_token_is_anonymous(self):
+        self.assertTrue((await self.authenticate("garbage")).is_anonymous)
+
+    async def test_deactivation_evicts_cached_user(self):
+        await self.authenticate(self.token)
+        self.user.is_active = False
+        await self.user.asave()
+        self.assertTrue((await self.authenticate(self.token)).is_anonymous)
+
+    def test_entries_expire_with_token(self):
+        cache = UserCache(max_size=2, ttl=300)
+        cache.set("a", self.user, time.time() - 1)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", self.user, time.time() + 60)
+        cache.set("b", self.user, time.time() + 60)
+        cache.set("c", self.user, time.time() + 60)
+        self.assertIsNone(cache.get("a"))
+        self.assertIs(cache.get("c"), self.user)
+
+
+class BulkItemTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User"
+        )
+        self.guest = User.objects.create_user(
+            email="guest@example.com", password="password", first_name="Guest", last_name="User"
+        )
+        self.todo_list = TodoList.objects.create(title="Bulk", owner=self.owner)
+        SharedTodoList.objects.create(todo_list=self.todo_list, user=self.guest, permission="view")
+        self.client.force_authenticate(user=self.owner)
+        self.channel_layer = get_channel_layer()
+        self.channel_name = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(f"todo_{self.todo_list.id}", self.channel_name)
+
+    def tearDown(self):
+        async_to_sync(self.channel_layer.flush)()
+
+    def receive(self):
+        message = async_to_sync(self.channel_layer.receive)(self.channel_name)
+        return json.loads(message["text"])
+
+    def test_bulk_applies_every_operation_with_one_broadcast(self):
+        keep = TodoItem.objects.create(todo_list=self.todo_list, body="Keep")
+        drop = TodoItem.objects.create(todo_list=self.todo_list, body="Drop")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/items/bulk/", {
+                "todo_list": self.todo_list.id,
+                "create": [{"body": f"New {n}"} for n in range(20)],
+                "update": [{"id": keep.id, "completed": True}],
+                "delete": [drop.id],
+            }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["created"]), 20)
+        self.assertTrue(TodoItem.objects.get(pk=keep.pk).completed)
+        self.assertFalse(TodoItem.objects.filter(pk=drop.pk).exists())
+        self.assertTrue(TodoItemTombstone.objects.filter(item_id=drop.pk).exists())
+
+        message = self.receive()
+        self.assertEqual(message["type"], "batch")
+        self.assertEqual([event["type"] for event in message["events"]].count("todo_created"), 20)
+        self.assertEqual(message["events"][-1], {"type": "todo_deleted", "todo_id": drop.pk})
+
+    @override_settings(TODO_PERMISSION_CACHE_TTL=300)
+    def test_bulk_query_count_does_not_grow_with_size(self):
+        def run(count):
+            with CaptureQueriesContext(connection) as captured:
+                self.client.post("/api/items/bulk/", {
+                    "todo_list": self.todo_list.id,
+                    "create": [{"body": f"Item {n}"} for n in range(count)],
+                }, format="json")
+            return len(captured)
+
+        self.assertEqual(run(5), run(200))
+
+    def test_bulk_ignores_items_from_other_lists(self):
+        other = TodoList.objects.create(title="Other", owner=self.owner)
+        item = TodoItem.objects.create(todo_list=other, body="Elsewhere")
+        response = self.client.post("/api/items/bulk/", {
+            "todo_list": self.todo_list.id, "update": [{"id": item.id, "body": "Hijacked"}], "delete": [item.id],
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(TodoItem.objects.get(pk=item.pk).body, "Elsewhere")
+
+    def test_view_only_users_cannot_bulk_edit(self):
+        self.client.force_authenticate(user=self.guest)
+        response = self.client.post("/api/items/bulk/", {
+            "todo_list": self.todo_list.id, "create": [{"body": "Nope"}],
+        }, format="json")
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(f"/api/lists/{self.todo_list.id}/complete-all/")
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(TODO_BULK_MAX_OPERATIONS=3)
+    def test_operation_cap(self):
+        response = self.client.post("/api/items/bulk/", {
+            "todo_list": self.todo_list.id, "create": [{"body": "x"}] * 4,
+        }, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_complete_all_and_clear_completed(self):
+        items = [TodoItem.objects.create(todo_list=self.todo_list, body=f"Item {n}") for n in range(5)]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"/api/lists/{self.todo_list.id}/complete-all/")
+        self.assertEqual(sorted(response.data["updated"]), [item.pk for item in items])
+        self.assertFalse(TodoItem.objects.filter(todo_list=self.todo_list, completed=False).exists())
+        message = self.receive()
+        self.assertEqual({event["type"] for event in message["events"]}, {"todo_updated"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"/api/lists/{self.todo_list.id}/clear-completed/")
+        self.assertEqual(sorted(response.data["deleted"]), [item.pk for item in items])
+        self.assertFalse(TodoItem.objects.filter(todo_list=self.todo_list).exists())
+        self.assertEqual(len(self.receive()["events"]), 5)
+
+    def test_clear_completed_deletes_by_predicate(self):
+        for n in range(30):
+            TodoItem.objects.create(todo_list=self.todo_list, body=f"Item {n}", completed=n % 2 == 0)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(f"/api/lists/{self.todo_list.id}/clear-completed/")
+        self.assertEqual(len(response.data["deleted"]), 15)
+        [delete] = [query["sql"] for query in captured if query["sql"].startswith("DELETE")]
+        self.assertNotIn(" IN ", delete)
+        self.assertEqual(TodoItem.objects.filter(todo_list=self.todo_list).count(), 15)
+
+    def test_list_actions_hide_foreign_lists(self):
+        stranger = User.objects.create_user(
+            email="stranger@example.com", password="password", first_name="Stranger", last_name="User"
+        )
+        self.client.force_authenticate(user=stranger)
+        response = self.client.post(f"/api/lists/{self.todo_list.id}/clear-completed/")
+        self.assertEqual(response.status_code, 404)
+
+
+class ListCounterTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User"
+        )
+        self.client.force_authenticate(user=self.owner)
+        self.todo_list = TodoList.objects.create(title="Counted", owner=self.owner)
+
+    def counts(self, todo_list=None):
+        todo_list = TodoList.objects.get(pk=(todo_list or self.todo_list).pk)
+        return todo_list.item_count, todo_list.completed_count
+
+    def test_item_changes_move_counters(self):
+        response = self.client.post("/api/items/", {"todo_list": self.todo_list.id, "body": "One"})
+        item_id = response.data["id"]
+        self.client.post("/api/items/", {"todo_list": self.todo_list.id, "body": "Two", "completed": True})
+        self.assertEqual(self.counts(), (2, 1))
+
+        self.client.patch(f"/api/items/{item_id}/", {"completed": True})
+        self.assertEqual(self.counts(), (2, 2))
+
+        other = TodoList.objects.create(title="Other", owner=self.owner)
+        self.client.patch(f"/api/items/{item_id}/", {"todo_list": other.id})
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertEqual(self.counts(other), (1, 1))
+
+        self.client.delete(f"/api/items/{item_id}/")
+        self.assertEqual(self.counts(other), (0, 0))
+
+    def test_bulk_paths_move_counters(self):
+        keep = TodoItem.objects.create(todo_list=self.todo_list, body="Keep")
+        drop = TodoItem.objects.create(todo_list=self.todo_list, body="Drop", completed=True)
+        self.client.post("/api/items/bulk/", {
+            "todo_list": self.todo_list.id,
+            "create": [{"body": "New"}, {"body": "Done", "completed": True}],
+            "update": [{"id": keep.id, "completed": True}],
+            "delete": [drop.id],
+        }, format="json")
+        self.assertEqual(self.counts(), (3, 2))
+
+        self.client.post(f"/api/lists/{self.todo_list.id}/complete-all/")
+        self.assertEqual(self.counts(), (3, 3))
+        self.client.post(f"/api/lists/{self.todo_list.id}/clear-completed/")
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_recount_repairs_drift(self):
+        TodoItem.objects.create(todo_list=self.todo_list, body="One", completed=True)
+        TodoItem.objects.create(todo_list=self.todo_list, body="Two")
+        TodoList.objects.update(item_count=40, completed_count=7)
+        call_command("recount_items", stdout=StringIO())
+        self.assertEqual(self.counts(), (2, 1))
+
+    def test_counters_are_serialized_read_only(self):
+        TodoItem.objects.create(todo_list=self.todo_list, body="One")
+        response = self.client.patch(f"/api/lists/{self.todo_list.id}/", {"item_count": 99})
+        self.assertEqual(response.data["item_count"], 1)
+        response = self.client.get("/api/lists/", {"fields": "id,item_count,completed_count"})
+        self.assertEqual(response.data, [{"id": self.todo_list.id, "item_count": 1, "completed_count": 0}])
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User"
+        )
+        self.guest = User.objects.create_user(
+            email="guest@example.com", password="password", first_name="Guest", last_name="User"
+        )
+        self.client.force_authenticate(user=self.owner)
+        self.todo_list = TodoList.objects.create(title="Polled", owner=self.owner)
+        self.item = TodoItem.objects.create(todo_list=self.todo_list, body="One")
+        self.share = SharedTodoList.objects.create(todo_list=self.todo_list, user=self.guest, permission="view")
+
+    def revalidate(self, path, params=None, **headers):
+        first = self.client.get(path, params)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("no-cache", first["Cache-Control"])
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(path, params, HTTP_IF_NONE_MATCH=first["ETag"], **headers)
+        return first, second, len(queries)
+
+    @override_settings(TODO_PERMISSION_CACHE_TTL=300)
+    def test_unchanged_resources_answer_304(self):
+        for path, expected in [
+            # Response-cache hits revalidate without touching the database.
+            ("/api/lists/", 0),
+            (f"/api/lists/{self.todo_list.id}/", 0),
+            (f"/api/items/?todo_list={self.todo_list.id}", 1),
+            (f"/api/items/{self.item.id}/", 1),
+            ("/api/shared-todolists/", 0),
+            (f"/api/shared-todolists/{self.share.id}/", 1),
+        ]:
+            first, second, queries = self.revalidate(path)
+            self.assertEqual(second.status_code, 304, path)
+            self.assertEqual(second["ETag"], first["ETag"], path)
+            self.assertEqual(queries, expected, path)
+
+    def test_renamed_users_change_the_shares_etag(self):
+        for ttl in (0, 300):
+            with self.subTest(response_cache=ttl), override_settings(TODO_RESPONSE_CACHE_TTL=ttl):
+                for user in (self.guest, self.owner):
+                    first = self.client.get("/api/shared-todolists/")
+                    user.first_name += "x"
+                    user.save()
+                    second = self.client.get("/api/shared-todolists/", HTTP_IF_NONE_MATCH=first["ETag"])
+                    self.assertEqual(second.status_code, 200)
+                    self.assertContains(second, user.first_name)
+
+    @override_settings(TODO_RESPONSE_CACHE_TTL=0, TODO_PERMISSION_CACHE_TTL=300)
+    def test_uncached_revalidation_costs_one_query(self):
+        for path in ["/api/lists/", f"/api/lists/{self.todo_list.id}/", "/api/shared-todolists/"]:
+            first, second, queries = self.revalidate(path)
+            self.assertEqual(second.status_code, 304, path)
+            self.assertEqual(queries, 1, path)
+
+    def test_item_changes_change_list_etags(self):
+        paths = ["/api/lists/", f"/api/lists/{self.todo_list.id}/", f"/api/items/?todo_list={self.todo_list.id}"]
+        before = {path: self.client.get(path)["ETag"] for path in paths}
+        self.client.patch(f"/api/items/{self.item.id}/", {"completed": True})
+        for path in paths:
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=before[path])
+            self.assertEqual(response.status_code, 200, path)
+            self.assertNotEqual(response["ETag"], before[path], path)
+
+    @override_settings(TODO_RESPONSE_CACHE_TTL=0)
+    def test_moving_an_item_out_changes_old_list_etags(self):
+        other = TodoList.objects.create(title="Other", owner=self.owner)
+        paths = [f"/api/lists/{self.todo_list.id}/", f"/api/items/?todo_list={self.todo_list.id}"]
+        before = {path: self.client.get(path)["ETag"] for path in paths}
+        self.client.patch(f"/api/items/{self.item.id}/", {"todo_list": other.id})
+        for path in paths:
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=before[path])
+            self.assertEqual(response.status_code, 200, path)
+            self.assertNotIn(b'"body":"One"', response.content.replace(b" ", b""), path)
+
+    def test_deletions_and_permission_changes_change_etags(self):
+        other = TodoItem.objects.create(todo_list=self.todo_list, body="Two")
+        etag = self.client.get(f"/api/items/?todo_list={self.todo_list.id}")["ETag"]
+        other.delete()
+        response = self.client.get(f"/api/items/?todo_list={self.todo_list.id}", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = self.client.get("/api/shared-todolists/")["ETag"]
+        self.client.patch(f"/api/shared-todolists/{self.share.id}/", {"permission": "edit"})
+        response = self.client.get("/api/shared-todolists/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etags_differ_per_user_and_query(self):
+        owner_etag = self.client.get(f"/api/lists/{self.todo_list.id}/")["ETag"]
+        fields_etag = self.client.get(f"/api/lists/{self.todo_list.id}/", {"fields": "id"})["ETag"]
+        self.client.force_authenticate(user=self.guest)
+        guest_etag = self.client.get(f"/api/lists/{self.todo_list.id}/")["ETag"]
+        self.assertEqual(len({owner_etag, fields_etag, guest_etag}), 3)
+
+    def test_if_modified_since_on_detail(self):
+        response = self.client.get(f"/api/items/{self.item.id}/")
+        response = self.client.get(
+            f"/api/items/{self.item.id}/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_hidden_resources_are_not_revalidated(self):
+        stranger = User.objects.create_user(
+            email="stranger@example.com", password="password", first_name="Stranger", last_name="User"
+        )
+        etag = self.client.get(f"/api/lists/{self.todo_list.id}/")["ETag"]
+        self.client.force_authenticate(user=stranger)
+        response = self.client.get(f"/api/lists/{self.todo_list.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("ETag", response)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User"
+        )
+        self.guest = User.objects.create_user(
+            email="guest@example.com", password="password", first_name="Guest", last_name="User"
+        )
+        self.client.force_authenticate(user=self.owner)
+        self.todo_list = TodoList.objects.create(title="Cached", owner=self.owner)
+
+    def get(self, path, user=None):
+        self.client.force_authenticate(user=user or self.owner)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    @override_settings(TODO_PERMISSION_CACHE_TTL=300)
+    def test_repeated_reads_are_served_from_cache(self):
+        for path in ["/api/lists/", f"/api/lists/{self.todo_list.id}/", "/api/shared-todolists/",
+                     f"/api/lists/{self.todo_list.id}/permission/"]:
+            first, _ = self.get(path)
+            second, queries = self.get(path)
+            self.assertEqual(queries, 0, path)
+            self.assertEqual(second.data, first.data, path)
+        self.assertEqual(respcache.stats()["hits"], 4)
+
+    def test_item_writes_invalidate_owner_and_audience(self):
+        SharedTodoList.objects.create(todo_list=self.todo_list, user=self.guest, permission="edit")
+        self.get("/api/lists/")
+        self.get("/api/shared-todolists/", user=self.guest)
+        self.client.force_authenticate(user=self.guest)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/items/", {"todo_list": self.todo_list.id, "body": "Fresh"})
+
+        response, _ = self.get("/api/lists/")
+        self.assertEqual([todo["body"] for todo in response.data[0]["todos"]], ["Fresh"])
+        response, _ = self.get("/api/shared-todolists/", user=self.guest)
+        self.assertEqual(response.data[0]["list"]["item_count"], 1)
+
+    def test_invalidation_cost_does_not_grow_with_audience(self):
+        def cache_calls():
+            with mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many, \
+                    mock.patch.object(cache, "set_many", wraps=cache.set_many) as set_many, \
+                    mock.patch.object(cache, "incr", wraps=cache.incr) as incr:
+                respcache.invalidate_list(self.todo_list.id)
+            return get_many.call_count + set_many.call_count + incr.call_count
+
+        baseline = cache_calls()
+        for n in range(5):
+            user = User.objects.create_user(
+                email=f"reader{n}@example.com", password="password", first_name="Reader", last_name=str(n)
+            )
+            SharedTodoList.objects.create(todo_list=self.todo_list, user=user, permission="view")
+        self.assertEqual(cache_calls(), baseline)
+
+    def test_bulk_writes_invalidate(self):
+        self.get(f"/api/lists/{self.todo_list.id}/")
+        self.client.post("/api/items/bulk/", {
+            "todo_list": self.todo_list.id, "create": [{"body": "A"}, {"body": "B"}],
+        }, format="json")
+        response, _ = self.get(f"/api/lists/{self.todo_list.id}/")
+        self.assertEqual(response.data["item_count"], 2)
+
+    def test_revoked_share_is_not_served_from_cache(self):
+        share = SharedTodoList.objects.create(todo_list=self.todo_list, user=self.guest, permission="view")
+        self.get(f"/api/lists/{self.todo_list.id}/", user=self.guest)
+        self.get(f"/api/lists/{self.todo_list.id}/permission/", user=self.guest)
+        share.delete()
+        self.assertEqual(self.client.get(f"/api/lists/{self.todo_list.id}/").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/lists/{self.todo_list.id}/permission/").status_code, 403)
+        response, _ = self.get("/api/shared-todolists/", user=self.guest)
+        self.assertEqual(response.data, [])
+
+    def test_stats_are_staff_only(self):
+        self.assertEqual(self.client.get("/api/cache-stats/").status_code, 403)
+        self.owner.is_staff = True
+        self.owner.save()
+        self.get("/api/lists/")
+        self.get("/api/lists/")
+        response = self.client.get("/api/cache-stats/")
+        self.assertEqual(response.data["hits"], 1)
+        self.assertEqual(response.data["misses"], 1)
+        self.assertEqual(response.data["hit_rate"], 0.5)
+        self.assertIsNotNone(response.data["evictions"])
+
+
+@override_settings(TODO_RESPONSE_CACHE_TTL=0)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User", is_active=True
+        )
+        self.guest = User.objects.create_user(
+            email="guest@example.com", password="password", first_name="Guest", last_name="User", is_active=True
+        )
+        self.todo_list = TodoList.objects.create(title="Async", owner=self.owner)
+        TodoItem.objects.create(todo_list=self.todo_list, body="First")
+        SharedTodoList.objects.create(todo_list=self.todo_list, user=self.guest, permission="view")
+        self.paths = [
+            "/api/lists/",
+            "/api/lists/?preview=1&fields=id,todos",
+            f"/api/lists/{self.todo_list.id}/",
+            f"/api/lists/{self.todo_list.id}/permission/",
+        ]
+
+    def auth(self, user):
+        return {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+
+    async def get(self, path, use_async, user=None, **headers):
+        with override_settings(ROOT_URLCONF=mixedload.urlconf(use_async)):
+            return await self.async_client.get(path, headers={**self.auth(user or self.owner), **headers})
+
+    async def test_reads_match_sync_views(self):
+        for user in [self.owner, self.guest]:
+            for path in self.paths[user == self.guest and 2:]:
+                expected = await self.get(path, False, user)
+                response = await self.get(path, True, user)
+                self.assertEqual(response.status_code, 200, path)
+                # Served by the async view, not by the sync fallback.
+                self.assertNotIsInstance(response, Response, path)
+                self.assertEqual(response.json(), expected.json(), path)
+                self.assertEqual(response.get("ETag"), expected.get("ETag"), path)
+
+    async def test_unchanged_reads_return_304(self):
+        for path in self.paths[:3]:
+            response = await self.get(path, True)
+            response = await self.get(path, True, If_None_Match=response["ETag"])
+            self.assertEqual(response.status_code, 304, path)
+
+    async def test_other_requests_fall_back_to_sync_views(self):
+        response = await self.get("/api/lists/?page_size=1", True)
+        self.assertIn("results", response.json())
+
+        outsider = await User.objects.acreate(email="out@example.com", first_name="Out", last_name="Sider", is_active=True)
+        response = await self.get(f"/api/lists/{self.todo_list.id}/", True, outsider)
+        self.assertEqual(response.status_code, 404)
+        response = await self.get(f"/api/lists/{self.todo_list.id}/permission/", True, outsider)
+        self.assertEqual(response.status_code, 403)
+
+        with override_settings(ROOT_URLCONF=mixedload.urlconf(True)):
+            response = await self.async_client.get("/api/lists/")
+            self.assertEqual(response.status_code, 401)
+            response = await self.async_client.post(
+                "/api/lists/", {"title": "Posted"}, content_type="application/json", headers=self.auth(self.owner)
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await TodoList.objects.filter(title="Posted", owner=self.owner).aexists())
+
+    async def test_bulk_deactivation_takes_effect_at_once(self):
+        token = self.auth(self.owner)
+        self.assertEqual((await self.get("/api/lists/", True, **token)).status_code, 200)
+        await User.objects.filter(pk=self.owner.pk).aupdate(is_active=False)
+        self.assertEqual((await self.get("/api/lists/", True, **token)).status_code, 401)
+
+    @override_settings(TODO_RESPONSE_CACHE_TTL=300)
+    async def test_sync_and_async_views_share_cache_entries(self):
+        await cache.aclear()
+        path = f"/api/lists/{self.todo_list.id}/"
+        expected = await self.get(path, False)
+        response = await self.get(path, True)
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(response["ETag"], expected["ETag"])
+        self.assertEqual((await sync_to_async(respcache.stats)())["hits"], 1)
+
+
+@override_settings(TODO_WS_BATCH_WINDOW_MS=0)
+class WebSocketPermissionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User"
+        )
+        self.guest = User.objects.create_user(
+            email="guest@example.com", password="password", first_name="Guest", last_name="User"
+        )
+        self.todo_list = TodoList.objects.create(title="Guarded", owner=self.owner)
+        self.share = SharedTodoList.objects.create(todo_list=self.todo_list, user=self.guest, permission="edit")
+
+    async def connect(self, user, list_id=None):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/todo/{list_id or self.todo_list.id}/"
+        )
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    def commit(self, change):
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+
+    async def test_users_without_access_are_rejected(self):
+        stranger = await User.objects.acreate(email="stranger@example.com", first_name="S", last_name="T")
+        _, connected = await self.connect(stranger)
+        self.assertFalse(connected)
+        _, connected = await self.connect(self.owner, list_id="abc")
+        self.assertFalse(connected)
+
+    async def test_view_only_socket_receives_pushed_events(self):
+        self.share.permission = "view"
+        await self.share.asave()
+        communicator, connected = await self.connect(self.guest)
+        self.assertTrue(connected)
+
+        await sync_to_async(self.commit)(
+            lambda: TodoItem.objects.create(todo_list=self.todo_list, body="Pushed")
+        )
+        self.assertEqual((await communicator.receive_json_from())["todo"]["body"], "Pushed")
+        await communicator.disconnect()
+
+    async def test_revoked_share_closes_socket(self):
+        communicator, _ = await self.connect(self.guest)
+        await sync_to_async(self.commit)(self.share.delete)
+        self.assertEqual(await communicator.receive_output(), {"type": "websocket.close", "code": 4403})
+
+    @override_settings(TODO_PERMISSION_CACHE_TTL=300)
+    async def test_revocation_made_in_another_process_closes_socket(self):
+        communicator, _ = await self.connect(self.guest)
+        # That process's cache invalidation never reaches this one's cache.
+        with mock.patch.object(access, "invalidate"):
+            await sync_to_async(self.commit)(self.share.delete)
+        self.assertEqual(await access.aresolve(self.guest.pk, self.todo_list.pk), "edit")
+        self.assertEqual(await communicator.receive_output(), {"type": "websocket.close", "code": 4403})
+
+    async def test_downgraded_share_is_pushed_to_socket(self):
+        communicator, _ = await self.connect(self.guest)
+        owner_socket, _ = await self.connect(self.owner)
+        self.share.permission = "view"
+        await sync_to_async(self.commit)(self.share.save)
+
+        self.assertEqual(await communicator.receive_json_from(), {"type": "permission", "permission": "view"})
+        self.assertTrue(await owner_socket.receive_nothing())
+        await communicator.disconnect()
+        await owner_socket.disconnect()
+
+    async def test_deleted_list_closes_every_socket(self):
+        sockets = [(await self.connect(user))[0] for user in [self.owner, self.guest]]
+        await sync_to_async(self.commit)(self.todo_list.delete)
+        for communicator in sockets:
+            self.assertEqual(await communicator.receive_output(), {"type": "websocket.close", "code": 4403})
+
+
+@override_settings(TODO_WS_BATCH_WINDOW_MS=0)
+class MultiplexSocketTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", password="password", first_name="Other", last_name="User"
+        )
+        self.mine = TodoList.objects.create(title="Mine", owner=self.owner)
+        self.also_mine = TodoList.objects.create(title="Also mine", owner=self.owner)
+        self.shared = TodoList.objects.create(title="Shared", owner=self.other)
+        self.private = TodoList.objects.create(title="Private", owner=self.other)
+        self.share = SharedTodoList.objects.create(todo_list=self.shared, user=self.owner, permission="view")
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/todo/")
+        communicator.scope["user"] = self.owner
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def subscribe(self, communicator, *lists, **extra):
+        await communicator.send_json_to({"type": "subscribe", "lists": [todo_list.id for todo_list in lists], **extra})
+        return await communicator.receive_json_from()
+
+    def commit(self, change):
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+
+    async def test_subscribe_reports_granted_and_rejected_lists(self):
+        communicator = await self.connect()
+        reply = await self.subscribe(communicator, self.mine, self.shared, self.private)
+        self.assertEqual(reply, {
+            "type": "subscribed",
+            "lists": [
+                {"list_id": self.mine.id, "permission": "owner"},
+                {"list_id": self.shared.id, "permission": "view"},
+            ],
+            "rejected": [{"list_id": self.private.id, "reason": "forbidden"}],
+        })
+        await communicator.disconnect()
+
+    async def test_events_are_tagged_with_their_list(self):
+        communicator = await self.connect()
+        await self.subscribe(communicator, self.mine, self.also_mine)
+        await sync_to_async(self.commit)(
+            lambda: TodoItem.objects.create(todo_list=self.also_mine, body="Tagged")
+        )
+        frame = await communicator.receive_json_from()
+        self.assertEqual((frame["type"], frame["list_id"]), ("batch", self.also_mine.id))
+        self.assertEqual(frame["events"][0]["todo"]["body"], "Tagged")
+
+        await communicator.send_json_to({"type": "unsubscribe", "lists": [self.also_mine.id]})
+        self.assertEqual(
+            await communicator.receive_json_from(), {"type": "unsubscribed", "lists": [self.also_mine.id]}
+        )
+        await sync_to_async(self.commit)(
+            lambda: TodoItem.objects.create(todo_list=self.also_mine, body="Unseen")
+        )
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    @override_settings(TODO_WS_MAX_SUBSCRIPTIONS=1)
+    async def test_subscriptions_are_capped(self):
+        communicator = await self.connect()
+        reply = await self.subscribe(communicator, self.mine, self.also_mine)
+        self.assertEqual([entry["list_id"] for entry in reply["lists"]], [self.mine.id])
+        self.assertEqual(reply["rejected"], [{"list_id": self.also_mine.id, "reason": "limit"}])
+        await communicator.disconnect()
+
+    async def test_resume_replays_per_list(self):
+        for body in ["One", "Two"]:
+            await sync_to_async(self.commit)(
+                lambda body=body: TodoItem.objects.create(todo_list=self.mine, body=body)
+            )
+        communicator = await self.connect()
+        await self.subscribe(communicator, self.mine, since={str(self.mine.id): 1})
+        frame = await communicator.receive_json_from()
+        self.assertEqual(frame["list_id"], self.mine.id)
+        self.assertEqual([event["todo"]["body"] for event in frame["events"]], ["Two"])
+        await communicator.disconnect()
+
+    async def test_revoked_share_ends_only_that_subscription(self):
+        communicator = await self.connect()
+        await self.subscribe(communicator, self.mine, self.shared)
+        await sync_to_async(self.commit)(self.share.delete)
+        self.assertEqual(await communicator.receive_json_from(), {
+            "type": "unsubscribed", "lists": [self.shared.id], "reason": "forbidden",
+        })
+
+        await sync_to_async(self.commit)(
+            lambda: TodoItem.objects.create(todo_list=self.mine, body="Still here")
+        )
+        self.assertEqual((await communicator.receive_json_from())["list_id"], self.mine.id)
+        await communicator.disconnect()
+
+    async def test_malformed_message_gets_error(self):
+        communicator = await self.connect()
+        await communicator.send_to(text_data="not json")
+        self.assertEqual((await communicator.receive_json_from())["type"], "error")
+        await communicator.disconnect()
+
+    @override_settings(TODO_PERMISSION_CACHE_TTL=300)
+    def test_permissions_are_checked_in_one_query(self):
+        list_ids = [self.mine.id, self.shared.id, self.private.id]
+        with self.assertNumQueries(1):
+            permissions = async_to_sync(access.aresolve_many)(self.owner.pk, list_ids)
+        self.assertEqual(permissions, {self.mine.id: "owner", self.shared.id: "view", self.private.id: "none"})
+        with self.assertNumQueries(0):
+            async_to_sync(access.aresolve_many)(self.owner.pk, list_ids)
+
+
+@override_settings(TODO_WS_BATCH_WINDOW_MS=0, TODO_WS_OUTBOX_SIZE=2)
+class SlowConsumerTests(TestCase):
+    """Drive a consumer whose client stops acknowledging frames.
+
+    Sends never block, as under Daphne, which buffers them in Twisted.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="slow@example.com", password="password", first_name="Slow", last_name="Reader"
+        )
+        self.list_id = 7
+
+    async def open(self, consumer_class=consumers.TodoConsumer):
+        consumer = consumer_class()
+        consumer.scope = {"user": self.user}
+        consumer.channel_layer = get_channel_layer()
+        consumer.channel_name = f"test.slow!{id(consumer)}"
+        self.sent = []
+
+        async def base_send(message):
+            self.sent.append(message)
+
+        consumer.base_send = base_send
+        consumer.setup()
+        await consumer.accept_encoding()
+        consumer.stream = await consumer.open_stream(self.list_id, access.OWNER)
+        return consumer
+
+    async def event(self, consumer, todo_id, seq):
+        payload = {"type": "todo_updated", "todo": {"id": todo_id, "version": seq}}
+        await consumer.todo_event({"list_id": self.list_id, **broadcast.event_message(todo_id, seq, payload)})
+        # Let the writer send what it has.
+        await asyncio.sleep(0)
+
+    async def fill(self, consumer):
+        # Two frames written and never acknowledged fill the window.
+        for seq, todo_id in enumerate([1, 2], start=1):
+            await self.event(consumer, todo_id, seq)
+        self.assertEqual(len(consumer.outbox), 0)
+        self.assertEqual(consumer.depth(), 2)
+
+    async def frames(self):
+        for _ in range(20):
+            await asyncio.sleep(0)
+        return [json.loads(message["text"]) for message in self.sent if message["type"] == "websocket.send"]
+
+    @override_settings(TODO_WS_OVERFLOW_POLICY="coalesce")
+    async def test_coalesce_collapses_to_latest_state_per_item(self):
+        consumer = await self.open()
+        await self.fill(consumer)
+        with self.assertLogs("todo", "WARNING"):
+            for seq, todo_id in [(3, 1), (4, 2), (5, 1)]:
+                await self.event(consumer, todo_id, seq)
+        self.assertEqual(consumer.overflows, 1)
+        stats = next(entry for entry in outbox_stats(top=None)["deepest"] if entry["channel"] == consumer.channel_name)
+        self.assertEqual((stats["depth"], stats["high_water"]), (2, 2))
+        self.assertEqual([frame["seq"] for frame in await self.frames()], [1, 2])
+
+        await consumer.receive(text_data=json.dumps({"type": "ack", "seq": 2}))
+        frames = await self.frames()
+        self.assertEqual(frames[2]["type"], "batch")
+        self.assertEqual([event["seq"] for event in frames[2]["events"]], [4, 5])
+        self.assertEqual(consumer.depth(), 1)
+        await consumer.disconnect(1000)
+
+    async def test_acks_keep_a_steady_client_within_the_window(self):
+        consumer = await self.open()
+        for seq in range(1, 11):
+            await self.event(consumer, seq, seq)
+            await consumer.receive(text_data=json.dumps({"type": "ack", "seq": seq}))
+        self.assertEqual((consumer.depth(), consumer.overflows), (0, 0))
+        self.assertEqual(len(await self.frames()), 10)
+        await consumer.disconnect(1000)
+
+    async def test_multiplexed_acks_name_the_list(self):
+        consumer = await self.open(consumers.MultiplexTodoConsumer)
+        await self.fill(consumer)
+        await consumer.receive(text_data=json.dumps({"type": "ack", "list_id": 8, "seq": 2}))
+        self.assertEqual(consumer.depth(), 2)
+        await consumer.receive(text_data=json.dumps({"type": "ack", "list_id": self.list_id, "seq": 1}))
+        self.assertEqual(consumer.depth(), 1)
+        await consumer.disconnect(1000)
+
+    @override_settings(TODO_WS_OVERFLOW_POLICY="coalesce", TODO_WS_MAX_PENDING=1)
+    async def test_coalesce_falls_back_to_resync(self):
+        consumer = await self.open()
+        await self.fill(consumer)
+        with self.assertLogs("todo", "WARNING"):
+            await self.event(consumer, 1, 3)
+            await self.event(consumer, 2, 4)
+        frames = await self.frames()
+        self.assertEqual(frames[-1], {"type": "resync"})
+        await consumer.disconnect(1000)
+
+    @override_settings(TODO_WS_OVERFLOW_POLICY="resync")
+    async def test_resync_drops_events_and_marks_the_list(self):
+        consumer = await self.open(consumers.MultiplexTodoConsumer)
+        await self.fill(consumer)
+        with self.assertLogs("todo", "WARNING"):
+            await self.event(consumer, 3, 3)
+        await self.event(consumer, 4, 4)
+        self.assertTrue(consumer.streams[self.list_id].stale)
+
+        frames = await self.frames()
+        self.assertEqual(len(frames), 3)
+        self.assertEqual(frames[-1], {"type": "resync", "list_id": self.list_id})
+        await consumer.disconnect(1000)
+
+    @override_settings(TODO_WS_OVERFLOW_POLICY="close")
+    async def test_close_policy_closes_the_socket(self):
+        consumer = await self.open()
+        await self.fill(consumer)
+        with self.assertLogs("todo", "WARNING"):
+            await self.event(consumer, 3, 3)
+        self.assertEqual(self.sent[-1], {"type": "websocket.close", "code": consumers.CLOSE_SLOW_CONSUMER})
+        self.assertEqual(consumer.streams, {})
+        await consumer.disconnect(consumers.CLOSE_SLOW_CONSUMER)
+
+    def test_stats_are_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get("/api/ws-stats/").status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = client.get("/api/ws-stats/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(response.data), {"connections", "queued_frames", "max_depth", "overflows", "deepest"}
+        )
+
+    @override_settings(TODO_WS_OVERFLOW_POLICY="drop")
+    def test_unknown_policy_fails_the_system_check(self):
+        errors = checks.check_overflow_policy(None)
+        self.assertEqual([error.id for error in errors], ["todo.E001"])
+
+
+@override_settings(TODO_WS_PING_INTERVAL=0.05, TODO_WS_IDLE_TIMEOUT=0.2)
+class HeartbeatTests(TestCase):
+    def setUp(self):
+        consumers.connections.clear()
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="password", first_name="Owner", last_name="User"
+        )
+        self.todo_list = TodoList.objects.create(title="Dashboard", owner=self.owner)
+
+    def members(self):
+        return set(get_channel_layer().groups.get(broadcast.group_name(self.todo_list.id), {}))
+
+    async def test_silent_socket_is_reaped(self):
+        before = self.members()
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/todo/{self.todo_list.id}/")
+        communicator.scope["user"] = self.owner
+        with self.assertLogs("todo.consumers", "INFO") as logs:
+            await communicator.connect()
+            (channel,) = self.members() - before
+
+            # Answering pings keeps the socket open past the idle timeout.
+            for _ in range(6):
+                self.assertEqual(await communicator.receive_json_from(timeout=1), {"type": "ping"})
+                await communicator.send_json_to({"type": "pong"})
+
+            while True:
+                message = await communicator.receive_output(timeout=1)
+                if message["type"] == "websocket.close":
+                    break
+        self.assertEqual(message["code"], consumers.CLOSE_IDLE)
+        self.assertNotIn(channel, self.members())
+        self.assertEqual(len(consumers.connections), 0)
+        self.assertTrue(any("ws.connect" in line for line in logs.output))
+        self.assertTrue(any("ws.reap" in line for line in logs.output))
+        await communicator.disconnect()
+
+    def test_consumer_keeps_only_the_user_id(self):
+        consumer = consumers.TodoConsumer()
+        consumer.scope = {"user": self.owner}
+        consumer.setup()
+        self.assertEqual(consumer.user_id, self.owner.pk)
+        self.assertNotIn("user", consumer.scope)
+        self.assertEqual(consumer.outbox, ())
+        self.assertIsNone(consumer.writer)
+
+    def test_log_throttle_counts_what_it_drops(self):
+        throttle = consumers.LogThrottle()
+        self.assertEqual([throttle.allow("ws.connect", 2) for _ in range(4)],
+                         [(True, 0), (True, 0), (False, 0), (False, 0)])
+        self.assertEqual(throttle.allow("ws.reject", 2), (True, 0))
+        throttle.windows["ws.connect"][0] -= 1
+        self.assertEqual(throttle.allow("ws.connect", 2), (True, 2))
+
+    @override_settings(TODO_WS_IDLE_TIMEOUT=0.05)
+    def test_idle_timeout_must_outlast_the_ping_interval(self):
+        self.assertEqual([error.id for error in checks.check_heartbeat(None)], ["todo.E002"])
+
+
+class RelayChannelLayerTests(TestCase):
+    def setUp(self):
+        MemoryBus.hubs.pop("relay-test", None)
+        # Two layers on one bus stand in for two worker processes.
+        self.first, self.second = [
+            RelayChannelLayer(bus="todo.layers.MemoryBus", bus_options={"name": "relay-test"}) for _ in range(2)
+        ]
+
+    async def join(self, layer, count, group="todo_1"):
+        channels = [await layer.new_channel() for _ in range(count)]
+        for channel in channels:
+            await layer.group_add(group, channel)
+        return channels
+
+    async def test_group_send_crosses_the_bus_once(self):
+        first = await self.join(self.first, 3)
+        second = await self.join(self.second, 2)
+        await self.first.group_send("todo_1", {"type": "todo.event", "seq": 1, "bytes": b"\x81"})
+
+        self.assertEqual(self.first.bus.published, 1)
+        self.assertEqual(len(MemoryBus.hubs["relay-test"][self.first.group_topic("todo_1")]), 2)
+        for layer, channels in [(self.first, first), (self.second, second)]:
+            for channel in channels:
+                self.assertEqual(
+                    await layer.receive(channel), {"type": "todo.event", "seq": 1, "bytes": b"\x81"}
+                )
+
+    async def test_channel_names_have_one_separator(self):
+        channel = await self.first.new_channel()
+        self.assertRegex(channel, rf"^specific\.{self.first.process}![a-zA-Z]{{12}}$")
+        self.assertEqual(self.first.owner(channel), self.first.process)
+
+    def test_sync_publishes_share_one_pool(self):
+        bus = RedisBus("redis://redis.invalid:6379/0")
+        with mock.patch("todo.layers.Redis.from_url") as from_url:
+            for _ in range(3):
+                async_to_sync(bus.publish)("topic", b"data")
+        from_url.assert_called_once_with("redis://redis.invalid:6379/0")
+        self.assertEqual(from_url.return_value.publish.call_count, 3)
+
+    async def test_direct_send_reaches_the_owning_process(self):
+        channel = await self.second.new_channel()
+        await self.first.send(channel, {"type": "hello"})
+        self.assertEqual(await self.second.receive(channel), {"type": "hello"})
+
+    async def test_process_unsubscribes_with_its_last_member(self):
+        channels = await self.join(self.first, 2)
+        await self.join(self.second, 1)
+        topic = self.first.group_topic("todo_1")
+        for channel in channels:
+            await self.first.group_discard("todo_1", channel)
+        self.assertEqual(len(MemoryBus.hubs["relay-test"][topic]), 1)
+
+        await self.first.group_send("todo_1", {"type": "todo.event"})
+        self.assertEqual(self.first.channels, {})
+
+    @override_settings(
+        TODO_WS_BATCH_WINDOW_MS=0,
+        CHANNEL_LAYERS={"default": {
+            "BACKEND": "todo.layers.RelayChannelLayer",
+            "CONFIG": {"bus": "todo.layers.MemoryBus", "bus_options": {"name": "relay-consumer-test"}},
+        }},
+    )
+    async def test_consumer_receives_events_through_relay(self):
+        user = await User.objects.acreate(email="relay@example.com", first_name="Re", last_name="Lay")
+        todo_list = await TodoList.objects.acreate(title="Relayed", owner=user)
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/todo/{todo_list.id}/")
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await get_channel_layer().group_send(
+            broadcast.group_name(todo_list.id),
+            {"type": "todo.event", "list_id": todo_list.id, **broadcast.event_message(1, 1, {"type": "todo_created"})},
+        )
+        self.assertEqual(await communicator.receive_json_from(), {"type": "todo_created", "seq": 1})
+        await communicator.disconnect()
+
+
+class ChannelLayerShardingTests(TestCase):
+    names = [f"todo_{n}" for n in range(10000)]
+
+    def test_groups_spread_evenly_and_move_minimally(self):
+        four = [shard_for(name, 4) for name in self.names]
+        for shard in range(4):
+            self.assertAlmostEqual(four.count(shard) / len(self.names), 0.25, delta=0.03)
+
+        five = [shard_for(name, 5) for name in self.names]
+        moved = [(old, new) for old, new in zip(four, five) if old != new]
+        # Only about 1/5 of the groups move, and only onto the new shard.
+        self.assertAlmostEqual(len(moved) / len(self.names), 0.2, delta=0.03)
+        self.assertEqual({new for _, new in moved}, {4})
+
+    def test_redis_layer_shards_by_consistent_hash(self):
+        layer = ShardedRedisChannelLayer(hosts=["redis://one:6379", "redis://two:6379"])
+        self.assertEqual(
+            [layer.consistent_hash(name) for name in self.names[:50]],
+            [shard_for(name, 2) for name in self.names[:50]],
+        )
+
+    def layers(self, hosts, **options):
+        return {"default": {
+            "BACKEND": "todo.layers.ShardedRedisChannelLayer",
+            "CONFIG": {"hosts": [{"address": host, "max_connections": 10} for host in hosts], **options},
+        }}
+
+    def test_startup_validation(self):
+        check_channel_layers(self.layers(["redis://one:6379", "rediss://two:6380"], capacity=50))
+        for layers in [
+            self.layers([]),
+            self.layers(["http://one:6379"]),
+            self.layers(["redis://one:6379", "redis://one:6379"]),
+            self.layers(["redis://one:6379"], capacity=0),
+            self.layers(["redis://one:6379"], expiry=600, group_expiry=60),
+            {"default": {
+                "BACKEND": "todo.layers.RelayChannelLayer",
+                "CONFIG": {"bus_options": {"urls": ["redis://one:6379"], "max_connections": 0}},
+            }},
+        ]:
+            with self.assertRaises(ImproperlyConfigured):
+                check_channel_layers(layers)
+
+    def test_deploy_check_warns_about_per_process_cache(self):
+        with override_settings(USE_REDIS=True, CACHE_URL=""):
+            self.assertEqual([warning.id for warning in checks.check_cache_spans_processes(None)], ["todo.W002"])
+        with override_settings(USE_REDIS=True, CACHE_URL="redis://cache:6379/1"):
+            self.assertEqual(checks.check_cache_spans_processes(None), [])
+
+    def test_deploy_check_warns_about_in_memory_layer(self):
+        out = StringIO()
+        call_command("check", "--deploy", stdout=out, stderr=out)
+        self.assertIn("todo.W001", out.getvalue())
@@ -1,6 +1,10 @@
 # todo/urls.py
 from rest_framework.routers import DefaultRouter
-from .views import TodoListViewSet, TodoItemViewSet, SharedTodoListViewSet, TodoListPermissionView
+from .views import (
+    TodoListViewSet, TodoItemViewSet, SharedTodoListViewSet, TodoListPermissionView, ResponseCacheStatsView,
+    WebSocketStatsView, ItemSearchView,
+)
+from django.conf import settings
 from django.urls import path
 
 
@@ -12,5 +16,13 @@ router.register('shared-todolists', SharedTodoListViewSet, basename='shared-todo
 
 urlpatterns = router.urls 
 urlpatterns += [
-    path('lists/<int:pk>/permission/', TodoListPermissionView.as_view()),
+    path('lists/<int:pk>/permission/', TodoListPermissionView.as_view(), name='list-permission'),
+    path('search/', ItemSearchView.as_view(), name='item-search'),
+    path('cache-stats/', ResponseCacheStatsView.as_view(), name='cache-stats'),
+    path('ws-stats/', WebSocketStatsView.as_view(), name='ws-stats'),
 ]
+
+if settings.TODO_ASYNC_VIEWS:
+    # Resolved first, so these shadow the router's routes for the same URLs.
+    from .async_views import urlpatterns as async_urlpatterns
+    urlpatterns = async_urlpatterns + urlpatterns
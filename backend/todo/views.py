@@ -1,128 +1,325 @@
 from rest_framework import viewsets, permissions, serializers, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django.contrib.auth import get_user_model
 from rest_framework.views import APIView
-from .models import TodoList, TodoItem, SharedTodoList
-from .serializers import TodoListSerializer, TodoItemSerializer, SharedTodoListSerializer
+from .models import TodoList, TodoItem, SharedTodoList, TodoItemTombstone
+from .serializers import (
+    TodoListSerializer, TodoItemSerializer, SharedTodoListSerializer, BulkItemSerializer, requested_fields,
+)
+from .pagination import UpdatedCursorPagination
+from .conditional import ConditionalGetMixin
+from .respcache import CachedResponseMixin
+from .queryplan import plan_queryset
+from . import access, bulk, respcache, search
+from .consumers import outbox_stats
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.decorators import action
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 
 
 User = get_user_model()
 
 
-class TodoListViewSet(viewsets.ModelViewSet):
+def parse_cursor(value):
+    """Accept a cursor returned by a previous delta response or an ISO timestamp."""
+    if value.isdigit():
+        return datetime.fromtimestamp(int(value) / 1_000_000, tz=dt_timezone.utc)
+    since = parse_datetime(value)
+    if since is None:
+        raise ValidationError({'since': 'Invalid cursor.'})
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, dt_timezone.utc)
+    return since
+
+
+def make_cursor(moment):
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def list_state():
+    """Aggregates behind the ETag of a user's list collection."""
+    return {'count': Count('id'), 'sequence': Sum('sequence'), 'updated': Max('updated')}
+
+
+class TodoListViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = TodoList.objects.all()
     serializer_class = TodoListSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = UpdatedCursorPagination
 
     def get_queryset(self):
         # Only owner's own lists in listing endpoints
-        return TodoList.objects.filter(owner=self.request.user)
+        queryset = TodoList.objects.filter(owner=self.request.user)
+        if self.action != 'list':
+            # Writes re-read the list after saving, so prefetching would be wasted.
+            return queryset
+        return self.plan(queryset)
+
+    def plan(self, queryset):
+        items = self.preview_items()
+        return plan_queryset(
+            queryset,
+            self.get_serializer_class(),
+            only=requested_fields(self.request),
+            prefetch_querysets={'items': items} if items is not None else None,
+        )
+
+    def preview_items(self):
+        """With ``?preview=N``, only the first N open items of each list.
+
+        Ranked per list by a window function, so a page of lists still
+        prefetches its items in one query and the payload stays bounded.
+        """
+        preview = self.request.query_params.get('preview')
+        if preview is None:
+            return None
+        if not preview.isdigit() or int(preview) < 1:
+            raise ValidationError({'preview': 'Must be a positive integer.'})
+        limit = min(int(preview), settings.TODO_LIST_PREVIEW_MAX)
+        ranked = TodoItem.objects.filter(completed=False).annotate(
+            preview_rank=Window(
+                RowNumber(),
+                partition_by=F('todo_list_id'),
+                order_by=(F('created').asc(), F('id').asc()),
+            )
+        )
+        return ranked.filter(preview_rank__lte=limit).order_by('created', 'id')
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
-    def retrieve(self, request, *args, **kwargs):
-        """Allow owner OR shared user to retrieve a list."""
-        list_id = kwargs.get('pk')
-        try:
-            # Try to get as owner
-            todo_list = TodoList.objects.get(pk=list_id, owner=request.user)
-        except TodoList.DoesNotExist:
-            # Try to get as shared user
-            try:
-                shared = SharedTodoList.objects.get(todo_list_id=list_id, user=request.user)
-                todo_list = shared.todo_list  # <- accessible if shared
-            except SharedTodoList.DoesNotExist:
-                return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
-
-        serializer = self.get_serializer(todo_list)
-        return Response(serializer.data)
+    def conditional_state(self, many):
+        if many:
+            state = TodoList.objects.filter(owner=self.request.user).aggregate(**list_state())
+            return tuple(state.values()), None
+
+        list_id = self.kwargs['pk']
+        permission = access.list_permission(self.request, list_id)
+        if permission not in access.CAN_VIEW:
+            return None
+        row = TodoList.objects.filter(pk=list_id).values_list('updated', 'sequence').first()
+        if row is None:
+            return None
+        return (permission, *row), row[0]
+
+    def cache_scopes(self, many):
+        if many:
+            return [(respcache.USER, self.request.user.pk)]
+        list_id = self.kwargs['pk']
+        if access.list_permission(self.request, list_id) not in access.CAN_VIEW:
+            return None
+        return [(respcache.LIST, list_id)]
 
-
-
-class TodoItemViewSet(viewsets.ModelViewSet):
+    def get_object(self):
+        if self.action != 'retrieve':
+            return super().get_object()
+        # Allow owner OR shared user to retrieve a list.
+        list_id = self.kwargs['pk']
+        if access.list_permission(self.request, list_id) not in access.CAN_VIEW:
+            raise NotFound()
+        return self.plan(TodoList.objects.filter(pk=list_id)).get()
+
+    def get_editable_list(self, pk):
+        permission = access.list_permission(self.request, pk)
+        if permission not in access.CAN_VIEW:
+            raise NotFound()
+        if permission not in access.CAN_EDIT:
+            raise PermissionDenied("You do not have permission to edit this list.")
+        return TodoList(pk=int(pk))
+
+    @action(detail=True, methods=['post'], url_path='complete-all')
+    def complete_all(self, request, pk=None):
+        todo_list = self.get_editable_list(pk)
+        with transaction.atomic():
+            updated = bulk.complete_all(todo_list)
+        return Response({'updated': [item.pk for item in updated]})
+
+    @action(detail=True, methods=['post'], url_path='clear-completed')
+    def clear_completed(self, request, pk=None):
+        todo_list = self.get_editable_list(pk)
+        with transaction.atomic():
+            deleted = bulk.clear_completed(todo_list)
+        return Response({'deleted': deleted})
+
+
+
+class TodoItemViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = TodoItemSerializer
     queryset = TodoItem.objects.all()
+    pagination_class = UpdatedCursorPagination
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # Every read (list, detail, pages, ETags, deltas) sees only items in
+        # lists the user can access.
+        queryset = super().get_queryset().filter(todo_list__in=access.accessible_lists(self.request.user))
         list_id = self.request.query_params.get('todo_list')
         if list_id:
             queryset = queryset.filter(todo_list_id=list_id)
         return queryset
 
+    def conditional_state(self, many):
+        if many:
+            # Deletions lower the count or the id sum; edits move max(updated).
+            state = self.get_queryset().aggregate(
+                count=Count('id'), ids=Sum('id'), updated=Max('updated'),
+            )
+            return tuple(state.values()), None
+
+        pk = str(self.kwargs['pk'])
+        updated = pk.isdigit() and self.get_queryset().filter(pk=pk).values_list('updated', flat=True).first()
+        if not updated:
+            return None
+        return (updated,), updated
+
+    def list(self, request, *args, **kwargs):
+        if 'since' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        list_id = request.query_params.get('todo_list')
+        if not list_id:
+            raise ValidationError({'todo_list': 'Required when using since.'})
+        lists = access.accessible_lists(request.user).filter(pk=list_id)
+        if not lists.exists():
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return self.delta_response(lists)
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Dashboard-wide delta across every list the user can access."""
+        return self.delta_response(access.accessible_lists(request.user))
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Apply ``create``/``update``/``delete`` arrays to one list at once."""
+        serializer = BulkItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        todo_list = data['todo_list']
+        self.check_can_edit(todo_list.pk, "You do not have permission to edit this list.")
+
+        with transaction.atomic():
+            created, updated, deleted = bulk.apply(
+                todo_list,
+                create=data.get('create', []),
+                update=data.get('update', []),
+                delete=data.get('delete', []),
+            )
+        return Response({
+            'created': self.get_serializer(created, many=True).data,
+            'updated': self.get_serializer(updated, many=True).data,
+            'deleted': deleted,
+        })
+
+    def delta_response(self, lists):
+        """Items changed and ids deleted since the ``since`` cursor.
+
+        The returned cursor overlaps the request slightly so writes committed
+        while it ran are picked up next time; clients apply changes by id, so
+        repeats are harmless. A missing or expired cursor resets the client
+        with the full item set.
+        """
+        now = timezone.now()
+        since = self.request.query_params.get('since')
+        since = parse_cursor(since) if since else None
+        reset = since is None or since < now - timedelta(days=settings.TODO_TOMBSTONE_RETENTION_DAYS)
+
+        items = TodoItem.objects.filter(todo_list__in=lists)
+        deleted = []
+        if not reset:
+            items = items.filter(updated__gte=since)
+            deleted = TodoItemTombstone.objects.filter(todo_list__in=lists, deleted__gte=since)
+            deleted = list(deleted.values_list('item_id', flat=True))
+
+        cursor = now - timedelta(seconds=settings.TODO_DELTA_CURSOR_OVERLAP)
+        return Response({
+            'cursor': make_cursor(cursor),
+            'reset': reset,
+            'items': self.get_serializer(items, many=True).data,
+            'deleted': deleted,
+        })
+
+    def check_can_edit(self, list_id, message):
+        if access.list_permission(self.request, list_id) not in access.CAN_EDIT:
+            raise PermissionDenied(message)
+
     def perform_create(self, serializer):
         todo_list = serializer.validated_data.get('todo_list')
-        user = self.request.user
-
-        # Owner can create
-        if todo_list.owner == user:
-            serializer.save()
-            return
-
-        # Check if user has shared edit permission
-        shared = SharedTodoList.objects.filter(user=user, todo_list=todo_list).first()
-        if shared and shared.permission == 'edit':
-            serializer.save()
-            return
-
-        # Otherwise: reject
-        raise PermissionDenied("You do not have permission to add items to this list.")
-    
-    def update(self, request, *args, **kwargs):
-        instance = self.get_object()
-        todo_list = instance.todo_list
-        user = request.user
+        self.check_can_edit(todo_list.pk, "You do not have permission to add items to this list.")
+        serializer.save()
 
-        if todo_list.owner == user:
-            return super().update(request, *args, **kwargs)
-
-        shared = SharedTodoList.objects.filter(todo_list=todo_list, user=user).first()
-        if shared and shared.permission == 'edit':
-            return super().update(request, *args, **kwargs)
-
-        raise PermissionDenied("You do not have permission to edit this item.")
-
-    def destroy(self, request, *args, **kwargs):
-        instance = self.get_object()
-        todo_list = instance.todo_list
-        user = request.user
-
-        if todo_list.owner == user:
-            return super().destroy(request, *args, **kwargs)
-
-        shared = SharedTodoList.objects.filter(todo_list=todo_list, user=user).first()
-        if shared and shared.permission == 'edit':
-            return super().destroy(request, *args, **kwargs)
+    def perform_update(self, serializer):
+        self.check_can_edit(serializer.instance.todo_list_id, "You do not have permission to edit this item.")
+        # Moving an item needs edit rights on the destination list too.
+        todo_list = serializer.validated_data.get('todo_list')
+        if todo_list is not None:
+            self.check_can_edit(todo_list.pk, "You do not have permission to edit this item.")
+        serializer.save()
 
-        raise PermissionDenied("You do not have permission to delete this item.")
+    def perform_destroy(self, instance):
+        self.check_can_edit(instance.todo_list_id, "You do not have permission to delete this item.")
+        instance.delete()
 
 
 
-class SharedTodoListViewSet(viewsets.ModelViewSet):
+class SharedTodoListViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = SharedTodoListSerializer
     permission_classes = [IsAuthenticated]
 
+    def cache_scopes(self, many):
+        # Owners and recipients are both in a list's audience, so user scope
+        # covers every variant of the listing, ?list_id included.
+        return [(respcache.USER, self.request.user.pk)] if many else None
+
+    def conditional_state(self, many):
+        # Covers the shares, their permissions, the shared lists' contents and
+        # the names and emails of both the recipients and the owners.
+        queryset = self.get_base_queryset()
+        if not many:
+            pk = str(self.kwargs['pk'])
+            if not pk.isdigit():
+                return None
+            queryset = queryset.filter(pk=pk)
+        state = queryset.aggregate(
+            count=Count('id'),
+            ids=Sum('id'),
+            edits=Count('id', filter=Q(permission=SharedTodoList.EDIT)),
+            sequence=Sum('todo_list__sequence'),
+            updated=Max('todo_list__updated'),
+            list_id=Max('todo_list_id'),
+            users=Max('user__updated'),
+            owners=Max('todo_list__owner__updated'),
+        )
+        if not many and (
+            not state['count'] or access.list_permission(self.request, state['list_id']) != access.OWNER
+        ):
+            return None
+        return tuple(state.values()), None
+
     def get_queryset(self):
+        if self.action == 'destroy':
+            return self.get_base_queryset()
+        return plan_queryset(self.get_base_queryset(), self.get_serializer_class())
+
+    def get_base_queryset(self):
         user = self.request.user
         list_id = self.request.query_params.get('list_id')
         shared_with_me = self.request.query_params.get('shared_with_me')
 
         if list_id:
-            try:
-                todo_list = TodoList.objects.get(pk=list_id)
-            except TodoList.DoesNotExist:
-                return SharedTodoList.objects.none()
-
             # Owner is viewing all shares for a list they own
-            if todo_list.owner == user:
+            if access.list_permission(self.request, list_id) == access.OWNER:
                 return SharedTodoList.objects.filter(todo_list_id=list_id)
 
         # ✅ NEW: For dashboard - only lists shared *with* me
@@ -130,7 +327,10 @@ class SharedTodoListViewSet(viewsets.ModelViewSet):
             return SharedTodoList.objects.filter(user=user)
 
         # Default: lists I own OR shared with me
-        return SharedTodoList.objects.filter(todo_list__owner=user) | SharedTodoList.objects.filter(user=user)
+        # A subquery on owner keeps both sides of the OR on an index; filtering
+        # through the join would scan every share.
+        owned = TodoList.objects.filter(owner=user).values('pk')
+        return SharedTodoList.objects.filter(Q(todo_list__in=owned) | Q(user=user))
 
 
 
@@ -153,34 +353,19 @@ class SharedTodoListViewSet(viewsets.ModelViewSet):
         if not todo_list_id:
             raise serializers.ValidationError("Todo list ID is required.")
 
+        if access.list_permission(self.request, todo_list_id) != access.OWNER:
+            raise PermissionDenied("Only the list owner can share it.")
+
         # ✅ Prevent duplicate share
         if SharedTodoList.objects.filter(user=shared_user, todo_list_id=todo_list_id).exists():
             raise serializers.ValidationError("This user already has access to the list.")
 
         serializer.save(user=shared_user, todo_list_id=todo_list_id)
 
-    def update(self, request, *args, **kwargs):
-        instance = self.get_object()
-
-        # ✅ Only list owner can update share
-        if instance.todo_list.owner != request.user:
-            return Response({'detail': 'Permission denied.'}, status=status.HTTP_403_FORBIDDEN)
-
-        return super().update(request, *args, **kwargs)
-
-    def destroy(self, request, *args, **kwargs):
-        instance = self.get_object()
-
-        # ✅ Only list owner can unshare
-        if instance.todo_list.owner != request.user:
-            return Response({'detail': 'Permission denied.'}, status=status.HTTP_403_FORBIDDEN)
-
-        return super().destroy(request, *args, **kwargs)
-    
     def get_object(self):
         obj = super().get_object()
         # Ensure only the owner of the list can update/delete
-        if obj.todo_list.owner != self.request.user:
+        if access.list_permission(self.request, obj.todo_list_id) != access.OWNER:
             raise PermissionDenied("You do not have permission to modify this sharing.")
         return obj
 
@@ -191,22 +376,56 @@ class TodoListPermissionView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
-        try:
-            todo_list = TodoList.objects.get(pk=pk)
-        except TodoList.DoesNotExist:
-            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return respcache.cached(request, [(respcache.LIST, pk)], lambda: self.describe(request, pk))
+
+    def describe(self, request, pk):
+        permission = access.list_permission(request, pk)
 
-        if todo_list.owner == request.user:
+        if permission == access.OWNER:
             return Response({
                 'permission': 'edit',
                 'is_owner': True
             })
 
-        shared = SharedTodoList.objects.filter(user=request.user, todo_list=todo_list).first()
-        if shared:
+        if permission != access.NONE:
             return Response({
-                'permission': shared.permission,
+                'permission': permission,
                 'is_owner': False
             })
 
+        if not TodoList.objects.filter(pk=pk).exists():
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
         return Response({'detail': 'Not authorized.'}, status=status.HTTP_403_FORBIDDEN)
+
+
+class ItemSearchView(APIView):
+    """Items in any list the user owns or has been shared whose body matches ``q``.
+
+    Most recently changed first, at most TODO_SEARCH_LIMIT of them; the
+    visibility filter and the text match run as one query.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        if not search.words(query):
+            raise ValidationError({'q': 'Enter at least one word to search for.'})
+        items = search.filter_items(access.accessible_lists(request.user), query)
+        items = items.order_by('-updated', '-id')[:settings.TODO_SEARCH_LIMIT]
+        return Response(TodoItemSerializer(items, many=True).data)
+
+
+class ResponseCacheStatsView(APIView):
+    """Hit/miss/invalidation/eviction counters for sizing the response cache."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(respcache.stats())
+
+
+class WebSocketStatsView(APIView):
+    """Outbound queue depths of this process's sockets, to spot slow clients."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(outbox_stats())
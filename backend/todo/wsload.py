@@ -0,0 +1,175 @@
+"""In-process WebSocket load generator for TodoConsumer and the channel layer.
+
+Opens ``clients`` sockets spread across ``lists`` lists through
+``WebsocketCommunicator`` and publishes synthetic item events to the list
+groups at a fixed rate, the same way the model signals do. Each event
+carries its send time, so receivers can measure end-to-end fan-out latency
+through the channel layer, the consumer and its batching.
+"""
+import asyncio
+import gc
+import json
+import os
+import resource
+import statistics
+import time
+import tracemalloc
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from . import broadcast
+from .routing import websocket_urlpatterns
+
+
+def summarize(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 3)
+
+    return {
+        "count": len(ordered),
+        "p50": round(statistics.median(ordered), 3),
+        "p95": pct(95),
+        "p99": pct(99),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def rss():
+    """Resident memory of this process in bytes (peak RSS where /proc is missing)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def open_sockets(user, list_ids, clients):
+    application = URLRouter(websocket_urlpatterns)
+    sockets, connect_ms = [], []
+    for n in range(clients):
+        list_id = list_ids[n % len(list_ids)]
+        communicator = WebsocketCommunicator(application, f"/ws/todo/{list_id}/")
+        communicator.scope["user"] = user
+        started = time.perf_counter()
+        connected, _ = await communicator.connect()
+        connect_ms.append((time.perf_counter() - started) * 1000)
+        if not connected:
+            raise RuntimeError(f"Socket {n} for list {list_id} was rejected")
+        sockets.append((list_id, communicator))
+    return sockets, connect_ms
+
+
+async def drain(communicator, latencies):
+    # Read the output queue directly: receive_from() cancels the consumer
+    # when it times out.
+    while True:
+        message = await communicator.output_queue.get()
+        now = time.perf_counter()
+        if message["type"] != "websocket.send":
+            continue
+        frame = json.loads(message["text"])
+        events = frame["events"] if frame["type"] == "batch" else [frame]
+        for event in events:
+            if "todo" not in event:
+                # e.g. a "resync" marker under the resync overflow policy.
+                continue
+            latencies.append((now - event["todo"]["sent"]) * 1000)
+        if events and "seq" in events[-1]:
+            # As a real client does, so the socket's send window moves on.
+            await communicator.send_json_to({"type": "ack", "seq": events[-1]["seq"]})
+
+
+async def drive(list_ids, rate, duration):
+    channel_layer = get_channel_layer()
+    interval = 1 / rate
+    seqs = dict.fromkeys(list_ids, 0)
+    sent = 0
+    deadline = time.perf_counter() + duration
+    next_send = time.perf_counter()
+    while time.perf_counter() < deadline:
+        list_id = list_ids[sent % len(list_ids)]
+        seqs[list_id] += 1
+        payload = {"type": "todo_updated", "todo": {"id": sent, "body": "load", "sent": time.perf_counter()}}
+        message = broadcast.event_message(sent, seqs[list_id], payload)
+        await channel_layer.group_send(broadcast.group_name(list_id), {"type": "todo.event", "list_id": list_id, **message})
+        sent += 1
+        next_send += interval
+        await asyncio.sleep(max(0, next_send - time.perf_counter()))
+    return seqs
+
+
+async def run(user, list_ids, clients=100, rate=100, duration=5.0, grace=1.0):
+    """Run one load scenario and return its report."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sockets, connect_ms = await open_sockets(user, list_ids, clients)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    latencies = []
+    drains = [asyncio.create_task(drain(communicator, latencies)) for _, communicator in sockets]
+    started = time.perf_counter()
+    sent_per_list = await drive(list_ids, rate, duration)
+    elapsed = time.perf_counter() - started
+
+    expected = sum(sent_per_list[list_id] for list_id, _ in sockets)
+    deadline = time.perf_counter() + grace
+    while len(latencies) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+    for task in drains:
+        task.cancel()
+    for _, communicator in sockets:
+        await communicator.disconnect()
+
+    return {
+        "clients": clients,
+        "lists": len(list_ids),
+        "events_sent": sum(sent_per_list.values()),
+        "events_expected": expected,
+        "events_received": len(latencies),
+        "messages_per_sec": round(len(latencies) / elapsed, 1),
+        "connect_ms": summarize(connect_ms),
+        "latency_ms": summarize(latencies),
+        "bytes_per_connection": allocated // max(clients, 1),
+    }
+
+
+async def idle(user, list_ids, clients=1000, trace=False):
+    """Open ``clients`` idle sockets and report the memory each one holds.
+
+    RSS includes the test transport (``WebsocketCommunicator`` queues and
+    tasks) on top of the consumer itself; ``trace`` adds a tracemalloc
+    breakdown by file, which tells the two apart but slows connects down.
+    """
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+        before_trace = tracemalloc.take_snapshot()
+    before = rss()
+    sockets, connect_ms = await open_sockets(user, list_ids, clients)
+    gc.collect()
+    after = rss()
+
+    report = {
+        "clients": clients,
+        "lists": len(list_ids),
+        "connect_ms": summarize(connect_ms),
+        "rss_bytes": after - before,
+        "rss_per_connection": (after - before) // max(clients, 1),
+    }
+    if trace:
+        stats = tracemalloc.take_snapshot().compare_to(before_trace, "filename")
+        tracemalloc.stop()
+        report["traced_per_connection"] = {
+            "/".join(stat.traceback[0].filename.split(os.sep)[-2:]): stat.size_diff // max(clients, 1)
+            for stat in stats[:10]
+        }
+    for _, communicator in sockets:
+        await communicator.disconnect()
+    return report
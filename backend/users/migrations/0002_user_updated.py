@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 23:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="updated",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
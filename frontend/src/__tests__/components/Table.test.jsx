@@ -33,23 +33,6 @@ const mockTodos = [
   },
 ];
 
-class MockWebSocket {
-    constructor(url) {
-      this.url = url;
-      this.readyState = MockWebSocket.OPEN;
-      this.send = vi.fn();
-      this.close = vi.fn();
-    }
-  
-    static OPEN = 1;
-  
-    addEventListener() {}
-    removeEventListener() {}
-  }
-  
-  global.WebSocket = MockWebSocket;
-  
-
 describe('Table component', () => {
   beforeEach(() => {
     useSelector.mockImplementation((selector) =>
@@ -79,9 +62,8 @@ describe('Table component', () => {
     expect(screen.getByText('Completed')).toBeInTheDocument();
   });
 
-  test('deletes a todo and sends websocket message', async () => {
+  test('deletes a todo', async () => {
     const setTodosMock = vi.fn();
-    const socket = new MockWebSocket('ws://localhost:8000/ws/todo/1/');
   
     axios.delete.mockResolvedValue({});
   
@@ -91,7 +73,6 @@ describe('Table component', () => {
         isLoading={false}
         setTodos={setTodosMock}
         permission="edit"
-        socket={socket}
       />
     );
   
@@ -104,19 +85,12 @@ describe('Table component', () => {
         expect.any(Object)
       );
       expect(setTodosMock).toHaveBeenCalled();
-      expect(socket.send).toHaveBeenCalledWith(
-        JSON.stringify({
-          type: 'todo_deleted',
-          todo_id: 1,
-        })
-      );
     });
   });
   
 
-  test('edits a todo and sends websocket message', async () => {
+  test('edits a todo', async () => {
     const setTodosMock = vi.fn();
-    const socket = new MockWebSocket('ws://localhost:8000/ws/todo/1/');
     const updatedTodo = { ...mockTodos[0], body: 'Updated Todo' };
   
     axios.patch.mockResolvedValue({ data: updatedTodo });
@@ -127,7 +101,6 @@ describe('Table component', () => {
         isLoading={false}
         setTodos={setTodosMock}
         permission="edit"
-        socket={socket}
       />
     );
   
@@ -147,19 +120,12 @@ describe('Table component', () => {
         expect.any(Object)
       );
       expect(setTodosMock).toHaveBeenCalled();
-      expect(socket.send).toHaveBeenCalledWith(
-        JSON.stringify({
-          type: 'todo_updated',
-          todo: updatedTodo,
-        })
-      );
     });
   });
   
 
-  test('toggles checkbox and sends websocket message', async () => {
+  test('toggles checkbox', async () => {
     const setTodosMock = vi.fn();
-    const socket = new MockWebSocket('ws://localhost:8000/ws/todo/1/');
     const updatedTodo = { ...mockTodos[0], completed: true };
   
     axios.patch.mockResolvedValue({ data: updatedTodo });
@@ -170,7 +136,6 @@ describe('Table component', () => {
         isLoading={false}
         setTodos={setTodosMock}
         permission="edit"
-        socket={socket}
       />
     );
   
@@ -184,12 +149,6 @@ describe('Table component', () => {
         expect.any(Object)
       );
       expect(setTodosMock).toHaveBeenCalled();
-      expect(socket.send).toHaveBeenCalledWith(
-        JSON.stringify({
-          type: 'todo_updated',
-          todo: updatedTodo,
-        })
-      );
     });
   });
   
@@ -82,69 +82,6 @@ describe('TodoForm component', () => {
     expect(screen.getByPlaceholderText(/add a new task/i).value).toBe('');
   });
 
-  test('sends WebSocket message when socket is open', async () => {
-    const mockSend = vi.fn();
-    const mockSocket = {
-      readyState: WebSocket.OPEN,
-      send: mockSend,
-    };
-
-    const newTodo = {
-      id: 1,
-      body: 'WebSocket Task',
-      completed: false,
-      created: new Date().toISOString(),
-    };
-
-    axios.post.mockResolvedValue({ data: newTodo });
-
-    render(<TodoForm listId={listId} socket={mockSocket} />);
-
-    const input = screen.getByPlaceholderText(/add a new task/i);
-    fireEvent.change(input, { target: { value: 'WebSocket Task' } });
-
-    const addButton = screen.getByRole('button', { name: /add/i });
-    fireEvent.click(addButton);
-
-    await waitFor(() => {
-      expect(mockSend).toHaveBeenCalledWith(
-        JSON.stringify({
-          type: 'todo_created',
-          todo: newTodo,
-        })
-      );
-    });
-  });
-
-  test('does not send WebSocket if socket is not open', async () => {
-    const mockSend = vi.fn();
-    const mockSocket = {
-      readyState: WebSocket.CLOSED,
-      send: mockSend,
-    };
-
-    const newTodo = {
-      id: 1,
-      body: 'WebSocket Closed',
-      completed: false,
-      created: new Date().toISOString(),
-    };
-
-    axios.post.mockResolvedValue({ data: newTodo });
-
-    render(<TodoForm listId={listId} socket={mockSocket} />);
-
-    const input = screen.getByPlaceholderText(/add a new task/i);
-    fireEvent.change(input, { target: { value: 'WebSocket Closed' } });
-
-    const addButton = screen.getByRole('button', { name: /add/i });
-    fireEvent.click(addButton);
-
-    await waitFor(() => {
-      expect(mockSend).not.toHaveBeenCalled();
-    });
-  });
-
   test('submits on Enter key press', async () => {
     const newTodo = {
       id: 1,
@@ -1,4 +1,4 @@
-import { render, screen, waitFor, fireEvent } from '@testing-library/react';
+import { render, screen, waitFor, fireEvent, act } from '@testing-library/react';
 import { BrowserRouter, MemoryRouter, Route, Routes } from 'react-router-dom';
 import { Provider } from 'react-redux';
 import { vi } from 'vitest';
@@ -14,7 +14,11 @@ default: () => <div data-testid="todo-form">MockTodoForm</div>,
 }));
 
 vi.mock('../../components/Table', () => ({
-default: () => <div data-testid="todo-table">MockTable</div>,
+default: ({ todos }) => (
+  <div data-testid="todo-table">
+    {todos.map(todo => <span key={todo.id}>{todo.body}</span>)}
+  </div>
+),
 }));
 
 vi.mock('../../components/ShareListModal', () => ({
@@ -27,17 +31,25 @@ default: () => <div data-testid="shared-section">MockSharedWithSection</div>,
   
 // WebSocket mock
 class MockWebSocket {
+  static instances = [];
   constructor(url) {
     this.url = url;
+    this.sent = [];
+    MockWebSocket.instances.push(this);
     this.onopen = () => {};
     this.onmessage = () => {};
     this.onerror = () => {};
     this.onclose = () => {};
     setTimeout(() => this.onopen(), 10);
   }
-  send() {}
-  close() {
-    this.onclose({ reason: 'Closed by test' });
+  send(data) {
+    this.sent.push(data);
+  }
+  close(code) {
+    this.onclose({ code, reason: 'Closed by test' });
+  }
+  receive(message) {
+    act(() => this.onmessage({ data: JSON.stringify(message) }));
   }
 }
 global.WebSocket = MockWebSocket;
@@ -193,4 +205,94 @@ describe('TodoListPage', () => {
       expect(screen.getByTestId('share-modal')).toBeInTheDocument();
     });
   });
+
+  describe('live updates', () => {
+    const latestSocket = () => MockWebSocket.instances[MockWebSocket.instances.length - 1];
+
+    const mockLoad = (todos = [{ id: 1, body: 'Loaded' }]) => {
+      axiosInstance.get.mockImplementation((url) => Promise.resolve({
+        data: url.startsWith('items/') ? todos
+          : url.endsWith('permission/') ? { permission: 'edit', is_owner: false }
+          : { id: 1, title: 'Live', sequence: 7 },
+      }));
+    };
+
+    const renderConnected = async () => {
+      renderWithProviders(<TodoListPage />, store);
+      await waitFor(() => expect(MockWebSocket.instances).toHaveLength(1));
+      return latestSocket();
+    };
+
+    beforeEach(() => {
+      MockWebSocket.instances = [];
+      mockLoad();
+    });
+
+    afterEach(() => {
+      axiosInstance.get.mockReset();
+    });
+
+    it('reads the list sequence before fetching items', async () => {
+      let resolveList;
+      axiosInstance.get.mockImplementationOnce(() => new Promise((resolve) => { resolveList = resolve; }));
+
+      renderWithProviders(<TodoListPage />, store);
+
+      expect(axiosInstance.get).toHaveBeenCalledTimes(1);
+      expect(axiosInstance.get.mock.calls[0][0]).toBe('lists/1/?fields=id,title,sequence');
+      resolveList({ data: { id: 1, title: 'Live', sequence: 7 } });
+      await waitFor(() => expect(axiosInstance.get).toHaveBeenCalledTimes(3));
+    });
+
+    it('reconnects from the last sequence applied', async () => {
+      const socket = await renderConnected();
+      expect(socket.url).toContain('since=7');
+
+      socket.receive({ type: 'todo_created', seq: 8, todo: { id: 2, body: 'Pushed' } });
+      expect(screen.getByText('Pushed')).toBeInTheDocument();
+      expect(socket.sent.map(JSON.parse)).toEqual([{ type: 'ack', seq: 8 }]);
+
+      act(() => socket.close(1006));
+      await waitFor(() => expect(MockWebSocket.instances).toHaveLength(2), { timeout: 2000 });
+      expect(latestSocket().url).toContain('since=8');
+    });
+
+    it('replaces the items with a snapshot', async () => {
+      const socket = await renderConnected();
+      await waitFor(() => expect(screen.getByText('Loaded')).toBeInTheDocument());
+
+      socket.receive({ type: 'snapshot', seq: 12, todos: [{ id: 3, body: 'From snapshot' }] });
+
+      expect(screen.getByText('From snapshot')).toBeInTheDocument();
+      expect(screen.queryByText('Loaded')).not.toBeInTheDocument();
+    });
+
+    it('reconnects on resync to replay what was dropped', async () => {
+      const socket = await renderConnected();
+      socket.receive({ type: 'todo_deleted', seq: 9, todo_id: 1 });
+
+      socket.receive({ type: 'resync' });
+
+      await waitFor(() => expect(MockWebSocket.instances).toHaveLength(2), { timeout: 2000 });
+      expect(latestSocket().url).toContain('since=9');
+    });
+
+    it('answers pings with a pong', async () => {
+      const socket = await renderConnected();
+
+      socket.receive({ type: 'ping' });
+
+      expect(socket.sent.map(JSON.parse)).toEqual([{ type: 'pong' }]);
+    });
+
+    it('stops reconnecting once access is revoked', async () => {
+      const socket = await renderConnected();
+
+      act(() => socket.close(4403));
+
+      expect(screen.getByText(/no longer have access/i)).toBeInTheDocument();
+      await new Promise((resolve) => setTimeout(resolve, 1100));
+      expect(MockWebSocket.instances).toHaveLength(1);
+    });
+  });
 });
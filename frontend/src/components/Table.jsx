@@ -8,7 +8,7 @@ import {
 } from 'react-icons/md';
 import { useSelector } from 'react-redux';
 
-const Table = ({ todos, isLoading, setTodos, permission = 'edit', socket }) => {
+const Table = ({ todos, isLoading, setTodos, permission = 'edit' }) => {
   const { user } = useSelector((state) => state.auth);
   const config = {
     headers: {
@@ -23,15 +23,6 @@ const Table = ({ todos, isLoading, setTodos, permission = 'edit', socket }) => {
       await axios.delete(`/items/${id}/`, config);
       const newList = todos.filter((todo) => todo.id !== id);
       setTodos(newList);
-
-      if (socket && socket.readyState === WebSocket.OPEN) {
-        socket.send(
-          JSON.stringify({
-            type: "todo_deleted",
-            todo_id: id,
-          })
-        );
-      }
     } catch (error) {}
   };
 
@@ -43,16 +34,6 @@ const Table = ({ todos, isLoading, setTodos, permission = 'edit', socket }) => {
         todo.id === id ? response.data : todo
       );
       setTodos(newTodos);
-
-      // 🔁 Send WebSocket message
-      if (socket && socket.readyState === WebSocket.OPEN) {
-        socket.send(
-          JSON.stringify({
-            type: "todo_updated",
-            todo: response.data,
-          })
-        );
-      }
     } catch (error) {}
   };
 
@@ -3,7 +3,7 @@ import { useState } from "react";
 import axios from '../axiosConfig';
 import { useSelector } from "react-redux";
 
-const TodoForm = ({ listId, socket }) => {
+const TodoForm = ({ listId }) => {
   const { user } = useSelector((state) => state.auth);
   const [body, setBody] = useState("");
 
@@ -18,22 +18,14 @@ const TodoForm = ({ listId, socket }) => {
         },
       };
   
-      const response = await axios.post(
+      // The server broadcasts the new item to every socket on the list.
+      await axios.post(
         "/items/",
         { body, todo_list: listId },
         config
       );      
   
       setBody(""); 
-  
-      if (socket && socket.readyState === WebSocket.OPEN) {
-        socket.send(
-          JSON.stringify({
-            type: "todo_created",
-            todo: response.data,
-          })
-        );
-      }
     } catch (error) {}
   };  
 
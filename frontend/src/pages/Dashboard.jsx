@@ -20,7 +20,11 @@ const DashboardPage = () => {
 
     const fetchLists = async () => {
       try {
-        const res = await axios.get('/lists/', config);
+        // Cards only need the counters, not every item of every list.
+        const res = await axios.get('/lists/', {
+          ...config,
+          params: { fields: 'id,title,item_count,completed_count' },
+        });
         setLists(res.data);
       } catch (error) {}
     };
@@ -81,7 +85,14 @@ const DashboardPage = () => {
                 className="card bg-base-100 shadow-md hover:shadow-xl transition duration-200 cursor-pointer relative group"
               >
                 <div className="card-body flex flex-row items-center justify-between">
-                  <h2 className="card-title truncate">{list.title || 'Untitled List'}</h2>
+                  <div className="min-w-0">
+                    <h2 className="card-title truncate">{list.title || 'Untitled List'}</h2>
+                    {list.item_count > 0 && (
+                      <p className="text-sm opacity-70">
+                        {list.completed_count}/{list.item_count} done
+                      </p>
+                    )}
+                  </div>
 
                   <button
                     className="text-red-500 hover:text-red-700 z-10"
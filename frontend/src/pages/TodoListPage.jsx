@@ -21,10 +21,12 @@ const TodoListPage = () => {
   const [error, setError] = useState(null);
   const [showShare, setShowShare] = useState(false);
   const [shareRefreshTrigger, setShareRefreshTrigger] = useState(0);
-  const [socket, setSocket] = useState(null);
 
   useEffect(() => {
     if (!user || !id) return;
+
+    let closed = false;
+    let currentSocket = null;
   
     const config = {
       headers: { Authorization: `Bearer ${user.access}` },
@@ -32,8 +34,11 @@ const TodoListPage = () => {
   
     const fetchListAndSetupWebSocket = async () => {
       try {
-        const [listRes, todosRes, permRes] = await Promise.all([
-          axiosInstance.get(`lists/${id}/`, config),
+        // Read the sequence before the items: anything committed in between
+        // is then replayed on connect rather than lost. Items come from the
+        // items endpoint, so skip the nested copy.
+        const listRes = await axiosInstance.get(`lists/${id}/?fields=id,title,sequence`, config);
+        const [todosRes, permRes] = await Promise.all([
           axiosInstance.get(`items/?todo_list=${id}`, config),
           axiosInstance.get(`lists/${id}/permission/`, config),
         ]);
@@ -50,15 +55,15 @@ const TodoListPage = () => {
         const wsProtocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
         const backendHost = import.meta.env.VITE_BACKEND_WS_URL || 'localhost:8000';
         const socketUrl = `${wsProtocol}://${backendHost}/ws/todo/${id}/?token=${user.access}`;
-        const socketInstance = new WebSocket(socketUrl);
-  
-        socketInstance.onopen = () => {
-          console.log('WebSocket connected ✅');
-        };
-  
-        socketInstance.onmessage = (e) => {
-          const data = JSON.parse(e.data);
-          
+
+        // Every broadcast carries the list's change sequence; reconnecting with
+        // the last one applied replays only what was missed.
+        let lastSeq = listRes.data.sequence || 0;
+        let retryDelay = 1000;
+
+        const applyEvent = (data) => {
+          if (data.seq) lastSeq = Math.max(lastSeq, data.seq);
+
           switch (data.type) {
             case 'todo_created':
               setTodos((prev) => {
@@ -68,31 +73,80 @@ const TodoListPage = () => {
               break;
 
             case 'todo_updated':
-              setTodos((prev) =>
-                prev.map((todo) => (todo.id === data.todo.id ? data.todo : todo))
-              );
+              // A batch may collapse a creation and later edits into one update.
+              setTodos((prev) => {
+                const exists = prev.some(todo => todo.id === data.todo.id);
+                return exists
+                  ? prev.map((todo) => (todo.id === data.todo.id ? data.todo : todo))
+                  : [...prev, data.todo];
+              });
               break;
             case 'todo_deleted':
               setTodos((prev) => prev.filter((todo) => todo.id !== data.todo_id));
               break;
+            case 'batch':
+              data.events.forEach(applyEvent);
+              break;
+            case 'snapshot':
+              lastSeq = data.seq;
+              setTodos(data.todos);
+              break;
+            case 'permission':
+              // The owner changed this user's share while the list was open.
+              setPermission(data.permission);
+              break;
+            case 'ping':
+              // Unanswered pings get the socket closed as idle.
+              currentSocket?.send(JSON.stringify({ type: 'pong' }));
+              break;
+            case 'resync':
+              // The server dropped events this client was too slow for;
+              // reconnecting resumes from the last sequence applied.
+              currentSocket?.close();
+              break;
             default:
               console.warn('Unknown message type:');
           }
         };
+
+        const connect = () => {
+          if (closed) return;
+          const socketInstance = new WebSocket(`${socketUrl}&since=${lastSeq}`);
+
+          socketInstance.onopen = () => {
+            console.log('WebSocket connected ✅');
+            retryDelay = 1000;
+          };
+
+          socketInstance.onmessage = (e) => {
+            const data = JSON.parse(e.data);
+            applyEvent(data);
+            // The server stops sending once too many frames go unacknowledged.
+            if (data.seq !== undefined || data.type === 'batch') {
+              socketInstance.send(JSON.stringify({ type: 'ack', seq: lastSeq }));
+            }
+          };
   
-        socketInstance.onerror = (e) => {
-          console.error('WebSocket error:');
-        };
-  
-        socketInstance.onclose = (e) => {
-          console.log('WebSocket closed:');
-        };
+          socketInstance.onerror = (e) => {
+            console.error('WebSocket error:');
+          };
   
-        setSocket(socketInstance);
+          socketInstance.onclose = (e) => {
+            console.log('WebSocket closed:');
+            if (closed) return;
+            if (e.code === 4403) {
+              // Access was revoked; reconnecting would be rejected.
+              setError('You no longer have access to this list.');
+              return;
+            }
+            setTimeout(connect, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, 30000);
+          };
   
-        return () => {
-          socketInstance.close();
+          currentSocket = socketInstance;
         };
+
+        connect();
   
       } catch (err) {
         
@@ -106,6 +160,11 @@ const TodoListPage = () => {
     };
   
     fetchListAndSetupWebSocket();
+
+    return () => {
+      closed = true;
+      if (currentSocket) currentSocket.close();
+    };
   }, [id, user]);
   
 
@@ -169,7 +228,7 @@ const TodoListPage = () => {
       )}
 
       {/* Todo Creation Form */}
-      {permission !== 'view' && <TodoForm listId={id} setTodos={setTodos} socket={socket} />}
+      {permission !== 'view' && <TodoForm listId={id} setTodos={setTodos} />}
 
       {/* Todos Display */}
       {error ? (
@@ -181,7 +240,7 @@ const TodoListPage = () => {
           No todos yet. Add one using the form above.
         </div>
       ) : (
-        <Table todos={todos} setTodos={setTodos} permission={permission} socket={socket} />   
+        <Table todos={todos} setTodos={setTodos} permission={permission} />   
       )}
 
       {/* Shared With Section */}